@@ -6,6 +6,9 @@ from django.db.models import Q
 
 from core.decorator import ModuloRequeridoMixin
 from core.utils import get_licenca_db_config, get_ncm_master_db
+from core.resolucao_banco import banco_da_requisicao, banco_ncm
+from core.replicas import LeituraReplicaMixin
+from core.instrumentacao import InstrumentacaoMixin
 
 from CFOP.models import NcmFiscalPadrao
 from Produtos.models import Ncm
@@ -15,19 +18,22 @@ from Licencas.models import Filiais
 from ..serializers.ncm_fiscal_padrao_serializer import NcmFiscalPadraoSerializer
 
 
-class NcmFiscalPadraoViewSet(ModuloRequeridoMixin, viewsets.ModelViewSet):
+class NcmFiscalPadraoViewSet(InstrumentacaoMixin, LeituraReplicaMixin, ModuloRequeridoMixin, viewsets.ModelViewSet):
     modulo_necessario = "Produtos"
     serializer_class = NcmFiscalPadraoSerializer
     permission_classes = [IsAuthenticated]
 
     def _get_banco(self):
-        return get_licenca_db_config(self.request)
+        return banco_da_requisicao(self.request, get_licenca_db_config)
+
+    def _banco_primario(self):
+        return self._get_banco()
 
     def _get_ncm_db(self):
-        return get_ncm_master_db(self._get_banco())
+        return banco_ncm(self._get_banco(), get_ncm_master_db)
 
     def get_queryset(self):
-        banco = self._get_banco()
+        banco = self.get_banco_leitura()
         return NcmFiscalPadrao.objects.using(banco).all().order_by("ncm_id")
 
     def _build_ncm_map(self, itens):
@@ -139,7 +145,7 @@ class NcmFiscalPadraoViewSet(ModuloRequeridoMixin, viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"], url_path="buscacsts")
     def csts(self, request, *args, **kwargs):
-        banco = self._get_banco()
+        banco = self.get_banco_leitura()
         empresa_id = (
             request.query_params.get("empresa")
             or request.headers.get("X-Empresa")
@@ -0,0 +1,148 @@
+"""
+Download binário dos anexos da OS, em streaming e com suporte a Range.
+
+O conteúdo é lido do banco em fatias (`substring(col FROM x FOR n)`), então o
+arquivo nunca fica inteiro na memória do servidor. Tamanho e ETag (md5) são
+calculados pelo próprio Postgres, sem trafegar o conteúdo.
+"""
+import re
+
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+
+from ..models import Osarquivos
+
+TAMANHO_FATIA = 256 * 1024
+
+ASSINATURAS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'%PDF', 'application/pdf', '.pdf'),
+    (b'GIF8', 'image/gif', '.gif'),
+    (b'PK\x03\x04', 'application/zip', '.zip'),
+)
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CAMPOS_CHAVE = ('arqu_empr', 'arqu_fili', 'arqu_os', 'arqu_codi_arqu')
+
+
+def campo_conteudo():
+    """Campo binário do Osarquivos (único BinaryField do modelo)."""
+    for field in Osarquivos._meta.concrete_fields:
+        if field.get_internal_type() == 'BinaryField':
+            return field
+    raise LookupError("Osarquivos não possui campo binário.")
+
+
+def _where(connection, obj):
+    q = connection.ops.quote_name
+    meta = Osarquivos._meta
+    where = ' AND '.join(f"{q(meta.get_field(c).column)} = %s" for c in CAMPOS_CHAVE)
+    return where, [getattr(obj, c) for c in CAMPOS_CHAVE]
+
+
+def metadados(banco, obj):
+    """(tamanho, md5, primeiros bytes) do conteúdo, ou None se vazio."""
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    coluna = q(campo_conteudo().column)
+    where, params = _where(connection, obj)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT octet_length({coluna}), md5({coluna}), substring({coluna} FROM 1 FOR 16) "
+            f"FROM {q(Osarquivos._meta.db_table)} WHERE {where}",
+            params,
+        )
+        row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    return row[0], row[1], bytes(row[2] or b'')
+
+
+def tipo_conteudo(cabecalho):
+    for assinatura, mime, extensao in ASSINATURAS:
+        if cabecalho.startswith(assinatura):
+            return mime, extensao
+    if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return 'application/octet-stream', ''
+
+
+def iterar_fatias(banco, obj, inicio, fim):
+    """Gera o conteúdo entre os offsets `inicio` e `fim` (inclusivos)."""
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    coluna = q(campo_conteudo().column)
+    where, params = _where(connection, obj)
+    sql = f"SELECT substring({coluna} FROM %s FOR %s) FROM {q(Osarquivos._meta.db_table)} WHERE {where}"
+    posicao = inicio
+    while posicao <= fim:
+        n = min(TAMANHO_FATIA, fim - posicao + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [posicao + 1, n] + params)
+            row = cursor.fetchone()
+        fatia = bytes(row[0]) if row and row[0] is not None else b''
+        if not fatia:
+            return
+        yield fatia
+        posicao += len(fatia)
+
+
+def _intervalo(header, tamanho):
+    """Converte um cabeçalho Range de intervalo único em (inicio, fim); None = ignorar, False = inválido."""
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None
+    ini, fim = m.groups()
+    if ini == '' and fim == '':
+        return None
+    if ini == '':
+        sufixo = int(fim)
+        if sufixo == 0:
+            return False
+        return max(0, tamanho - sufixo), tamanho - 1
+    ini = int(ini)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if ini >= tamanho or ini > fim:
+        return False
+    return ini, fim
+
+
+def resposta_download(request, banco, obj):
+    info = metadados(banco, obj)
+    if info is None:
+        return HttpResponse(status=204)
+    tamanho, md5, cabecalho = info
+    etag = f'"{md5}"'
+    mime, extensao = tipo_conteudo(cabecalho)
+
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        resposta = HttpResponse(status=304)
+        resposta['ETag'] = etag
+        return resposta
+
+    inicio, fim, status = 0, tamanho - 1, 200
+    header_range = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if header_range and (not if_range or if_range == etag):
+        intervalo = _intervalo(header_range, tamanho)
+        if intervalo is False:
+            resposta = HttpResponse(status=416)
+            resposta['Content-Range'] = f"bytes */{tamanho}"
+            return resposta
+        if intervalo:
+            inicio, fim = intervalo
+            status = 206
+
+    resposta = StreamingHttpResponse(
+        iterar_fatias(banco, obj, inicio, fim), status=status, content_type=mime
+    )
+    resposta['Content-Length'] = str(fim - inicio + 1)
+    resposta['Accept-Ranges'] = 'bytes'
+    resposta['ETag'] = etag
+    resposta['Cache-Control'] = 'private, max-age=86400'
+    resposta['Content-Disposition'] = f'inline; filename="os_{obj.arqu_os}_{obj.arqu_codi_arqu}{extensao}"'
+    if status == 206:
+        resposta['Content-Range'] = f"bytes {inicio}-{fim}/{tamanho}"
+    return resposta
@@ -0,0 +1,138 @@
+"""
+Massa de dados sintética para o benchmark das rotas de OS (`benchmark_os`).
+
+Tudo é gravado numa empresa reservada (padrão 9999), para ser removido no fim
+sem tocar nos dados reais. Uma fração das ordens recebe datas fora de faixa
+(anos 0001 e 20225), gravadas por SQL direto porque o ORM não aceita esses
+valores — são elas que a blindagem do `.extra()`/colunas *_safe existe para
+tratar.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from Entidades.models import Entidades
+
+from ..models import Ordemservico, Ordemservicopecas, Ordemservicoservicos, Osarquivos, OrdemServicoFaseSetor
+from .arquivo_download import campo_conteudo
+from .datas_saneadas import STATUS_LISTAVEIS
+
+SETOR_BASE = 9900
+PALAVRAS = ('motor', 'bomba', 'correia', 'rolamento', 'vazamento', 'ruído', 'revisão', 'filtro')
+NOMES = ('Silva', 'Souza', 'Oliveira', 'Pereira', 'Costa', 'Almeida', 'Ferreira', 'Rodrigues')
+PNG_1PX = (
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89'
+    b'\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82'
+)
+
+
+def setores(n):
+    return [SETOR_BASE + i for i in range(1, n + 1)]
+
+
+def popular(banco, empresa, filial, ordens=2000, itens=5, clientes=200, n_setores=6,
+            arquivos_a_cada=10, invalidas=0.05, semente=42):
+    """
+    Grava a massa e devolve {'ordens': [números], 'clientes': [nomes], 'setores': [códigos],
+    'setores_criados': [códigos]}. Setores que já existiam são usados, mas não
+    entram em 'setores_criados', a lista que o `limpar` remove.
+    """
+    rnd = random.Random(semente)
+    cods_setor = setores(n_setores)
+    hoje = timezone.localdate()
+
+    with transaction.atomic(using=banco):
+        setores_qs = OrdemServicoFaseSetor.objects.using(banco)
+        existentes = set(setores_qs.filter(osfs_codi__in=cods_setor).values_list('osfs_codi', flat=True))
+        criados = [c for c in cods_setor if c not in existentes]
+        setores_qs.bulk_create(
+            [OrdemServicoFaseSetor(osfs_codi=c, osfs_nome=f"Setor bench {c}") for c in criados]
+        )
+        nomes = [f"{rnd.choice(NOMES)} {rnd.choice(NOMES)} {i}" for i in range(1, clientes + 1)]
+        Entidades.objects.using(banco).bulk_create(
+            [Entidades(enti_empr=empresa, enti_clie=i, enti_nome=nome) for i, nome in enumerate(nomes, start=1)],
+            batch_size=1000,
+        )
+
+        numeros = list(range(1, ordens + 1))
+        Ordemservico.objects.using(banco).bulk_create([
+            Ordemservico(
+                orde_empr=empresa, orde_fili=filial, orde_nume=n,
+                orde_enti=rnd.randint(1, clientes),
+                orde_seto=rnd.choice(cods_setor),
+                orde_stat_orde=rnd.choice(STATUS_LISTAVEIS),
+                orde_prio=rnd.randint(1, 3),
+                orde_prob=' '.join(rnd.sample(PALAVRAS, 3)),
+                orde_data_aber=hoje - timedelta(days=rnd.randint(0, 900)),
+                orde_ulti_alte=hoje - timedelta(days=rnd.randint(0, 30)),
+                orde_tota=Decimal('0'),
+            )
+            for n in numeros
+        ], batch_size=1000)
+
+        pecas, servicos = [], []
+        for n in numeros:
+            for i in range(1, itens + 1):
+                quan, unit = Decimal(rnd.randint(1, 5)), Decimal(rnd.randint(500, 50000)) / 100
+                pecas.append(Ordemservicopecas(
+                    peca_empr=empresa, peca_fili=filial, peca_orde=n, peca_id=i, peca_codi=str(i),
+                    peca_quan=quan, peca_unit=unit, peca_tota=quan * unit,
+                ))
+                servicos.append(Ordemservicoservicos(
+                    serv_empr=empresa, serv_fili=filial, serv_orde=n, serv_id=i, serv_codi=str(i),
+                    serv_quan=Decimal('1'), serv_unit=unit, serv_tota=unit,
+                ))
+        Ordemservicopecas.objects.using(banco).bulk_create(pecas, batch_size=2000)
+        Ordemservicoservicos.objects.using(banco).bulk_create(servicos, batch_size=2000)
+
+        conteudo = campo_conteudo().name
+        Osarquivos.objects.using(banco).bulk_create([
+            Osarquivos(arqu_empr=empresa, arqu_fili=filial, arqu_os=n, arqu_codi_arqu=1, **{conteudo: PNG_1PX})
+            for n in numeros[::max(1, arquivos_a_cada)]
+        ], batch_size=500)
+
+        _datas_invalidas(banco, empresa, filial, rnd.sample(numeros, int(len(numeros) * invalidas)))
+
+    return {'ordens': numeros, 'clientes': nomes, 'setores': cods_setor, 'setores_criados': criados}
+
+
+def _datas_invalidas(banco, empresa, filial, numeros):
+    if not numeros:
+        return
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    metade = len(numeros) // 2
+    with connection.cursor() as cursor:
+        for data, grupo in (('0001-01-01', numeros[:metade]), ('20225-01-01', numeros[metade:])):
+            cursor.execute(
+                f"UPDATE {q(Ordemservico._meta.db_table)} SET orde_data_aber = %s::date, orde_ulti_alte = %s::date "
+                "WHERE orde_empr = %s AND orde_fili = %s AND orde_nume = ANY(%s)",
+                [data, data, empresa, filial, grupo],
+            )
+
+
+def limpar(banco, empresa, setores_criados=()):
+    """
+    Remove a massa por SQL direto (sem carregar instâncias nem disparar signals).
+    Dos setores, só apaga os que o `popular` criou (`setores_criados`).
+    """
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    alvos = (
+        (Osarquivos, 'arqu_empr', empresa),
+        (Ordemservicopecas, 'peca_empr', empresa),
+        (Ordemservicoservicos, 'serv_empr', empresa),
+        (Ordemservico, 'orde_empr', empresa),
+        (Entidades, 'enti_empr', empresa),
+    )
+    with transaction.atomic(using=banco), connection.cursor() as cursor:
+        for model, coluna, valor in alvos:
+            cursor.execute(f"DELETE FROM {q(model._meta.db_table)} WHERE {coluna} = %s", [valor])
+        if setores_criados:
+            cursor.execute(
+                f"DELETE FROM {q(OrdemServicoFaseSetor._meta.db_table)} WHERE osfs_codi = ANY(%s)",
+                [list(setores_criados)],
+            )
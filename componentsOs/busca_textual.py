@@ -0,0 +1,150 @@
+"""
+Busca textual (full-text) das ordens, no lugar do SearchFilter com ICONTAINS.
+
+O `?search=` do app virava um OR de `ILIKE '%termo%'` sobre colunas longas, com
+leitura sequencial da tabela inteira. A etapa `busca_textual` de
+otimizar_banco_os cria:
+
+- a configuração `os_pt` (cópia de `portuguese` com `unaccent` antes do
+  stemmer), então "revisao" encontra "revisão";
+- a coluna `orde_busca` (tsvector com pesos: orde_prob A, orde_defe_desc B,
+  orde_obse C), mantida por trigger e preenchida em lotes, sem reescrever a
+  tabela sob lock (ver colunas_mantidas);
+- o índice GIN dessa coluna, criado depois do preenchimento.
+
+Cada termo vira prefixo (`termo:*`) para funcionar enquanto o usuário digita;
+termos numéricos também casam com o início de orde_nume. Sem `?ordering=` os
+resultados vêm por relevância (ts_rank_cd). Em bancos ainda sem a coluna e o
+índice, e em buscas só com stop words ("de", "a"), que o full-text descarta,
+a busca volta ao SearchFilter original.
+"""
+import logging
+import re
+import time
+
+from django.db import connections
+from rest_framework import filters
+
+from .colunas_mantidas import colunas_geradas, ddl_colunas_mantidas, indice_valido
+from .datas_saneadas import tabela_ordens
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACAO = 'os_pt'
+COLUNA = 'orde_busca'
+PESOS = (('orde_prob', 'A'), ('orde_defe_desc', 'B'), ('orde_obse', 'C'))
+VERIFICACAO_TTL = 300
+
+_TERMO_RE = re.compile(r'\w+', re.UNICODE)
+
+_disponivel_por_banco = {}
+
+
+def busca_disponivel(banco):
+    """
+    Verifica (no máximo a cada VERIFICACAO_TTL s por banco) se a coluna orde_busca
+    existe e já foi preenchida (índice GIN válido).
+    """
+    agora = time.monotonic()
+    cache = _disponivel_por_banco.get(banco)
+    if cache is not None and cache[1] > agora:
+        return cache[0]
+    try:
+        conn = connections[banco]
+        with conn.cursor() as cursor:
+            existentes = {c.name for c in conn.introspection.get_table_description(cursor, tabela_ordens())}
+            disponivel = COLUNA in existentes and indice_valido(cursor, indice_busca())
+    except Exception as e:
+        logger.warning(f"[BUSCA TEXTUAL] falha ao inspecionar {banco}: {e}")
+        return False
+    _disponivel_por_banco[banco] = (disponivel, agora + VERIFICACAO_TTL)
+    return disponivel
+
+
+def invalidar_cache(banco=None):
+    if banco is None:
+        _disponivel_por_banco.clear()
+    else:
+        _disponivel_por_banco.pop(banco, None)
+
+
+def indice_busca():
+    return tabela_ordens() + '_busca_gin_idx'
+
+
+def expressao_vetor(ref=''):
+    return ' || '.join(
+        f"setweight(to_tsvector('{CONFIGURACAO}', coalesce({ref}{coluna}::text, '')), '{peso}')"
+        for coluna, peso in PESOS
+    )
+
+
+def ddl_busca_textual(connection):
+    q = connection.ops.quote_name
+    tabela = tabela_ordens()
+    with connection.cursor() as cursor:
+        geradas = colunas_geradas(cursor, tabela, [COLUNA])
+    # Bancos otimizados antes já têm a coluna GENERATED: fica como está
+    colunas = {} if COLUNA in geradas else {COLUNA: ('tsvector', expressao_vetor)}
+    return [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        # CREATE TEXT SEARCH CONFIGURATION não tem IF NOT EXISTS
+        "DO $$ BEGIN "
+        f"IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIGURACAO}') THEN "
+        f"CREATE TEXT SEARCH CONFIGURATION {CONFIGURACAO} (COPY = portuguese); "
+        f"ALTER TEXT SEARCH CONFIGURATION {CONFIGURACAO} "
+        "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem; "
+        "END IF; END $$",
+        *ddl_colunas_mantidas(connection, tabela, 'busca', colunas, [c for c, _ in PESOS]),
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(indice_busca())} "
+        f"ON {q(tabela)} USING gin ({q(COLUNA)})",
+        f"ANALYZE {q(tabela)}",
+    ]
+
+
+def consulta_prefixos(termos):
+    """['Revisão bomba'] -> "'revisão':* & 'bomba':*" (só palavras, sem operadores do usuário)."""
+    palavras = _TERMO_RE.findall(' '.join(termos))
+    return ' & '.join(f"'{p}':*" for p in palavras), palavras
+
+
+def consulta_vazia(banco, tsquery):
+    """True se a configuração descarta todos os termos (stop words)."""
+    with connections[banco].cursor() as cursor:
+        cursor.execute(f"SELECT numnode(to_tsquery('{CONFIGURACAO}', %s))", [tsquery])
+        return cursor.fetchone()[0] == 0
+
+
+class BuscaTextualFilter(filters.SearchFilter):
+    """SearchFilter com full-text quando o banco tem a coluna orde_busca."""
+
+    def filter_queryset(self, request, queryset, view):
+        termos = self.get_search_terms(request)
+        banco = view.get_banco() if hasattr(view, 'get_banco') else None
+        if not termos or not banco or not busca_disponivel(banco):
+            return super().filter_queryset(request, queryset, view)
+
+        tsquery, palavras = consulta_prefixos(termos)
+        if not tsquery:
+            return queryset
+        if consulta_vazia(banco, tsquery):
+            # Só stop words: o full-text não casaria nada
+            return super().filter_queryset(request, queryset, view)
+
+        condicao = f"{COLUNA} @@ to_tsquery('{CONFIGURACAO}', %s)"
+        params = [tsquery]
+        numeros = [p for p in palavras if p.isdigit()]
+        if numeros:
+            condicao = f"({condicao} OR orde_nume::text LIKE %s)"
+            params.append(numeros[0] + '%')
+
+        queryset = queryset.extra(
+            select={'busca_rank': f"ts_rank_cd({COLUNA}, to_tsquery('{CONFIGURACAO}', %s))"},
+            select_params=[tsquery],
+            where=[condicao],
+            params=params,
+        )
+        # Com ?ordering= explícito vale a ordenação pedida; senão, relevância
+        if not request.query_params.get('ordering'):
+            queryset = queryset.order_by('-busca_rank', '-safe_data_aber', '-orde_empr', '-orde_fili', '-orde_nume')
+        return queryset
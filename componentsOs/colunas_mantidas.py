@@ -0,0 +1,78 @@
+"""
+Colunas derivadas da tabela de ordens mantidas por trigger (etapas de otimizar_banco_os).
+
+`ADD COLUMN ... GENERATED ALWAYS AS (...) STORED` reescreve a tabela inteira
+segurando ACCESS EXCLUSIVE: enquanto a reescrita dura, nenhuma requisição lê
+nem grava ordens naquele banco. Aqui a coluna entra como coluna comum e
+anulável, o que só altera o catálogo; o ALTER roda com lock_timeout curto
+para não enfileirar as requisições atrás dele (se estourar, rode a etapa de
+novo). Um trigger BEFORE INSERT OR UPDATE mantém o valor das linhas novas e
+alteradas, e as existentes são preenchidas em lotes de páginas (faixas de
+ctid), com COMMIT a cada lote, sem segurar locks por muito tempo.
+
+Colunas que já existem como GENERATED (bancos otimizados antes) ficam como
+estão. Quem lê as colunas espera o fim do preenchimento: o índice criado
+depois dele é o sinal (`indice_valido`).
+"""
+
+LOCK_TIMEOUT = '5s'
+PAGINAS_POR_LOTE = 1000
+
+
+def colunas_geradas(cursor, tabela, colunas):
+    """Das `colunas`, as que já existem na tabela como GENERATED ... STORED."""
+    cursor.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass "
+        "AND attname = ANY(%s) AND attgenerated <> '' AND NOT attisdropped",
+        [tabela, list(colunas)],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def indice_valido(cursor, indice):
+    cursor.execute(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %s AND i.indisvalid",
+        [indice],
+    )
+    return cursor.fetchone() is not None
+
+
+def ddl_colunas_mantidas(connection, tabela, nome, colunas, origem):
+    """
+    Comandos que criam as `colunas` ({coluna: (tipo, expressao)}), o trigger que
+    as mantém e o preenchimento em lotes. `expressao(ref)` devolve o SQL do
+    valor com as colunas de origem prefixadas por `ref` ('NEW.' no trigger, ''
+    no preenchimento); `origem` são as colunas de origem, que disparam o
+    trigger no UPDATE. Sem colunas, não há comandos.
+    """
+    if not colunas:
+        return []
+    q = connection.ops.quote_name
+    funcao, trigger = q(f'{tabela}_{nome}_fn'), q(f'{tabela}_{nome}_trg')
+    atribuicoes = ' '.join(f"NEW.{q(c)} := {expr('NEW.')};" for c, (_, expr) in colunas.items())
+    destino = ', '.join(q(c) for c in colunas)
+    valores = ', '.join(expr('') for _, expr in colunas.values())
+    return [
+        f"SET lock_timeout = '{LOCK_TIMEOUT}'",
+        *(
+            f"ALTER TABLE {q(tabela)} ADD COLUMN IF NOT EXISTS {q(c)} {tipo}"
+            for c, (tipo, _) in colunas.items()
+        ),
+        f"CREATE OR REPLACE FUNCTION {funcao}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+        f"BEGIN {atribuicoes} RETURN NEW; END $$",
+        # DROP e CREATE na mesma transação: nenhuma escrita passa sem o trigger
+        f"DO $$ BEGIN DROP TRIGGER IF EXISTS {trigger} ON {q(tabela)}; "
+        f"CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE OF {', '.join(q(c) for c in origem)} "
+        f"ON {q(tabela)} FOR EACH ROW EXECUTE FUNCTION {funcao}(); END $$",
+        "RESET lock_timeout",
+        # O UPDATE só grava as colunas derivadas, então não dispara o trigger
+        f"DO $$ DECLARE paginas bigint := pg_relation_size('{q(tabela)}'::regclass) "
+        f"/ current_setting('block_size')::bigint; inicio bigint := 0; "
+        f"BEGIN WHILE inicio <= paginas LOOP "
+        f"UPDATE {q(tabela)} SET ({destino}) = ROW({valores}) "
+        f"WHERE ctid >= format('(%s,0)', inicio)::tid "
+        f"AND ctid < format('(%s,0)', inicio + {PAGINAS_POR_LOTE})::tid "
+        f"AND ROW({destino}) IS DISTINCT FROM ROW({valores}); "
+        f"COMMIT; inicio := inicio + {PAGINAS_POR_LOTE}; END LOOP; END $$",
+    ]
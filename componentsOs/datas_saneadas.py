@@ -0,0 +1,170 @@
+"""
+Colunas de data saneadas da Ordemservico.
+
+Bancos legados têm datas fora de faixa (ano 0001, 20225...) que o psycopg2 não
+converte. Em vez de aplicar CASE/EXTRACT linha a linha em toda consulta, cada
+coluna ganha uma gêmea `<coluna>_safe`, já saneada e indexável, mantida por
+trigger e preenchida em lotes, sem reescrever a tabela sob lock (ver
+colunas_mantidas). O comando `otimizar_banco_os` cria as colunas e índices por
+banco; enquanto não terminar (índice da ordenação padrão válido), o viewset
+continua usando as expressões legadas.
+"""
+import logging
+import time
+
+from django.db import connections
+
+from ..models import Ordemservico
+from .colunas_mantidas import colunas_geradas, ddl_colunas_mantidas, indice_valido
+
+logger = logging.getLogger(__name__)
+
+ANO_MINIMO = 2020
+ANO_MAXIMO = 2100
+
+# Status exibidos pelo OrdemViewSet; também é o predicado dos índices parciais
+STATUS_LISTAVEIS = (0, 1, 2, 3, 5, 21, 22)
+
+COLUNAS_SANEADAS = {
+    'orde_data_aber': 'orde_data_aber_safe',
+    'orde_data_fech': 'orde_data_fech_safe',
+    'orde_nf_data': 'orde_nf_data_safe',
+    'orde_ulti_alte': 'orde_ulti_alte_safe',
+    'orde_data_repr': 'orde_data_repr_safe',
+}
+
+# Blindagem total via SQL puro — CAST para TEXT impede psycopg2 de converter datas inválidas
+SELECT_LEGADO = {
+    'orde_data_aber': "CASE WHEN EXTRACT(YEAR FROM orde_data_aber) BETWEEN 2020 AND 2100 THEN orde_data_aber::text ELSE NULL END",
+    'orde_hora_aber': "orde_hora_aber::text",
+    'orde_data_fech': "CASE WHEN orde_data_fech IS NULL OR EXTRACT(YEAR FROM orde_data_fech) BETWEEN 2020 AND 2100 THEN orde_data_fech::text ELSE NULL END",
+    'orde_hora_fech': "orde_hora_fech::text",
+    'orde_nf_data':   "CASE WHEN orde_nf_data IS NULL OR EXTRACT(YEAR FROM orde_nf_data) BETWEEN 2020 AND 2100 THEN orde_nf_data::text ELSE NULL END",
+    'orde_ulti_alte': "CASE WHEN orde_ulti_alte IS NULL OR EXTRACT(YEAR FROM orde_ulti_alte) BETWEEN 2020 AND 2100 THEN orde_ulti_alte::text ELSE NULL END",
+    'orde_data_repr': "CASE WHEN orde_data_repr IS NULL OR EXTRACT(YEAR FROM orde_data_repr) BETWEEN 2020 AND 2100 THEN orde_data_repr::text ELSE NULL END",
+    'safe_data_aber': "CASE WHEN EXTRACT(YEAR FROM orde_data_aber) BETWEEN 2020 AND 2100 THEN orde_data_aber::text ELSE NULL END",
+    'safe_data_fech': "CASE WHEN orde_data_fech IS NULL OR EXTRACT(YEAR FROM orde_data_fech) BETWEEN 2020 AND 2100 THEN orde_data_fech::text ELSE NULL END",
+}
+
+# Reavalia periodicamente para processos que subiram antes de rodar o comando
+VERIFICACAO_TTL = 300
+
+_disponivel_por_banco = {}
+
+
+def tabela_ordens():
+    return Ordemservico._meta.db_table
+
+
+def indice_datas():
+    return tabela_ordens() + '_safe_aber_chave_idx'
+
+
+def colunas_saneadas_disponiveis(banco):
+    """
+    Verifica (no máximo a cada VERIFICACAO_TTL s por banco) se as colunas *_safe
+    existem e já foram preenchidas (índice da ordenação padrão válido).
+    """
+    agora = time.monotonic()
+    cache = _disponivel_por_banco.get(banco)
+    if cache is not None and cache[1] > agora:
+        return cache[0]
+    try:
+        conn = connections[banco]
+        with conn.cursor() as cursor:
+            existentes = {
+                c.name for c in conn.introspection.get_table_description(cursor, tabela_ordens())
+            }
+            disponivel = set(COLUNAS_SANEADAS.values()) <= existentes and indice_valido(cursor, indice_datas())
+    except Exception as e:
+        logger.warning(f"[DATAS SANEADAS] falha ao inspecionar {banco}: {e}")
+        return False
+    _disponivel_por_banco[banco] = (disponivel, agora + VERIFICACAO_TTL)
+    return disponivel
+
+
+def invalidar_cache(banco=None):
+    if banco is None:
+        _disponivel_por_banco.clear()
+    else:
+        _disponivel_por_banco.pop(banco, None)
+
+
+def select_datas(banco):
+    """Expressões do `.extra(select=...)` do OrdemViewSet para o banco."""
+    if not colunas_saneadas_disponiveis(banco):
+        return dict(SELECT_LEGADO)
+    select = {
+        campo: f"{safe}::text" for campo, safe in COLUNAS_SANEADAS.items()
+    }
+    select['orde_hora_aber'] = "orde_hora_aber::text"
+    select['orde_hora_fech'] = "orde_hora_fech::text"
+    # Coluna pura (sem CAST) para o ORDER BY usar os índices
+    select['safe_data_aber'] = COLUNAS_SANEADAS['orde_data_aber']
+    select['safe_data_fech'] = COLUNAS_SANEADAS['orde_data_fech']
+    return select
+
+
+def expressao_data(banco, campo):
+    """Expressão SQL saneada de uma das colunas de data (coluna *_safe ou CASE legado)."""
+    if colunas_saneadas_disponiveis(banco):
+        return COLUNAS_SANEADAS[campo]
+    return SELECT_LEGADO[campo]
+
+
+def expressao_safe_data_aber(banco):
+    return expressao_data(banco, 'orde_data_aber')
+
+
+def expressao_saneada(coluna, tipo):
+    # Fuso fixo: o ano não depende do TimeZone da sessão (e EXTRACT sobre timestamptz
+    # não é IMMUTABLE, o que as colunas GENERATED de bancos otimizados antes exigiam)
+    origem = f"({coluna} AT TIME ZONE 'UTC')" if tipo.startswith('timestamp with') else coluna
+    return (
+        f"CASE WHEN EXTRACT(YEAR FROM {origem}) BETWEEN {ANO_MINIMO} AND {ANO_MAXIMO} "
+        f"THEN {coluna} ELSE NULL END"
+    )
+
+
+def _tipo_coluna(cursor, tabela, coluna):
+    cursor.execute(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attname = %s AND NOT attisdropped",
+        [tabela, coluna],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def ddl_datas_saneadas(connection):
+    """Colunas saneadas mantidas por trigger e índices da ordenação padrão e por setor."""
+    tabela = tabela_ordens()
+    q = connection.ops.quote_name
+    status = ', '.join(str(s) for s in STATUS_LISTAVEIS)
+    colunas, origem = {}, []
+    with connection.cursor() as cursor:
+        # Bancos otimizados antes já têm colunas GENERATED: ficam como estão
+        geradas = colunas_geradas(cursor, tabela, COLUNAS_SANEADAS.values())
+        for coluna, safe in COLUNAS_SANEADAS.items():
+            tipo = _tipo_coluna(cursor, tabela, coluna)
+            if tipo is None or safe in geradas:
+                continue
+            colunas[safe] = (tipo, lambda ref, coluna=coluna, tipo=tipo: expressao_saneada(ref + q(coluna), tipo))
+            origem.append(coluna)
+    comandos = ddl_colunas_mantidas(connection, tabela, 'datas', colunas, origem)
+    aber = q(COLUNAS_SANEADAS['orde_data_aber'])
+    fech = q(COLUNAS_SANEADAS['orde_data_fech'])
+    chave = 'orde_empr DESC, orde_fili DESC, orde_nume DESC'
+    comandos += [
+        # Mesma chave do cursor da listagem: a data e a chave completa da ordem
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(indice_datas())} "
+        f"ON {q(tabela)} ({aber} DESC, {chave}) WHERE orde_stat_orde IN ({status})",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(tabela + '_seto_safe_aber_chave_idx')} "
+        f"ON {q(tabela)} (orde_seto, {aber} DESC, {chave}) WHERE orde_stat_orde IN ({status})",
+        f"DROP INDEX CONCURRENTLY IF EXISTS {q(tabela + '_safe_aber_idx')}",
+        f"DROP INDEX CONCURRENTLY IF EXISTS {q(tabela + '_seto_safe_aber_idx')}",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(tabela + '_safe_fech_idx')} "
+        f"ON {q(tabela)} ({fech} DESC, orde_nume DESC) WHERE orde_stat_orde IN ({status})",
+        f"ANALYZE {q(tabela)}",
+    ]
+    return comandos
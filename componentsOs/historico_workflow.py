@@ -0,0 +1,103 @@
+"""
+Histórico de workflow: índice de acesso e arquivamento das linhas antigas.
+
+O endpoint lê sempre o histórico de uma ordem em ordem decrescente de data,
+então o índice (empresa, filial, ordem, data DESC, id DESC) atende tanto o
+filtro quanto a ordenação e a paginação por cursor.
+
+A tabela cresce sem limite. Particionar exigiria recriar a tabela legada em
+cada banco, então as linhas antigas de ordens já encerradas são movidas em
+lotes para `<tabela>_arquivo` (mesmas colunas), e a tabela quente fica só com
+o histórico recente e o das ordens em andamento. O endpoint consulta o arquivo
+apenas com `?arquivo=1`.
+"""
+from django.db import connections
+
+from .datas_saneadas import STATUS_LISTAVEIS, tabela_ordens
+
+SUFIXO_ARQUIVO = '_arquivo'
+
+
+def modelo_historico():
+    # Importação local para evitar importação circular
+    from ..models import Ordemservicoworkflowhistorico
+    return Ordemservicoworkflowhistorico
+
+
+def tabela_historico():
+    return modelo_historico()._meta.db_table
+
+
+def tabela_arquivo():
+    return tabela_historico() + SUFIXO_ARQUIVO
+
+
+def coluna_id():
+    return modelo_historico()._meta.pk.column
+
+
+def ddl_historico(connection):
+    """Índice do acesso por ordem e tabela de arquivo com o mesmo índice."""
+    q = connection.ops.quote_name
+    tabela, arquivo, pk = tabela_historico(), tabela_arquivo(), q(coluna_id())
+    colunas = f"(oswh_empr, oswh_fili, oswh_orde, oswh_data DESC, {pk} DESC)"
+    return [
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(tabela + '_orde_data_idx')} ON {q(tabela)} {colunas}",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(tabela + '_data_idx')} ON {q(tabela)} (oswh_data)",
+        f"CREATE TABLE IF NOT EXISTS {q(arquivo)} (LIKE {q(tabela)} INCLUDING DEFAULTS)",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(arquivo + '_orde_data_idx')} ON {q(arquivo)} {colunas}",
+        f"ANALYZE {q(tabela)}",
+    ]
+
+
+def _sql_candidatas(q):
+    """Linhas anteriores ao corte cuja ordem não está mais em andamento."""
+    status = ', '.join(str(s) for s in STATUS_LISTAVEIS)
+    return (
+        f"SELECT h.ctid FROM {q(tabela_historico())} h "
+        f"WHERE h.oswh_data < %s AND NOT EXISTS ("
+        f"SELECT 1 FROM {q(tabela_ordens())} o WHERE o.orde_empr = h.oswh_empr "
+        f"AND o.orde_fili = h.oswh_fili AND o.orde_nume = h.oswh_orde "
+        f"AND o.orde_stat_orde IN ({status}))"
+    )
+
+
+def contar_arquivaveis(banco, corte):
+    connection = connections[banco]
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM ({_sql_candidatas(connection.ops.quote_name)}) c", [corte])
+        return cursor.fetchone()[0]
+
+
+def arquivar_lote(banco, corte, tamanho):
+    """Move até `tamanho` linhas para o arquivo numa instrução; devolve quantas moveu."""
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH movidas AS (DELETE FROM {q(tabela_historico())} WHERE ctid IN "
+            f"({_sql_candidatas(q)} LIMIT %s) RETURNING *) "
+            f"INSERT INTO {q(tabela_arquivo())} SELECT * FROM movidas",
+            [corte, tamanho],
+        )
+        return cursor.rowcount
+
+
+def arquivo_existe(banco):
+    connection = connections[banco]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [connection.ops.quote_name(tabela_arquivo())])
+        return cursor.fetchone()[0]
+
+
+def historico_arquivado(banco, ordem):
+    """Linhas arquivadas da ordem como instâncias do modelo (mais recentes primeiro)."""
+    if not arquivo_existe(banco):
+        return []
+    model = modelo_historico()
+    q = connections[banco].ops.quote_name
+    return list(model.objects.using(banco).raw(
+        f"SELECT * FROM {q(tabela_arquivo())} WHERE oswh_empr = %s AND oswh_fili = %s AND oswh_orde = %s "
+        f"ORDER BY oswh_data DESC, {q(coluna_id())} DESC",
+        [ordem.orde_empr, ordem.orde_fili, ordem.orde_nume],
+    ))
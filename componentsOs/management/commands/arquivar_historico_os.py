@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from ...historico_workflow import arquivar_lote, arquivo_existe, contar_arquivaveis, tabela_historico
+from ...ordem_etag import invalidar
+
+
+class Command(BaseCommand):
+    help = (
+        "Move para <tabela>_arquivo o histórico de workflow anterior ao corte das "
+        "ordens já encerradas, em lotes curtos (uma transação por lote)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default', help="Alias do banco (licença).")
+        parser.add_argument('--dias', type=int, default=365, help="Idade mínima das linhas arquivadas.")
+        parser.add_argument('--lote', type=int, default=5000)
+        parser.add_argument('--pausa', type=float, default=0.2, help="Segundos entre lotes.")
+        parser.add_argument('--dry-run', action='store_true', help="Só conta as linhas arquiváveis.")
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+        if not arquivo_existe(banco):
+            raise CommandError(
+                "Tabela de arquivo inexistente; rode otimizar_banco_os --etapa historico_workflow."
+            )
+
+        corte = timezone.now() - timedelta(days=options['dias'])
+        if options['dry_run']:
+            self.stdout.write(f"{contar_arquivaveis(banco, corte)} linhas anteriores a {corte:%Y-%m-%d}.")
+            return
+
+        total = 0
+        while True:
+            with transaction.atomic(using=banco):
+                movidas = arquivar_lote(banco, corte, options['lote'])
+            total += movidas
+            self.stdout.write(f"lote: {movidas} (total {total})")
+            if movidas < options['lote']:
+                break
+            time.sleep(options['pausa'])
+
+        if total:
+            invalidar(banco)
+            conn = connections[banco]
+            with conn.cursor() as cursor:
+                cursor.execute(f"ANALYZE {conn.ops.quote_name(tabela_historico())}")
+        self.stdout.write(self.style.SUCCESS(f"{total} linhas arquivadas."))
@@ -0,0 +1,111 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...datas_saneadas import ANO_MAXIMO, ANO_MINIMO, STATUS_LISTAVEIS, expressao_saneada
+
+TABELA = 'bench_ordemservico'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a listagem padrão de OS com CASE/EXTRACT por linha (antes) e com "
+        "coluna gerada saneada + índice parcial (depois) numa tabela temporária sintética."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default')
+        parser.add_argument('--linhas', type=int, default=200000)
+        parser.add_argument('--invalidas', type=float, default=0.05, help="Fração de datas fora de faixa.")
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+        if connections[banco].vendor != 'postgresql':
+            raise CommandError("O benchmark exige PostgreSQL.")
+
+        with connections[banco].cursor() as cursor:
+            self._popular(cursor, options['linhas'], options['invalidas'])
+            status = ', '.join(str(s) for s in STATUS_LISTAVEIS)
+            limite = options['page_size']
+
+            legado = (
+                f"CASE WHEN EXTRACT(YEAR FROM orde_data_aber) BETWEEN {ANO_MINIMO} AND {ANO_MAXIMO} "
+                f"THEN orde_data_aber::text ELSE NULL END"
+            )
+            antes = self._medir(
+                cursor,
+                f"SELECT orde_nume, {legado} AS safe_data_aber FROM {TABELA} "
+                f"WHERE orde_stat_orde IN ({status}) AND orde_seto <> 0 "
+                f"ORDER BY safe_data_aber DESC, orde_nume DESC LIMIT {limite}",
+                options['repeticoes'],
+            )
+
+            cursor.execute(
+                f"ALTER TABLE {TABELA} ADD COLUMN orde_data_aber_safe date "
+                f"GENERATED ALWAYS AS ({expressao_saneada('orde_data_aber', 'date')}) STORED"
+            )
+            cursor.execute(
+                f"CREATE INDEX ON {TABELA} (orde_data_aber_safe DESC, orde_nume DESC) "
+                f"WHERE orde_stat_orde IN ({status})"
+            )
+            cursor.execute(f"ANALYZE {TABELA}")
+            depois = self._medir(
+                cursor,
+                f"SELECT orde_nume, orde_data_aber_safe AS safe_data_aber FROM {TABELA} "
+                f"WHERE orde_stat_orde IN ({status}) AND orde_seto <> 0 "
+                f"ORDER BY safe_data_aber DESC, orde_nume DESC LIMIT {limite}",
+                options['repeticoes'],
+            )
+            cursor.execute(f"DROP TABLE IF EXISTS {TABELA}")
+
+        for nome, (ms, plano) in (('antes', antes), ('depois', depois)):
+            self.stdout.write(f"{nome:>6}: {ms:9.2f} ms (mediana)  plano: {plano}")
+        if depois[0]:
+            self.stdout.write(self.style.SUCCESS(f"ganho: {antes[0] / depois[0]:.1f}x"))
+
+    def _popular(self, cursor, linhas, invalidas):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA}")
+        cursor.execute(
+            f"CREATE TEMP TABLE {TABELA} ("
+            "orde_nume integer PRIMARY KEY, orde_seto integer, "
+            "orde_stat_orde integer, orde_data_aber date)"
+        )
+        # Datas inválidas espelham os bancos legados: anos 0001 e 20225
+        cursor.execute(
+            f"INSERT INTO {TABELA} "
+            "SELECT g, 1 + g % 8, (ARRAY[0, 1, 2, 3, 4, 5, 21, 22, 20])[1 + g % 9], "
+            "CASE "
+            "  WHEN random() < %s / 2 THEN DATE '0001-01-01' + (g % 365) "
+            "  WHEN random() < %s THEN DATE '20225-01-01' + (g % 365) "
+            "  ELSE DATE '2020-01-01' + (g % 2000) "
+            "END "
+            "FROM generate_series(1, %s) g",
+            [invalidas, invalidas, linhas],
+        )
+        cursor.execute(f"ANALYZE {TABELA}")
+
+    def _medir(self, cursor, sql, repeticoes):
+        tempos = []
+        plano = None
+        for _ in range(max(1, repeticoes)):
+            cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+            resultado = cursor.fetchone()[0]
+            if isinstance(resultado, str):
+                resultado = json.loads(resultado)
+            tempos.append(resultado[0]['Execution Time'])
+            plano = self._resumo_plano(resultado[0]['Plan'])
+        tempos.sort()
+        return tempos[len(tempos) // 2], plano
+
+    def _resumo_plano(self, no):
+        nomes = []
+        while no:
+            nomes.append(no['Node Type'])
+            filhos = no.get('Plans') or []
+            no = filhos[0] if filhos else None
+        return ' > '.join(nomes)
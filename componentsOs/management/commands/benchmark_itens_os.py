@@ -0,0 +1,75 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from Produtos.models import Produtos
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria ordens com N peças e N serviços pelo endpoint (POST .../ordens/) e mede tempo e "
+        "número de consultas no banco da licença para cada N; o número de consultas deve ficar "
+        "constante. Cada criação roda numa transação desfeita no final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default', help="Alias do banco da licença do --slug.")
+        parser.add_argument('--slug', required=True, help="Slug da licença usado na URL (/api/<slug>/...).")
+        parser.add_argument('--usuario', required=True, help="Username do usuário autenticado nas requisições.")
+        parser.add_argument('--empresa', type=int, default=1)
+        parser.add_argument('--filial', type=int, default=1)
+        parser.add_argument('--ordem', type=int, default=999999999, help="Número fictício da OS.")
+        parser.add_argument('--itens', type=int, action='append', help="Tamanhos a medir; pode repetir.")
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+        try:
+            usuario = get_user_model().objects.get_by_natural_key(options['usuario'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        tamanhos = sorted(options['itens'] or [10, 100, 500])
+        codigos = list(
+            Produtos.objects.using(banco).filter(prod_empr=options['empresa'])
+            .order_by('prod_codi').values_list('prod_codi', flat=True)[:max(tamanhos)]
+        )
+        if len(codigos) < max(tamanhos):
+            self.stdout.write(self.style.WARNING(f"Só há {len(codigos)} produtos; tamanhos limitados."))
+            tamanhos = [n for n in tamanhos if n <= len(codigos)] or [len(codigos)]
+
+        client = APIClient()
+        client.force_authenticate(user=usuario)
+        url = f"/api/{options['slug']}/ordemdeservico/ordens/"
+        self.stdout.write(f"{'itens':>6} {'status':>7} {'ms':>10} {'consultas':>10}")
+        for n in tamanhos:
+            payload = self._payload(options, codigos[:n])
+            status, ms, consultas = self._medir(banco, lambda: client.post(url, payload, format='json'))
+            self.stdout.write(f"{n:>6} {status:>7} {ms:>10.1f} {consultas:>10}")
+
+    def _payload(self, options, codigos):
+        return {
+            'orde_empr': options['empresa'], 'orde_fili': options['filial'], 'orde_nume': options['ordem'],
+            'orde_enti': 1, 'orde_prob': 'benchmark itens',
+            'pecas': [
+                {'peca_codi': str(c), 'peca_quan': '1', 'peca_unit': str(Decimal('10.00'))} for c in codigos
+            ],
+            'servicos': [
+                {'serv_codi': str(i), 'serv_quan': '1', 'serv_unit': '25.00'} for i in range(1, len(codigos) + 1)
+            ],
+        }
+
+    def _medir(self, banco, func):
+        conn = connections[banco]
+        with transaction.atomic(using=banco):
+            with CaptureQueriesContext(conn) as ctx:
+                inicio = time.perf_counter()
+                resposta = func()
+                ms = (time.perf_counter() - inicio) * 1000
+            transaction.set_rollback(True, using=banco)
+        return resposta.status_code, ms, len(ctx.captured_queries)
@@ -0,0 +1,220 @@
+import json
+import os
+import random
+import re
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.test import APIClient
+
+from core import instrumentacao
+from ...benchmark_seed import limpar, popular
+
+_DB_RE = re.compile(r'db;dur=([\d.]+);desc="(\d+) consultas"')
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+class Command(BaseCommand):
+    help = (
+        "Popula uma empresa reservada com ordens, itens, clientes, setores e anexos "
+        "(inclusive datas inválidas), exercita as rotas do OrdemViewSet pelo client do DRF "
+        "e reporta percentis de latência e número de consultas. Com --baseline, falha "
+        "se algum cenário piorar além da tolerância. Grava e apaga dados no banco: só roda "
+        "em aliases listados em OS_BENCHMARK_BANCOS ou com --confirmar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default')
+        parser.add_argument('--slug', required=True, help="Slug da licença usado na URL (/api/<slug>/...).")
+        parser.add_argument('--usuario', required=True, help="Username do usuário autenticado nas requisições.")
+        parser.add_argument('--empresa', type=int, default=9999, help="Empresa reservada para a massa.")
+        parser.add_argument('--filial', type=int, default=1)
+        parser.add_argument('--ordens', type=int, default=2000)
+        parser.add_argument('--itens', type=int, default=5, help="Peças e serviços por ordem.")
+        parser.add_argument('--clientes', type=int, default=200)
+        parser.add_argument('--setores', type=int, default=6)
+        parser.add_argument('--arquivos-a-cada', type=int, default=10, help="Um anexo a cada N ordens.")
+        parser.add_argument('--invalidas', type=float, default=0.05, help="Fração de ordens com datas inválidas.")
+        parser.add_argument('--repeticoes', type=int, default=30)
+        parser.add_argument('--cenario', action='append', help="Cenários a rodar; pode repetir. Padrão: todos.")
+        parser.add_argument('--baseline', help="Arquivo JSON com a linha de base.")
+        parser.add_argument('--salvar-baseline', action='store_true', help="Grava o resultado como nova linha de base.")
+        parser.add_argument('--tolerancia', type=float, default=0.25, help="Piora aceita no p95 (fração).")
+        parser.add_argument('--manter', action='store_true', help="Não remove a massa no final.")
+        parser.add_argument('--sem-popular', action='store_true', help="Reusa a massa de uma execução com --manter.")
+        parser.add_argument(
+            '--confirmar', action='store_true',
+            help="Roda mesmo num banco fora de OS_BENCHMARK_BANCOS (ex.: cópia de produção).",
+        )
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+        if banco not in getattr(settings, 'OS_BENCHMARK_BANCOS', ()) and not options['confirmar']:
+            raise CommandError(
+                f"Banco '{banco}' não é um banco de benchmark (OS_BENCHMARK_BANCOS). "
+                "A massa é criada e removida nele; use --confirmar para rodar mesmo assim."
+            )
+        try:
+            usuario = get_user_model().objects.get_by_natural_key(options['usuario'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        empresa, filial = options['empresa'], options['filial']
+        if options['sem_popular']:
+            massa = {
+                'ordens': list(range(1, options['ordens'] + 1)), 'clientes': [], 'setores': [], 'setores_criados': [],
+            }
+        else:
+            self.stdout.write("Populando massa de dados...")
+            inicio = time.perf_counter()
+            massa = popular(
+                banco, empresa, filial, ordens=options['ordens'], itens=options['itens'],
+                clientes=options['clientes'], n_setores=options['setores'],
+                arquivos_a_cada=options['arquivos_a_cada'], invalidas=options['invalidas'],
+            )
+            self.stdout.write(f"massa pronta em {time.perf_counter() - inicio:.1f}s")
+
+        # Os cenários leem consultas/tempo de banco do Server-Timing da instrumentação.
+        # Liga só neste processo: a flag compartilhada (instrumentacao.definir) valeria
+        # para todos os workers e ficaria ligada se o comando fosse interrompido.
+        try:
+            with mock.patch.object(instrumentacao, 'ativa', return_value=True):
+                client = APIClient()
+                client.force_authenticate(user=usuario)
+                resultados = self._rodar(client, options, massa)
+        finally:
+            if not options['manter']:
+                limpar(banco, empresa, massa['setores_criados'])
+
+        self._reportar(resultados)
+        self._comparar_baseline(resultados, options)
+
+    def _cenarios(self, options, massa):
+        base = f"/api/{options['slug']}/ordemdeservico/ordens/"
+        escopo = f"orde_empr={options['empresa']}&orde_fili={options['filial']}"
+        rnd = random.Random(7)
+        cliente = (massa['clientes'] or ['Silva'])[0].split()[0]
+        proximo = [len(massa['ordens'])]
+
+        def novo_numero():
+            proximo[0] += 1
+            return proximo[0]
+
+        def payload_criacao():
+            return {
+                'orde_empr': options['empresa'], 'orde_fili': options['filial'], 'orde_nume': novo_numero(),
+                'orde_enti': 1, 'orde_seto': (massa['setores'] or [None])[0], 'orde_prob': 'bench criação',
+                'pecas': [
+                    {'peca_codi': str(i), 'peca_quan': 1, 'peca_unit': '10.00'} for i in range(1, options['itens'] + 1)
+                ],
+                'servicos': [
+                    {'serv_codi': str(i), 'serv_quan': 1, 'serv_unit': '25.00'} for i in range(1, options['itens'] + 1)
+                ],
+            }
+
+        def alvo():
+            return rnd.choice(massa['ordens'])
+
+        return {
+            'lista': lambda c: c.get(f"{base}?{escopo}"),
+            'lista_cliente': lambda c: c.get(f"{base}?{escopo}&cliente_nome={cliente}"),
+            'lista_busca': lambda c: c.get(f"{base}?{escopo}&search=rolamento"),
+            'lista_ordenada': lambda c: c.get(f"{base}?{escopo}&ordering=-orde_prio"),
+            'lista_cursor': lambda c: c.get(f"{base}?{escopo}&paginacao=cursor"),
+            'lista_resumo': lambda c: c.get(f"{base}?{escopo}&resumo=1"),
+            'detalhe': lambda c: c.get(f"{base}{alvo()}/?{escopo}"),
+            'criar': lambda c: c.post(base, payload_criacao(), format='json'),
+            'atualizar': lambda c: c.patch(
+                f"{base}{alvo()}/?{escopo}",
+                {'orde_prob': 'bench atualização', 'pecas': [
+                    {'peca_codi': str(i), 'peca_quan': 2 if i == 1 else 1, 'peca_unit': '10.00'}
+                    for i in range(1, options['itens'] + 1)
+                ]},
+                format='json',
+            ),
+        }
+
+    def _rodar(self, client, options, massa):
+        cenarios = self._cenarios(options, massa)
+        nomes = options['cenario'] or list(cenarios)
+        desconhecidos = set(nomes) - set(cenarios)
+        if desconhecidos:
+            raise CommandError(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+        resultados = {}
+        for nome in nomes:
+            # Uma requisição de aquecimento fora da medição (caches, conexões, imports)
+            cenarios[nome](client)
+            tempos, consultas, db_ms, erros = [], [], [], 0
+            for _ in range(options['repeticoes']):
+                inicio = time.perf_counter()
+                resposta = cenarios[nome](client)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+                if resposta.status_code >= 400:
+                    erros += 1
+                m = _DB_RE.search(resposta.get('Server-Timing', ''))
+                if m:
+                    db_ms.append(float(m.group(1)))
+                    consultas.append(int(m.group(2)))
+            resultados[nome] = {
+                'p50_ms': round(_percentil(tempos, 50), 1),
+                'p95_ms': round(_percentil(tempos, 95), 1),
+                'p99_ms': round(_percentil(tempos, 99), 1),
+                'db_ms_p50': round(_percentil(db_ms, 50), 1),
+                'consultas': max(consultas) if consultas else None,
+                'erros': erros,
+            }
+        return resultados
+
+    def _reportar(self, resultados):
+        self.stdout.write(
+            f"{'cenário':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'db p50':>9}{'consultas':>11}{'erros':>7}"
+        )
+        for nome, r in resultados.items():
+            self.stdout.write(
+                f"{nome:<16}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                f"{r['db_ms_p50']:>9.1f}{str(r['consultas']):>11}{r['erros']:>7}"
+            )
+
+    def _comparar_baseline(self, resultados, options):
+        caminho = options['baseline']
+        if not caminho:
+            return
+        if options['salvar_baseline'] or not os.path.exists(caminho):
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump(resultados, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Linha de base gravada em {caminho}."))
+            return
+
+        with open(caminho, encoding='utf-8') as f:
+            baseline = json.load(f)
+        falhas = []
+        for nome, r in resultados.items():
+            base = baseline.get(nome)
+            if not base:
+                continue
+            limite = base['p95_ms'] * (1 + options['tolerancia'])
+            if r['p95_ms'] > limite:
+                falhas.append(f"{nome}: p95 {r['p95_ms']}ms > {limite:.1f}ms (base {base['p95_ms']}ms)")
+            if base.get('consultas') is not None and r['consultas'] is not None and r['consultas'] > base['consultas']:
+                falhas.append(f"{nome}: {r['consultas']} consultas > {base['consultas']} (base)")
+            if r['erros'] > base.get('erros', 0):
+                falhas.append(f"{nome}: {r['erros']} respostas com erro (base {base.get('erros', 0)})")
+        if falhas:
+            raise CommandError("Regressão em relação à linha de base:\n" + "\n".join(falhas))
+        self.stdout.write(self.style.SUCCESS("Sem regressão em relação à linha de base."))
@@ -0,0 +1,113 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from ...ordem_totais import Tabelas, atualizar_total, recalcular_totais
+
+TABELAS = Tabelas('bench_os_ordens', 'bench_os_pecas', 'bench_os_servicos')
+
+
+class _Ordem:
+    def __init__(self, empr, fili, nume):
+        self.orde_empr, self.orde_fili, self.orde_nume = empr, fili, nume
+        self.orde_tota = None
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o recálculo de orde_tota por ordem somando itens no Python (antes), "
+        "por ordem com agregação no banco e em lote com UPDATE ... FROM, em tabelas temporárias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default')
+        parser.add_argument('--ordens', type=int, default=5000)
+        parser.add_argument('--itens', type=int, default=6, help="Peças e serviços por ordem.")
+        parser.add_argument('--repeticoes', type=int, default=3)
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+        if connections[banco].vendor != 'postgresql':
+            raise CommandError("O benchmark exige PostgreSQL.")
+
+        conn = connections[banco]
+        resultados = {}
+        with transaction.atomic(using=banco):
+            with conn.cursor() as cursor:
+                self._popular(cursor, options['ordens'], options['itens'])
+                cursor.execute(f"SELECT orde_empr, orde_fili, orde_nume FROM {TABELAS.ordens}")
+                ordens = [_Ordem(*row) for row in cursor.fetchall()]
+
+                for nome, medir in (
+                    ('python', lambda: self._por_ordem_python(cursor, ordens)),
+                    ('agregado', lambda: [atualizar_total(banco, o, TABELAS) for o in ordens]),
+                    ('lote', lambda: recalcular_totais(banco, t=TABELAS)),
+                ):
+                    tempos = []
+                    for _ in range(options['repeticoes']):
+                        cursor.execute(f"UPDATE {TABELAS.ordens} SET orde_tota = 0")
+                        inicio = time.perf_counter()
+                        medir()
+                        tempos.append((time.perf_counter() - inicio) * 1000)
+                    cursor.execute(f"SELECT COUNT(*) FROM {TABELAS.ordens} WHERE orde_tota = 0")
+                    resultados[nome] = (statistics.median(tempos), cursor.fetchone()[0])
+            transaction.set_rollback(True, using=banco)
+
+        n = len(ordens)
+        for nome, (ms, zerados) in resultados.items():
+            self.stdout.write(
+                f"{nome:>9}: {ms:10.1f} ms (mediana)  {ms / n * 1000:8.1f} µs/ordem  zeradas após: {zerados}"
+            )
+        if resultados['lote'][0]:
+            self.stdout.write(self.style.SUCCESS(
+                f"lote x python: {resultados['python'][0] / resultados['lote'][0]:.1f}x"
+            ))
+
+    def _por_ordem_python(self, cursor, ordens):
+        """Caminho antigo: lê os itens de cada ordem e soma no Python, um UPDATE por ordem."""
+        for o in ordens:
+            chave = [o.orde_empr, o.orde_fili, o.orde_nume]
+            cursor.execute(
+                f"SELECT peca_tota FROM {TABELAS.pecas} WHERE peca_empr = %s AND peca_fili = %s AND peca_orde = %s",
+                chave,
+            )
+            total = sum((r[0] or Decimal('0') for r in cursor.fetchall()), Decimal('0'))
+            cursor.execute(
+                f"SELECT serv_tota FROM {TABELAS.servicos} WHERE serv_empr = %s AND serv_fili = %s AND serv_orde = %s",
+                chave,
+            )
+            total += sum((r[0] or Decimal('0') for r in cursor.fetchall()), Decimal('0'))
+            cursor.execute(
+                f"UPDATE {TABELAS.ordens} SET orde_tota = %s "
+                "WHERE orde_empr = %s AND orde_fili = %s AND orde_nume = %s",
+                [total] + chave,
+            )
+
+    def _popular(self, cursor, ordens, itens):
+        for tabela in TABELAS:
+            cursor.execute(f"DROP TABLE IF EXISTS {tabela}")
+        cursor.execute(
+            f"CREATE TEMP TABLE {TABELAS.ordens} ("
+            "orde_empr integer, orde_fili integer, orde_nume integer, orde_tota numeric(15, 2), "
+            "orde_ulti_alte date, PRIMARY KEY (orde_empr, orde_fili, orde_nume))"
+        )
+        cursor.execute(
+            f"INSERT INTO {TABELAS.ordens} SELECT 1, 1, g, 0, NULL FROM generate_series(1, %s) g", [ordens]
+        )
+        for tabela, p in ((TABELAS.pecas, 'peca'), (TABELAS.servicos, 'serv')):
+            cursor.execute(
+                f"CREATE TEMP TABLE {tabela} ("
+                f"{p}_empr integer, {p}_fili integer, {p}_orde integer, {p}_tota numeric(15, 2))"
+            )
+            cursor.execute(
+                f"INSERT INTO {tabela} SELECT 1, 1, o, round((random() * 500)::numeric, 2) "
+                "FROM generate_series(1, %s) o, generate_series(1, %s) i",
+                [ordens, itens],
+            )
+            cursor.execute(f"CREATE INDEX ON {tabela} ({p}_empr, {p}_fili, {p}_orde) INCLUDE ({p}_tota)")
+            cursor.execute(f"ANALYZE {tabela}")
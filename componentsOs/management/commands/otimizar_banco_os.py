@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...os_ddl import ETAPAS, invalidar_caches
+
+
+class Command(BaseCommand):
+    help = "Cria colunas saneadas e índices das tabelas de OS no banco informado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default', help="Alias do banco (licença).")
+        parser.add_argument(
+            '--etapa', action='append', choices=list(ETAPAS),
+            help="Etapa a aplicar; pode repetir. Padrão: todas.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Só imprime o SQL.")
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+
+        conn = connections[banco]
+        for nome in options['etapa'] or list(ETAPAS):
+            self.stdout.write(f"== {nome}")
+            for sql in ETAPAS[nome](conn):
+                self.stdout.write(sql)
+                if options['dry_run']:
+                    continue
+                # CREATE INDEX CONCURRENTLY exige autocommit (fora de transaction.atomic)
+                with conn.cursor() as cursor:
+                    cursor.execute(sql)
+
+        invalidar_caches(banco)
+        self.stdout.write(self.style.SUCCESS(f"Banco '{banco}' atualizado."))
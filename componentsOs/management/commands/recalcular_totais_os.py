@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from ...datas_saneadas import STATUS_LISTAVEIS
+from ...ordem_etag import invalidar
+from ...ordem_totais import recalcular_totais
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula orde_tota (peças + serviços) das OS abertas divergentes num único UPDATE. "
+        "Sem --aplicar só conta; ordens fechadas e faturadas nunca são tocadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default', help="Alias do banco (licença).")
+        parser.add_argument('--empresa', type=int)
+        parser.add_argument('--filial', type=int)
+        parser.add_argument('--aplicar', action='store_true', help="Grava os totais (padrão: só conta).")
+
+    def handle(self, *args, **options):
+        banco = options['banco']
+        if banco not in connections.databases:
+            raise CommandError(f"Banco '{banco}' não configurado.")
+
+        aplicar = options['aplicar']
+        with transaction.atomic(using=banco):
+            n = recalcular_totais(
+                banco, empresa=options['empresa'], filial=options['filial'],
+                status=STATUS_LISTAVEIS, dry_run=not aplicar,
+            )
+        if not aplicar:
+            self.stdout.write(f"{n} ordens abertas com total divergente. Use --aplicar para corrigir.")
+            return
+        if n:
+            invalidar(banco)
+        self.stdout.write(self.style.SUCCESS(f"{n} ordens corrigidas."))
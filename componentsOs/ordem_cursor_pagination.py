@@ -0,0 +1,188 @@
+import base64
+import json
+
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OrdemServicoCursorPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) da listagem de ordens.
+
+    A chave é (safe_data_aber, orde_empr, orde_fili, orde_nume), toda decrescente,
+    igual à ordenação padrão do OrdemViewSet: o número da ordem só é único dentro
+    da empresa e filial, então o desempate usa a chave completa da ordem. Cada página filtra a partir da chave da última linha
+    vista, sem OFFSET e sem COUNT, então uma página funda custa o mesmo que a
+    primeira. O parâmetro `ordering` é ignorado neste modo.
+
+    O total só é calculado quando pedido: `?total=estimado` usa a estimativa do
+    planner (EXPLAIN) e `?total=exato` executa o COUNT.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    total_query_param = 'total'
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = 'Cursor inválido.'
+    campos_cursor = ('d', 'e', 'f', 'n')
+    ordenacao = ('safe_data_aber', 'orde_empr', 'orde_fili', 'orde_nume')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.total, self.total_estimado = self.get_total(queryset, request)
+
+        cursor = self.decode_cursor(request)
+        reverso = bool(cursor and cursor.get('r'))
+        expr = view.get_safe_data_aber_sql()
+
+        if cursor is not None:
+            chave = [cursor['e'], cursor['f'], cursor['n']]
+            where, params = self._filtro_keyset(expr, cursor['d'], chave, reverso)
+            queryset = queryset.extra(where=[where], params=params)
+
+        if reverso:
+            queryset = queryset.order_by(*self.ordenacao)
+        else:
+            queryset = queryset.order_by(*(f'-{campo}' for campo in self.ordenacao))
+
+        results = list(queryset[:self.page_size + 1])
+        tem_mais = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverso:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = tem_mais
+        else:
+            self.has_next = tem_mais
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def _filtro_keyset(self, expr, data, chave, reverso):
+        # DESC no Postgres coloca NULL primeiro; ASC (página anterior) coloca por último
+        ordem = "(orde_empr, orde_fili, orde_nume)"
+        if not reverso:
+            if data is None:
+                return f"(({expr}) IS NULL AND {ordem} < (%s, %s, %s)) OR ({expr}) IS NOT NULL", chave
+            return f"({expr}) < %s OR (({expr}) = %s AND {ordem} < (%s, %s, %s))", [data, data, *chave]
+        if data is None:
+            return f"({expr}) IS NULL AND {ordem} > (%s, %s, %s)", chave
+        return (
+            f"({expr}) IS NULL OR ({expr}) > %s OR (({expr}) = %s AND {ordem} > (%s, %s, %s))",
+            [data, data, *chave],
+        )
+
+    def get_page_size(self, request):
+        try:
+            tamanho = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(tamanho, self.max_page_size))
+
+    def get_total(self, queryset, request):
+        modo = request.query_params.get(self.total_query_param)
+        if modo == 'exato':
+            return queryset.order_by().count(), False
+        if modo == 'estimado':
+            return self._estimar_total(queryset), True
+        return None, False
+
+    def _estimar_total(self, queryset):
+        try:
+            plano = json.loads(queryset.order_by().explain(format='json'))
+            return int(plano[0]['Plan']['Plan Rows'])
+        except Exception:
+            return None
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if not isinstance(cursor, dict) or any(campo not in cursor for campo in self.campos_cursor):
+                raise ValueError
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, obj, reverso=False):
+        data = getattr(obj, 'safe_data_aber', None)
+        cursor = {
+            'd': str(data) if data is not None else None,
+            'e': obj.orde_empr, 'f': obj.orde_fili, 'n': obj.orde_nume,
+        }
+        if reverso:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverso=True)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.total is not None:
+            payload['count'] = self.total
+            payload['count_estimado'] = self.total_estimado
+        return Response(payload)
+
+
+class HistoricoWorkflowCursorPagination(OrdemServicoCursorPagination):
+    """
+    Cursor (oswh_data, id) decrescente do histórico de workflow de uma ordem,
+    apoiado no índice criado pela etapa `historico_workflow` de otimizar_banco_os.
+    Só avança (`previous` é sempre nulo): o app rola o histórico para baixo.
+    """
+    page_size = 30
+    campos_cursor = ('d', 'n')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.total, self.total_estimado = self.get_total(queryset, request)
+        self.pk_name = queryset.model._meta.pk.name
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            data, pk = cursor['d'], cursor['n']
+            # DESC no Postgres coloca NULL primeiro
+            if data is None:
+                filtro = Q(oswh_data__isnull=True, **{f'{self.pk_name}__lt': pk}) | Q(oswh_data__isnull=False)
+            else:
+                filtro = Q(oswh_data__lt=data) | Q(oswh_data=data, **{f'{self.pk_name}__lt': pk})
+            queryset = queryset.filter(filtro)
+
+        results = list(queryset.order_by('-oswh_data', f'-{self.pk_name}')[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.has_previous = False
+        self.page = results[:self.page_size]
+        return self.page
+
+    def encode_cursor(self, obj, reverso=False):
+        data = obj.oswh_data
+        cursor = {'d': str(data) if data is not None else None, 'n': getattr(obj, self.pk_name)}
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
@@ -0,0 +1,164 @@
+"""
+ETags fortes e baratos para as leituras de OS usadas em polling.
+
+O ETag não vem do corpo da resposta: é o hash de (versão 'ordens' do banco,
+impressão do recurso, URL e setor do usuário). Quando o If-None-Match confere,
+a resposta é 304 sem serializer nem prefetch.
+
+A versão é incrementada por signals de save/delete dos modelos da OS e por
+qualquer escrita bem-sucedida no OrdemViewSet (ver finalize_response), o que
+cobre também os QuerySet.update() dos services. Ela sozinha não basta: o ERP
+legado e SQL fora do viewset não a incrementam, e com LocMemCache cada processo
+tem o seu contador. Por isso toda impressão também leva o conteúdo: a da
+listagem são os valores das linhas da página já lida (sem consulta extra; muda
+status, prioridade ou setor, muda o ETag); a da ordem são os campos já
+carregados mais quantidade e maior id dos itens.
+
+Os anexos têm versão própria por ordem (`invalidar_arquivos`): upload, preview
+pronto e save/delete de Osarquivos trocam só o ETag da lista de arquivos
+daquela ordem, não os da listagem e dos detalhes.
+
+Configuração (settings):
+    OS_ETAG_ATIVO  liga/desliga os ETags (padrão: True)
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from rest_framework.response import Response
+
+from ..models import Ordemservico, Ordemservicopecas, Ordemservicoservicos, Osarquivos
+from .versoes import incrementar_versao, obter_versao
+
+ESCOPO = "ordens"
+ESCOPO_ARQUIVOS = "arquivos"
+
+
+def ativo():
+    return bool(getattr(settings, 'OS_ETAG_ATIVO', True))
+
+
+def versao(banco):
+    return obter_versao(ESCOPO, banco)
+
+
+def invalidar(banco):
+    incrementar_versao(ESCOPO, banco)
+
+
+def _chave_arquivos(banco, empr, fili, nume):
+    return f"{banco}:{empr}:{fili}:{nume}"
+
+
+def versao_arquivos(banco, empr, fili, nume):
+    return obter_versao(ESCOPO_ARQUIVOS, _chave_arquivos(banco, empr, fili, nume))
+
+
+def invalidar_arquivos(banco, empr, fili, nume):
+    incrementar_versao(ESCOPO_ARQUIVOS, _chave_arquivos(banco, empr, fili, nume))
+
+
+def _invalidar(sender, using=None, **kwargs):
+    if using:
+        invalidar(using)
+
+
+def _invalidar_arquivos(sender, instance=None, using=None, **kwargs):
+    if using and instance is not None:
+        invalidar_arquivos(using, instance.arqu_empr, instance.arqu_fili, instance.arqu_os)
+
+
+def _conectar(model):
+    uid = f"os_etag_{model._meta.label_lower}"
+    post_save.connect(_invalidar, sender=model, dispatch_uid=f"{uid}_save")
+    post_delete.connect(_invalidar, sender=model, dispatch_uid=f"{uid}_delete")
+
+
+for _model in (Ordemservico, Ordemservicopecas, Ordemservicoservicos):
+    _conectar(_model)
+
+post_save.connect(_invalidar_arquivos, sender=Osarquivos, dispatch_uid="os_etag_arquivos_save")
+post_delete.connect(_invalidar_arquivos, sender=Osarquivos, dispatch_uid="os_etag_arquivos_delete")
+
+
+def conectar_historico(model):
+    """O modelo de histórico é importado tardiamente pelo viewset (import circular)."""
+    _conectar(model)
+
+
+def calcular(*partes):
+    return '"%s"' % hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()
+
+
+def corresponde(request, etag):
+    cabecalho = request.headers.get('If-None-Match')
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == '*':
+        return True
+    return etag in [t.strip().removeprefix('W/') for t in cabecalho.split(',')]
+
+
+def nao_modificado(etag):
+    resposta = Response(status=304)
+    resposta['ETag'] = etag
+    return resposta
+
+
+def contexto(request, banco):
+    """Partes comuns a todos os ETags: versão, URL completa e setor do usuário."""
+    user_setor = getattr(request.user, 'setor', None)
+    return (
+        versao(banco),
+        banco,
+        request.get_full_path(),
+        getattr(user_setor, 'osfs_codi', None) if user_setor else None,
+    )
+
+
+def _valores(obj):
+    """Valores já lidos: linha nomeada do resumo ou campos não adiados da instância."""
+    if hasattr(obj, '_asdict'):
+        return tuple((nome, str(valor)) for nome, valor in obj._asdict().items())
+    adiados = obj.get_deferred_fields()
+    return tuple(
+        (f.attname, str(getattr(obj, f.attname)))
+        for f in type(obj)._meta.concrete_fields if f.attname not in adiados
+    )
+
+
+def impressao_lista(linhas, total=None):
+    """Total do paginador e os valores de cada linha da página (instâncias ou linhas do resumo)."""
+    return total, tuple(_valores(o) for o in linhas)
+
+
+def _impressao_itens(model, banco, **filtro):
+    pk = model._meta.pk.name
+    linha = model.objects.using(banco).filter(**filtro).aggregate(n=Count(pk), m=Max(pk))
+    return linha['n'], linha['m']
+
+
+def impressao_ordem(banco, ordem):
+    # Só o que já veio na consulta (as datas saneadas chegam pelo extra select)
+    return (
+        _valores(ordem),
+        _impressao_itens(
+            Ordemservicopecas, banco,
+            peca_empr=ordem.orde_empr, peca_fili=ordem.orde_fili, peca_orde=ordem.orde_nume,
+        ),
+        _impressao_itens(
+            Ordemservicoservicos, banco,
+            serv_empr=ordem.orde_empr, serv_fili=ordem.orde_fili, serv_orde=ordem.orde_nume,
+        ),
+    )
+
+
+def impressao_historico(queryset):
+    linha = queryset.order_by().aggregate(n=Count('oswh_data'), ulti=Max('oswh_data'))
+    return linha['n'], str(linha['ulti'])
+
+
+def impressao_arquivos(queryset):
+    linha = queryset.order_by().aggregate(n=Count('arqu_codi_arqu'), m=Max('arqu_codi_arqu'))
+    return linha['n'], linha['m']
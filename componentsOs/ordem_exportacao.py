@@ -0,0 +1,178 @@
+"""
+Exportação da listagem de OS em CSV ou XLSX, em streaming.
+
+As linhas saem do queryset da listagem (mesmos filtros e ordenação) via
+`.iterator()`, que no Postgres usa cursor do lado do servidor; nomes de setor
+e cliente são carregados por bloco de linhas. Cada bloco é escrito e enviado
+antes do próximo ser lido, então a memória não cresce com o tamanho da
+exportação e o primeiro byte sai logo.
+
+O XLSX é montado à mão (zip em modo streaming com a planilha em inlineStr),
+sem depender de openpyxl/xlsxwriter, que precisam do arquivo inteiro antes
+de enviar.
+"""
+import csv
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from .ordem_lista import serializar_resumo
+from .ordem_loaders import carregar_relacionados
+
+TAMANHO_BLOCO = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def blocos(linhas, tamanho=TAMANHO_BLOCO):
+    iterador = iter(linhas)
+    while True:
+        bloco = list(islice(iterador, tamanho))
+        if not bloco:
+            return
+        yield bloco
+
+
+def linhas_exportacao(banco, queryset, campos):
+    """Gera dicts já resolvidos (nomes de setor/cliente), bloco a bloco."""
+    nomes = [n for n, c in (('setores', 'setor_nome'), ('clientes', 'cliente_nome')) if c in campos]
+    for bloco in blocos(queryset.iterator(chunk_size=TAMANHO_BLOCO)):
+        mapas = carregar_relacionados(banco, bloco, nomes=nomes)[0] if nomes else {}
+        yield from serializar_resumo(bloco, mapas, campos)
+
+
+class _Buffer:
+    """Destino de escrita que acumula bytes até o gerador esvaziá-lo."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(dados.encode('utf-8') if isinstance(dados, str) else bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def gerar_csv(linhas, campos):
+    buffer = _Buffer()
+    # Separador ';' e BOM: o Excel em pt-BR abre direto com acentos
+    escritor = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    escritor.writerow(campos)
+    yield buffer.esvaziar()
+    for bloco in blocos(linhas, 500):
+        for item in bloco:
+            escritor.writerow(['' if item[c] is None else item[c] for c in campos])
+        yield buffer.esvaziar()
+
+
+def _coluna(indice):
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _celula(ref, valor):
+    if valor is None or valor == '':
+        return ''
+    if isinstance(valor, bool):
+        valor = int(valor)
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{valor}</v></c>'
+    if isinstance(valor, (date, datetime)):
+        valor = valor.isoformat()
+    texto = escape(str(valor))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _numero_ou_texto(valor):
+    # serializar_resumo devolve Decimal como str; volta a número na planilha
+    if isinstance(valor, str):
+        try:
+            return Decimal(valor) if valor.replace('.', '', 1).lstrip('-').isdigit() else valor
+        except ArithmeticError:
+            return valor
+    return valor
+
+
+def _linha_xml(numero, valores):
+    celulas = ''.join(_celula(f"{_coluna(i)}{numero}", v) for i, v in enumerate(valores))
+    return f'<row r="{numero}">{celulas}</row>'
+
+
+XLSX_ESTATICOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Ordens" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>'
+    ),
+}
+
+
+def gerar_xlsx(linhas, campos):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, conteudo in XLSX_ESTATICOS.items():
+            zf.writestr(nome, conteudo)
+        yield buffer.esvaziar()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _linha_xml(1, campos)
+            ).encode('utf-8'))
+            numero = 1
+            for bloco in blocos(linhas, 500):
+                xml = []
+                for item in bloco:
+                    numero += 1
+                    xml.append(_linha_xml(numero, [_numero_ou_texto(item[c]) for c in campos]))
+                planilha.write(''.join(xml).encode('utf-8'))
+                yield buffer.esvaziar()
+            planilha.write(b'</sheetData></worksheet>')
+    yield buffer.esvaziar()
+
+
+GERADORES = {'csv': gerar_csv, 'xlsx': gerar_xlsx}
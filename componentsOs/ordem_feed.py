@@ -0,0 +1,295 @@
+"""
+Feed de alterações das ordens por banco (tenant) e setor.
+
+Em vez de cada aparelho repetir a listagem do seu setor, ele pede
+`GET ordens/feed/?desde=<id>` (long-poll: a resposta espera até chegar um
+evento ou esgotar o timeout) ou abre o mesmo endereço com
+`Accept: text/event-stream` (SSE). Os eventos são publicados depois do commit
+pelas ações que mexem na ordem (create/update, avançar/retornar setor,
+prioridade, motor em estoque, itens) e só chegam a quem é do setor de origem
+ou de destino; usuário sem setor recebe todos.
+
+O transporte fica atrás de um broker trocável:
+- BrokerCache (padrão): sequência e eventos no cache do Django, visível para
+  todos os workers quando o cache é compartilhado (Redis/Memcached);
+- BrokerMemoria: fila em memória do processo, com espera por Condition —
+  o substituto usado em testes e em desenvolvimento.
+`definir_broker()` troca o broker em tempo de execução.
+
+Cada conexão em espera (long-poll ou SSE) ocupa uma thread de worker do
+começo ao fim; com workers síncronos, muitos aparelhos por oficina esgotam o
+pool antes do polling que o feed substitui. Para esse uso o endpoint deve
+rodar em workers assíncronos (ASGI, ou gunicorn com gevent/eventlet). Em
+qualquer caso o processo aceita no máximo OS_FEED_MAX_CONEXOES esperas ao
+mesmo tempo: acima disso o long-poll responde na hora, sem esperar, e o SSE
+recebe 503 com Retry-After, deixando as threads restantes para as demais rotas.
+
+Configuração (settings):
+    OS_FEED_BROKER        'cache' ou 'memoria' (padrão: 'cache')
+    OS_FEED_RETENCAO      eventos guardados por banco (padrão: 1000)
+    OS_FEED_TTL           validade de cada evento no BrokerCache em segundos (padrão: 600)
+    OS_FEED_TIMEOUT       espera máxima do long-poll em segundos (padrão: 25)
+    OS_FEED_SSE_MAX       duração máxima de uma conexão SSE em segundos (padrão: 300)
+    OS_FEED_MAX_CONEXOES  esperas simultâneas por processo (padrão: 4)
+"""
+import json
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+INTERVALO_CACHE = 0.5
+HEARTBEAT = 15
+
+
+def _retencao():
+    return int(getattr(settings, 'OS_FEED_RETENCAO', 1000))
+
+
+def _ttl_evento():
+    return int(getattr(settings, 'OS_FEED_TTL', 600))
+
+
+def timeout_padrao():
+    return int(getattr(settings, 'OS_FEED_TIMEOUT', 25))
+
+
+def sse_max():
+    return int(getattr(settings, 'OS_FEED_SSE_MAX', 300))
+
+
+def ler_timeout(valor):
+    """Timeout pedido pelo cliente, limitado a [0, timeout_padrao()]; ValueError se não for número finito."""
+    if valor in (None, ""):
+        return float(timeout_padrao())
+    segundos = float(valor)
+    if not math.isfinite(segundos):
+        raise ValueError(valor)
+    return min(max(segundos, 0.0), float(timeout_padrao()))
+
+
+def _limitar(timeout):
+    # nan/inf nunca esgotariam a espera: o worker ficaria preso
+    return timeout if math.isfinite(timeout) and timeout > 0 else 0
+
+
+_vagas = None
+_vagas_lock = threading.Lock()
+
+
+def _semaforo():
+    global _vagas
+    with _vagas_lock:
+        if _vagas is None:
+            _vagas = threading.BoundedSemaphore(int(getattr(settings, 'OS_FEED_MAX_CONEXOES', 4)))
+        return _vagas
+
+
+def ocupar_vaga():
+    """Reserva uma das OS_FEED_MAX_CONEXOES esperas do processo, sem bloquear; False se não há."""
+    return _semaforo().acquire(blocking=False)
+
+
+def liberar_vaga():
+    _semaforo().release()
+
+
+class FluxoSSE:
+    """Iterável do StreamingHttpResponse que devolve a vaga quando a resposta é fechada."""
+
+    def __init__(self, gerador):
+        self._gerador = gerador
+        self._aberto = True
+
+    def __iter__(self):
+        return self._gerador
+
+    def close(self):
+        try:
+            self._gerador.close()
+        finally:
+            if self._aberto:
+                self._aberto = False
+                liberar_vaga()
+
+
+def _visivel(evento, setores):
+    if setores is None:
+        return True
+    return bool({str(evento.get("orde_seto")), str(evento.get("setor_anterior"))} & setores)
+
+
+class BrokerMemoria:
+    """Fila por banco em memória do processo."""
+
+    def __init__(self, retencao=None):
+        self.retencao = retencao or _retencao()
+        self._cond = threading.Condition()
+        self._filas = {}
+        self._seq = {}
+
+    def publicar(self, banco, evento):
+        with self._cond:
+            seq = self._seq.get(banco, 0) + 1
+            self._seq[banco] = seq
+            fila = self._filas.setdefault(banco, deque(maxlen=self.retencao))
+            fila.append(dict(evento, id=seq))
+            self._cond.notify_all()
+            return seq
+
+    def ultimo(self, banco):
+        with self._cond:
+            return self._seq.get(banco, 0)
+
+    def _ler(self, banco, desde, setores):
+        fila = self._filas.get(banco) or ()
+        if desde > self._seq.get(banco, 0) or (fila and desde < fila[0]["id"] - 1):
+            return None  # cursor desconhecido ou eventos anteriores já descartados
+        return [e for e in fila if e["id"] > desde and _visivel(e, setores)]
+
+    def aguardar(self, banco, desde, setores=None, timeout=0):
+        """(eventos, ultimo_id); eventos None indica que o cliente precisa recarregar a lista."""
+        limite = time.monotonic() + _limitar(timeout)
+        with self._cond:
+            while True:
+                ultimo = self._seq.get(banco, 0)
+                eventos = self._ler(banco, desde, setores)
+                if eventos is None or eventos:
+                    return eventos, ultimo
+                # Eventos de outros setores avançam o cursor sem acordar o cliente
+                desde = max(desde, ultimo)
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return [], ultimo
+                self._cond.wait(restante)
+
+
+class BrokerCache:
+    """Sequência (cache.incr) e eventos (uma chave por id) no cache do Django."""
+
+    def __init__(self, retencao=None):
+        self.retencao = retencao or _retencao()
+
+    def _chave_seq(self, banco):
+        return f"os:feed:seq:{banco}"
+
+    def _chave_evento(self, banco, seq):
+        return f"os:feed:evento:{banco}:{seq}"
+
+    def publicar(self, banco, evento):
+        chave = self._chave_seq(banco)
+        cache.add(chave, 0, None)
+        try:
+            seq = cache.incr(chave)
+        except ValueError:
+            cache.set(chave, 1, None)
+            seq = 1
+        # Eventos antigos expiram sozinhos; quem ficar para trás recebe "reiniciar"
+        cache.set(self._chave_evento(banco, seq), dict(evento, id=seq), _ttl_evento())
+        return seq
+
+    def ultimo(self, banco):
+        return cache.get(self._chave_seq(banco)) or 0
+
+    def aguardar(self, banco, desde, setores=None, timeout=0):
+        limite = time.monotonic() + _limitar(timeout)
+        while True:
+            ultimo = self.ultimo(banco)
+            if desde > ultimo:
+                return None, ultimo
+            if ultimo > desde:
+                ids = list(range(desde + 1, ultimo + 1))
+                if len(ids) > self.retencao:
+                    return None, ultimo
+                encontrados = cache.get_many([self._chave_evento(banco, i) for i in ids])
+                if len(encontrados) < len(ids):
+                    return None, ultimo
+                eventos = sorted(
+                    (e for e in encontrados.values() if _visivel(e, setores)), key=lambda e: e["id"]
+                )
+                if eventos:
+                    return eventos, ultimo
+                desde = ultimo
+            if time.monotonic() >= limite:
+                return [], ultimo
+            time.sleep(INTERVALO_CACHE)
+
+
+_broker = None
+_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    with _lock:
+        if _broker is None:
+            tipo = getattr(settings, 'OS_FEED_BROKER', 'cache')
+            _broker = BrokerMemoria() if tipo == 'memoria' else BrokerCache()
+        return _broker
+
+
+def definir_broker(novo):
+    """Troca o broker (testes usam BrokerMemoria()); None volta ao configurado."""
+    global _broker
+    with _lock:
+        _broker = novo
+
+
+def evento(tipo, ordem, setor_anterior=None):
+    return {
+        "tipo": tipo,
+        "orde_empr": ordem.orde_empr,
+        "orde_fili": ordem.orde_fili,
+        "orde_nume": ordem.orde_nume,
+        "orde_seto": ordem.orde_seto,
+        "setor_anterior": setor_anterior,
+        "orde_stat_orde": ordem.orde_stat_orde,
+        "momento": timezone.now().isoformat(),
+    }
+
+
+def publicar(banco, tipo, ordem, setor_anterior=None):
+    """Publica depois do commit da transação corrente (ou já, em autocommit)."""
+    dados = evento(tipo, ordem, setor_anterior)
+    transaction.on_commit(lambda: broker().publicar(banco, dados), using=banco)
+
+
+def setores_do_usuario(user):
+    setor = getattr(user, 'setor', None)
+    codigo = getattr(setor, "osfs_codi", None) if setor else None
+    return {str(codigo)} if codigo else None
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Só para a negociação de conteúdo aceitar Accept: text/event-stream."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: erro\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8')
+
+
+def gerar_sse(banco, desde, setores):
+    """Gerador SSE: eventos com `id:` (Last-Event-ID) e comentários de heartbeat."""
+    fim = time.monotonic() + sse_max()
+    yield "retry: 3000\n\n"
+    while time.monotonic() < fim:
+        eventos, ultimo = broker().aguardar(banco, desde, setores, timeout=HEARTBEAT)
+        if eventos is None:
+            yield f"event: reiniciar\nid: {ultimo}\ndata: {{}}\n\n"
+            desde = ultimo
+            continue
+        if not eventos:
+            desde = max(desde, ultimo)
+            yield ": ping\n\n"
+            continue
+        for e in eventos:
+            yield f"event: {e['tipo']}\nid: {e['id']}\ndata: {json.dumps(e)}\n\n"
+        desde = max(desde, ultimo)
@@ -0,0 +1,360 @@
+"""
+Gravação em lote das peças e serviços da OS.
+
+É o único caminho de gravação dos itens, na criação e na edição, para qualquer
+quantidade de itens. Os campos de cada item são validados pelo serializer
+aninhado (OrdemServicoSerializer) sem consultas por item; daqui em diante os
+itens são normalizados numa passada (só as colunas do modelo, com
+*_tota = quan × unit), os códigos de produto são conferidos numa única
+consulta, os ids numerados a partir do maior da ordem e as linhas vão para o
+banco com bulk_create. O número de consultas não depende da quantidade de
+itens (benchmark_itens_os mede pelo endpoint).
+
+Na edição, `sincronizar` compara os itens recebidos com os gravados e emite só
+os INSERTs, UPDATEs e DELETEs necessários, cada grupo numa instrução. A linha
+gravada é identificada por `<prefixo>_id`, como o app faz ao editar
+(AbaPecas.js); o código do produto só casa linhas enviadas sem id com linhas
+gravadas do mesmo código ainda não casadas, então ordens antigas com o mesmo
+código em duas linhas continuam com duas linhas. `aplicar_delta` recebe apenas
+as linhas alteradas ({"upsert": [...], "remover": [ids]}).
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Max
+from Produtos.models import Produtos
+
+from ..models import Ordemservicopecas, Ordemservicoservicos
+
+Espec = namedtuple('Espec', 'nome model prefixo')
+
+PECAS = Espec('pecas', Ordemservicopecas, 'peca')
+SERVICOS = Espec('servicos', Ordemservicoservicos, 'serv')
+
+TIPOS_AUTO = ('AutoField', 'BigAutoField', 'SmallAutoField')
+TAMANHO_LOTE = 500
+
+
+class ItensErro(ValueError):
+    def __init__(self, campo, detalhes, erro="itens_invalidos"):
+        super().__init__(erro)
+        self.payload = {"erro": erro, "campo": campo, "detalhes": detalhes}
+
+
+def campos(espec):
+    return {f.name: f for f in espec.model._meta.concrete_fields}
+
+
+def campo(espec, sufixo):
+    return f"{espec.prefixo}_{sufixo}"
+
+
+def total_item(espec, dados):
+    """quan × unit arredondado às casas de *_tota; sem um dos dois, o *_tota informado."""
+    quan, unit = dados.get(campo(espec, 'quan')), dados.get(campo(espec, 'unit'))
+    if quan is None or unit is None:
+        return dados.get(campo(espec, 'tota'))
+    casas = campos(espec)[campo(espec, 'tota')].decimal_places
+    return (Decimal(quan) * Decimal(unit)).quantize(Decimal(1).scaleb(-casas))
+
+
+def normalizar(espec, item, mapa_campos=None):
+    """Item validado pelo serializer -> só as colunas do modelo, com o total derivado."""
+    mapa_campos = mapa_campos or campos(espec)
+    # Campos só de exibição (produto_nome etc.) ficam de fora
+    dados = {nome: valor for nome, valor in item.items() if nome in mapa_campos}
+    if campo(espec, 'quan') in dados and campo(espec, 'unit') in dados:
+        dados[campo(espec, 'tota')] = total_item(espec, dados)
+    return dados
+
+
+def com_ids(espec, brutos, validados):
+    """
+    Recoloca nos itens validados o `<prefixo>_id` enviado pelo app, pela
+    posição na lista, quando o serializer não o devolve (campo só leitura).
+    """
+    id_ = campo(espec, 'id')
+    brutos = brutos if isinstance(brutos, list) else []
+    saida = []
+    for i, item in enumerate(validados or []):
+        bruto = brutos[i] if i < len(brutos) and isinstance(brutos[i], dict) else {}
+        if item.get(id_) is None and bruto.get(id_) not in (None, ''):
+            item = dict(item, **{id_: bruto[id_]})
+        saida.append(item)
+    return saida
+
+
+def _converter_id(espec, valor):
+    field = campos(espec).get(campo(espec, 'id'))
+    return field.to_python(valor) if field is not None else valor
+
+
+def validar(espec, itens):
+    """
+    Itens já validados pelo serializer -> [(indice, dados)]. Confere só o que
+    depende da lista inteira: o código é obrigatório e um mesmo `<prefixo>_id`
+    não aparece duas vezes. Códigos repetidos são aceitos, como no caminho
+    antigo. Todos os erros vão num único ItensErro com o índice de cada item.
+    """
+    mapa_campos = campos(espec)
+    codi, id_ = campo(espec, 'codi'), campo(espec, 'id')
+    validos, erros, ids = [], [], {}
+    for i, item in enumerate(itens or []):
+        dados = normalizar(espec, item, mapa_campos)
+        try:
+            ident = _converter_id(espec, dados.get(id_)) if dados.get(id_) not in (None, '') else None
+        except ValidationError:
+            erros.append({"indice": i, "campos": {id_: ["inválido"]}})
+            continue
+        if ident is None:
+            dados.pop(id_, None)
+        else:
+            dados[id_] = ident
+
+        if dados.get(codi) in (None, ''):
+            erros.append({"indice": i, "campos": {codi: ["obrigatório"]}})
+        elif ident is not None and ident in ids:
+            erros.append({"indice": i, "campos": {id_: [f"duplicado (item {ids[ident]})"]}})
+        else:
+            if ident is not None:
+                ids[ident] = i
+            validos.append((i, dados))
+
+    if erros:
+        raise ItensErro(espec.nome, erros)
+    return validos
+
+
+def preparar(espec, itens, empre, fili, nume):
+    """Instâncias não salvas dos itens validados; os ids são atribuídos na gravação."""
+    objs = []
+    for _, dados in validar(espec, itens):
+        dados.pop(campo(espec, 'id'), None)
+        dados.update({campo(espec, 'empr'): empre, campo(espec, 'fili'): fili, campo(espec, 'orde'): nume})
+        objs.append(espec.model(**dados))
+    return objs
+
+
+def validar_produtos(banco, empre, itens, espec=PECAS):
+    """Confere numa consulta se os códigos [(indice, código)] existem como produto na empresa."""
+    if not itens:
+        return
+    codi = campo(espec, 'codi')
+    existentes = {
+        str(c) for c in Produtos.objects.using(banco).filter(
+            prod_empr=empre, prod_codi__in=sorted({str(c) for _, c in itens}),
+        ).values_list('prod_codi', flat=True)
+    }
+    erros = [
+        {"indice": i, "campos": {codi: ["produto inexistente"]}}
+        for i, codigo in itens if str(codigo) not in existentes
+    ]
+    if erros:
+        raise ItensErro(espec.nome, erros)
+
+
+def codigos(espec, objs):
+    """[(indice, código)] das instâncias, no formato de validar_produtos."""
+    return [(i, getattr(o, campo(espec, 'codi'))) for i, o in enumerate(objs)]
+
+
+def atribuir_ids(banco, espec, ordem, objs):
+    """
+    Numera `<prefixo>_id` a partir do maior id da ordem, numa consulta. Se o
+    campo for auto incremento o banco numera e nada é feito.
+    """
+    field = campos(espec).get(campo(espec, 'id'))
+    if field is None or field.get_internal_type() in TIPOS_AUTO:
+        return
+    pendentes = [o for o in objs if getattr(o, field.name) is None]
+    if not pendentes:
+        return
+    maior = espec.model.objects.using(banco).filter(**filtro_ordem(espec, ordem)).aggregate(
+        m=Max(field.name)
+    )['m'] or 0
+    for i, obj in enumerate(pendentes, start=1):
+        setattr(obj, field.name, maior + i)
+
+
+def filtro_ordem(espec, ordem):
+    return {
+        campo(espec, 'empr'): ordem.orde_empr,
+        campo(espec, 'fili'): ordem.orde_fili,
+        campo(espec, 'orde'): ordem.orde_nume,
+    }
+
+
+def criar_itens(banco, ordem, pecas, servicos):
+    """bulk_create das peças e serviços da ordem. Chamar dentro de transaction.atomic."""
+    for espec, objs in ((PECAS, pecas), (SERVICOS, servicos)):
+        if not objs:
+            continue
+        for obj in objs:
+            for nome, valor in filtro_ordem(espec, ordem).items():
+                setattr(obj, nome, valor)
+        atribuir_ids(banco, espec, ordem, objs)
+        espec.model.objects.using(banco).bulk_create(objs, batch_size=TAMANHO_LOTE)
+
+
+def _chaves(espec):
+    return {campo(espec, c) for c in ('empr', 'fili', 'orde', 'id')} | {espec.model._meta.pk.name}
+
+
+def _atuais(banco, espec, ordem):
+    """{<prefixo>_id: instância} das linhas gravadas, em ordem de id."""
+    id_ = campo(espec, 'id')
+    return {
+        getattr(obj, id_): obj
+        for obj in espec.model.objects.using(banco).filter(**filtro_ordem(espec, ordem)).order_by(id_)
+    }
+
+
+def diferenca(espec, atuais, recebidos, remover_ausentes=True, casar_por_codigo=True):
+    """
+    Compara {id: instância gravada} com [(indice, dados)] recebidos.
+
+    Item com id gravado altera essa linha. Item sem id é linha nova; com
+    `casar_por_codigo` ele antes ocupa a primeira linha gravada do mesmo código
+    que nenhum outro item reclamou (clientes que mandam a lista sem ids). Id
+    que não é da ordem vira linha nova, numerada na gravação.
+
+    Devolve (inserir, atualizar, remover, conferir): instâncias novas,
+    [(instância, {campo: valor})] só com os campos que mudaram, ids a excluir e
+    [(indice, código)] dos itens inseridos ou com código trocado, os únicos
+    cujo produto precisa ser conferido.
+    """
+    codi, id_, tota = campo(espec, 'codi'), campo(espec, 'id'), campo(espec, 'tota')
+    chaves = _chaves(espec)
+    reclamados = {d[id_] for _, d in recebidos if d.get(id_) in atuais}
+    livres = {}
+    if casar_por_codigo:
+        for ident, obj in atuais.items():
+            if ident not in reclamados:
+                livres.setdefault(str(getattr(obj, codi)), []).append(obj)
+
+    inserir, atualizar, conferir, presentes = [], [], [], set()
+    for indice, dados in recebidos:
+        obj = atuais.get(dados.get(id_))
+        if obj is None and dados.get(id_) is None and livres.get(str(dados[codi])):
+            obj = livres[str(dados[codi])].pop(0)
+        if obj is None:
+            novo = {nome: valor for nome, valor in dados.items() if nome != id_}
+            inserir.append(espec.model(**novo))
+            conferir.append((indice, novo[codi]))
+            continue
+        presentes.add(getattr(obj, id_))
+        # O total vem de quan/unit gravados + recebidos: mudar só um deles também o recalcula
+        gravados = {nome: getattr(obj, nome) for nome in (campo(espec, 'quan'), campo(espec, 'unit'), tota)}
+        dados = dict(dados, **{tota: total_item(espec, {**gravados, **dados})})
+        mudancas = {
+            nome: valor for nome, valor in dados.items()
+            if nome not in chaves and getattr(obj, nome) != valor
+        }
+        if mudancas:
+            atualizar.append((obj, mudancas))
+            if codi in mudancas:
+                conferir.append((indice, mudancas[codi]))
+    remover = [ident for ident in atuais if ident not in presentes] if remover_ausentes else []
+    return inserir, atualizar, remover, conferir
+
+
+def _atualizar_em_lote(banco, espec, ordem, atualizar):
+    """Um único UPDATE ... FROM (VALUES ...) para todas as linhas alteradas, por `<prefixo>_id`."""
+    if not atualizar:
+        return 0
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    mapa_campos = campos(espec)
+    colunas = sorted({nome for _, mudancas in atualizar for nome in mudancas})
+    fields = [mapa_campos[nome] for nome in colunas]
+
+    linhas, params = [], []
+    for obj, mudancas in atualizar:
+        linhas.append("(" + ", ".join(["%s"] * (len(fields) + 1)) + ")")
+        params.append(getattr(obj, campo(espec, 'id')))
+        for field in fields:
+            valor = mudancas.get(field.name, getattr(obj, field.name))
+            params.append(field.get_db_prep_value(valor, connection))
+
+    alias = ", ".join(["k"] + [f"c{i}" for i in range(len(fields))])
+    sets = ", ".join(
+        f"{q(f.column)} = v.c{i}::{f.db_type(connection)}" for i, f in enumerate(fields)
+    )
+    chave = {c: q(mapa_campos[campo(espec, c)].column) for c in ('empr', 'fili', 'orde')}
+    campo_id = mapa_campos[campo(espec, 'id')]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {q(espec.model._meta.db_table)} AS t SET {sets} "
+            f"FROM (VALUES {', '.join(linhas)}) AS v({alias}) "
+            f"WHERE t.{chave['empr']} = %s AND t.{chave['fili']} = %s AND t.{chave['orde']} = %s "
+            f"AND t.{q(campo_id.column)} = v.k::{campo_id.rel_db_type(connection)}",
+            params + [ordem.orde_empr, ordem.orde_fili, ordem.orde_nume],
+        )
+        return cursor.rowcount
+
+
+def _remover_em_lote(banco, espec, ordem, ids):
+    """DELETE único pelos ids da ordem (sem carregar as instâncias)."""
+    if not ids:
+        return 0
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    mapa_campos = campos(espec)
+    col = {c: q(mapa_campos[campo(espec, c)].column) for c in ('empr', 'fili', 'orde', 'id')}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {q(espec.model._meta.db_table)} "
+            f"WHERE {col['empr']} = %s AND {col['fili']} = %s AND {col['orde']} = %s "
+            f"AND {col['id']} = ANY(%s)",
+            [ordem.orde_empr, ordem.orde_fili, ordem.orde_nume, list(ids)],
+        )
+        return cursor.rowcount
+
+
+def _aplicar(banco, espec, ordem, inserir, atualizar, remover):
+    resumo = {
+        "removidos": _remover_em_lote(banco, espec, ordem, remover),
+        "alterados": _atualizar_em_lote(banco, espec, ordem, atualizar),
+        "inseridos": len(inserir),
+    }
+    criar_itens(banco, ordem, *((inserir, []) if espec is PECAS else ([], inserir)))
+    return resumo
+
+
+def sincronizar(banco, espec, ordem, itens, validar_produto=True):
+    """
+    Deixa os itens da ordem iguais à lista recebida, escrevendo só a diferença.
+    Chamar dentro de transaction.atomic.
+    """
+    recebidos = validar(espec, itens)
+    inserir, atualizar, remover, conferir = diferenca(espec, _atuais(banco, espec, ordem), recebidos)
+    # Só linhas novas ou com código trocado: produto descontinuado já gravado não bloqueia a edição
+    if validar_produto and espec is PECAS:
+        validar_produtos(banco, ordem.orde_empr, conferir)
+    return _aplicar(banco, espec, ordem, inserir, atualizar, remover)
+
+
+def aplicar_delta(banco, espec, ordem, delta):
+    """
+    Aplica {"upsert": [itens], "remover": [ids]}: altera os itens enviados com
+    `<prefixo>_id`, inclui os sem id e exclui os ids listados; os demais ficam
+    intactos.
+    """
+    if not isinstance(delta, dict):
+        raise ItensErro(espec.nome, [{"erro": "delta_invalido"}])
+    recebidos = validar(espec, delta.get("upsert") or [])
+    try:
+        remover = {_converter_id(espec, i) for i in (delta.get("remover") or [])}
+    except ValidationError:
+        raise ItensErro(espec.nome, [{"erro": "remover_invalido"}])
+    conflito = {d.get(campo(espec, 'id')) for _, d in recebidos} & remover
+    if conflito:
+        raise ItensErro(espec.nome, [{"erro": "upsert_e_remover", "ids": sorted(conflito)}])
+
+    atuais = _atuais(banco, espec, ordem)
+    inserir, atualizar, _, conferir = diferenca(espec, atuais, recebidos, remover_ausentes=False, casar_por_codigo=False)
+    if espec is PECAS:
+        validar_produtos(banco, ordem.orde_empr, conferir)
+    return _aplicar(banco, espec, ordem, inserir, atualizar, [i for i in remover if i in atuais])
@@ -0,0 +1,56 @@
+"""
+Representação resumida da listagem de OS.
+
+Ativada com `?resumo=1` (todos os campos de CAMPOS_RESUMO) ou `?fields=a,b,c`
+(subconjunto). Lê só as colunas pedidas via values_list, não carrega peças nem
+serviços e não passa pelo serializer aninhado; o detalhe continua completo no
+retrieve.
+"""
+from decimal import Decimal
+
+CAMPOS_RESUMO = (
+    'orde_empr', 'orde_fili', 'orde_nume', 'orde_enti', 'cliente_nome',
+    'orde_seto', 'setor_nome', 'orde_stat_orde', 'orde_prio', 'orde_prob',
+    'orde_data_aber', 'orde_hora_aber', 'orde_data_fech', 'orde_ulti_alte',
+    'orde_tota',
+)
+
+# Sempre lidos: chaves dos loaders de nomes e da paginação por cursor
+CAMPOS_INTERNOS = ('orde_empr', 'orde_fili', 'orde_nume', 'orde_enti', 'orde_seto', 'safe_data_aber')
+
+CAMPOS_CALCULADOS = {'cliente_nome', 'setor_nome'}
+
+
+def campos_resumo_solicitados(request):
+    """Campos pedidos em ?fields= / ?resumo=, ou None para a representação completa."""
+    fields = request.query_params.get('fields')
+    if fields:
+        campos = [c.strip() for c in fields.split(',') if c.strip() in CAMPOS_RESUMO]
+        return campos or list(CAMPOS_RESUMO)
+    if request.query_params.get('resumo') in ('1', 'true', 'True'):
+        return list(CAMPOS_RESUMO)
+    return None
+
+
+def queryset_resumo(queryset, campos):
+    colunas = list(CAMPOS_INTERNOS)
+    colunas += [c for c in campos if c not in CAMPOS_CALCULADOS and c not in colunas]
+    return queryset.values_list(*colunas, named=True)
+
+
+def serializar_resumo(linhas, mapas, campos):
+    setores = mapas.get('setores', {})
+    clientes = mapas.get('clientes', {})
+    data = []
+    for linha in linhas:
+        item = {}
+        for campo in campos:
+            if campo == 'cliente_nome':
+                item[campo] = clientes.get((linha.orde_empr, linha.orde_enti))
+            elif campo == 'setor_nome':
+                item[campo] = setores.get(linha.orde_seto)
+            else:
+                valor = getattr(linha, campo)
+                item[campo] = str(valor) if isinstance(valor, Decimal) else valor
+        data.append(item)
+    return data
@@ -0,0 +1,104 @@
+"""
+Carregamento em lote dos relacionados exibidos na listagem de OS.
+
+Cada loader faz uma única consulta para a página inteira, restrita às chaves
+(empresa, filial, ordem) / (empresa, cliente) das ordens carregadas. Setores e
+clientes trazem só as colunas usadas; peças e serviços continuam instâncias
+porque o serializer aninhado as consome. Os loaders rodam em sequência na
+conexão da própria requisição: são no máximo quatro consultas por página, e
+threads abririam uma conexão nova por loader a cada listagem.
+"""
+import logging
+import time
+from collections import OrderedDict, defaultdict
+
+from django.db.models import Q
+
+from ..models import Ordemservicopecas, Ordemservicoservicos, OrdemServicoFaseSetor
+from Entidades.models import Entidades
+
+logger = logging.getLogger(__name__)
+
+def _filtro_por_empresa_filial(ordens, prefixo):
+    por_chave = defaultdict(set)
+    for o in ordens:
+        por_chave[(o.orde_empr, o.orde_fili)].add(o.orde_nume)
+    filtro = Q()
+    for (empr, fili), numeros in por_chave.items():
+        filtro |= Q(**{
+            f"{prefixo}_empr": empr,
+            f"{prefixo}_fili": fili,
+            f"{prefixo}_orde__in": numeros,
+        })
+    return filtro
+
+
+def carregar_pecas(banco, ordens):
+    pecas_map = defaultdict(list)
+    qs = Ordemservicopecas.objects.using(banco).filter(_filtro_por_empresa_filial(ordens, "peca"))
+    for peca in qs:
+        pecas_map[(peca.peca_empr, peca.peca_fili, peca.peca_orde)].append(peca)
+    return pecas_map
+
+
+def carregar_servicos(banco, ordens):
+    servicos_map = defaultdict(list)
+    qs = Ordemservicoservicos.objects.using(banco).filter(_filtro_por_empresa_filial(ordens, "serv"))
+    for serv in qs:
+        servicos_map[(serv.serv_empr, serv.serv_fili, serv.serv_orde)].append(serv)
+    return servicos_map
+
+
+def carregar_setores(banco, ordens):
+    setor_ids = {o.orde_seto for o in ordens if o.orde_seto}
+    if not setor_ids:
+        return {}
+    return dict(
+        OrdemServicoFaseSetor.objects.using(banco)
+        .filter(osfs_codi__in=setor_ids)
+        .values_list("osfs_codi", "osfs_nome")
+    )
+
+
+def carregar_clientes(banco, ordens):
+    por_empresa = defaultdict(set)
+    for o in ordens:
+        if o.orde_enti:
+            por_empresa[o.orde_empr].add(o.orde_enti)
+    if not por_empresa:
+        return {}
+    filtro = Q()
+    for empr, clientes in por_empresa.items():
+        filtro |= Q(enti_empr=empr, enti_clie__in=clientes)
+    return {
+        (empr, clie): nome
+        for empr, clie, nome in Entidades.objects.using(banco)
+        .filter(filtro)
+        .values_list("enti_empr", "enti_clie", "enti_nome")
+    }
+
+
+LOADERS = OrderedDict([
+    ("pecas", carregar_pecas),
+    ("servicos", carregar_servicos),
+    ("setores", carregar_setores),
+    ("clientes", carregar_clientes),
+])
+
+
+def carregar_relacionados(banco, ordens, nomes=None):
+    """
+    Executa os loaders pedidos (padrão: todos) e devolve (mapas, tempos_ms),
+    ambos indexados pelo nome do loader.
+    """
+    ordens = list(ordens)
+    nomes = list(nomes or LOADERS)
+    if not ordens:
+        return {nome: {} for nome in nomes}, {}
+
+    mapas, tempos = {}, {}
+    for nome in nomes:
+        inicio = time.perf_counter()
+        mapas[nome] = LOADERS[nome](banco, ordens)
+        tempos[nome] = (time.perf_counter() - inicio) * 1000
+    return mapas, tempos
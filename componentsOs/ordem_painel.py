@@ -0,0 +1,86 @@
+"""
+Painel agregado das ordens por setor × status.
+
+Uma única consulta GROUP BY (orde_seto, orde_stat_orde) sobre o mesmo
+queryset da listagem (banco, setor do usuário, filtros), com quantidade,
+abertura mais antiga e soma de orde_tota. O resultado fica no cache do Django
+por OS_PAINEL_TTL segundos (padrão: 30), numa chave que inclui a versão
+'ordens' do banco: transições de workflow e demais escritas (ordem_etag)
+trocam a versão e o próximo acesso recalcula.
+"""
+import hashlib
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Sum
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .ordem_etag import versao
+from .ordem_loaders import carregar_setores
+
+
+def _ttl():
+    return int(getattr(settings, 'OS_PAINEL_TTL', 30))
+
+
+def chave_cache(banco, *partes):
+    resumo = hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()
+    return f"os:painel:{banco}:{versao(banco)}:{resumo}"
+
+
+def _data(valor):
+    if valor is None or isinstance(valor, date):
+        return valor
+    try:
+        return date.fromisoformat(str(valor)[:10])
+    except ValueError:
+        return None
+
+
+def calcular(banco, queryset, expr_data_aber):
+    linhas = list(
+        queryset.order_by()
+        .values('orde_seto', 'orde_stat_orde')
+        .annotate(
+            quantidade=Count('orde_nume'),
+            mais_antiga=Min(RawSQL(expr_data_aber, [])),
+            total=Sum('orde_tota'),
+        )
+        .order_by('orde_seto', 'orde_stat_orde')
+    )
+    nomes = carregar_setores(banco, [SimpleNamespace(orde_seto=l['orde_seto']) for l in linhas])
+    hoje = timezone.localdate()
+
+    grupos, quantidade, total = [], 0, Decimal('0')
+    for linha in linhas:
+        mais_antiga = _data(linha['mais_antiga'])
+        grupos.append({
+            "orde_seto": linha['orde_seto'],
+            "setor_nome": nomes.get(linha['orde_seto']),
+            "orde_stat_orde": linha['orde_stat_orde'],
+            "quantidade": linha['quantidade'],
+            "total": str(linha['total'] or Decimal('0')),
+            "mais_antiga": mais_antiga.isoformat() if mais_antiga else None,
+            "idade_dias": (hoje - mais_antiga).days if mais_antiga else None,
+        })
+        quantidade += linha['quantidade']
+        total += linha['total'] or Decimal('0')
+
+    return {
+        "grupos": grupos,
+        "totais": {"quantidade": quantidade, "total": str(total)},
+        "gerado_em": timezone.now().isoformat(),
+    }
+
+
+def obter(banco, chave_partes, queryset, expr_data_aber):
+    chave = chave_cache(banco, *chave_partes)
+    dados = cache.get(chave)
+    if dados is None:
+        dados = calcular(banco, queryset, expr_data_aber)
+        cache.set(chave, dados, _ttl())
+    return dados
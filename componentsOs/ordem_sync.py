@@ -0,0 +1,161 @@
+"""
+Sincronização incremental (delta) das ordens para a réplica local do app.
+
+A chave de sincronização é orde_ulti_alte saneada (DATE; NULL vem primeiro),
+junto com a chave da ordem (empresa, filial, número), comparada como data e
+não como texto. `desde` é inclusivo
+porque orde_ulti_alte guarda só a data: o cliente recebe de novo as alterações
+do mesmo dia e faz upsert. Dentro de uma mesma sincronização as páginas seguem
+por cursor (chave, orde_empr, orde_fili, orde_nume).
+
+Numa sincronização completa (sem `desde`) só vem o que aparece na listagem do
+usuário, sem marcas de remoção: o cliente descarta o que não veio. Na
+incremental vem toda ordem alterada desde `desde`, e as que o usuário não vê
+mais (fechadas, sem setor ou fora do setor dele) chegam como marcas de remoção,
+só com a chave. Toda mudança de setor atualiza orde_ulti_alte, então a ordem
+que sai do setor do usuário é removida da réplica dele sem depender do feed.
+"""
+import base64
+import json
+
+from django.db.models import DateField, F
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .datas_saneadas import COLUNAS_SANEADAS, STATUS_LISTAVEIS, tabela_ordens
+
+LIMITE_PADRAO = 200
+LIMITE_MAXIMO = 1000
+
+
+class SyncErro(ValueError):
+    pass
+
+
+def normalizar_desde(valor):
+    """Converte o watermark recebido (data ou data e hora ISO) na data comparada com orde_ulti_alte."""
+    if not valor:
+        return None
+    valor = str(valor).strip()
+    data_hora = parse_datetime(valor)
+    if data_hora is not None:
+        return data_hora.date()
+    data = parse_date(valor)
+    if data is not None:
+        return data
+    raise SyncErro("desde_invalido")
+
+
+def limite(valor):
+    try:
+        return max(1, min(int(valor or LIMITE_PADRAO), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO
+
+
+def codificar_cursor(chave, empr, fili, nume):
+    dados = json.dumps(
+        {"c": chave.isoformat() if chave else None, "e": empr, "f": fili, "n": nume},
+        separators=(',', ':'),
+    ).encode('utf-8')
+    return base64.urlsafe_b64encode(dados).decode('ascii')
+
+
+def decodificar_cursor(texto):
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(texto.encode('ascii')).decode('utf-8'))
+        chave = dados["c"]
+        ordem = (int(dados["e"]), int(dados["f"]), int(dados["n"]))
+        data = parse_date(chave) if chave is not None else None
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise SyncErro("cursor_invalido")
+    if chave is not None and data is None:
+        raise SyncErro("cursor_invalido")
+    return data, ordem
+
+
+def escopo(queryset, setor, desde):
+    """Restringe a sincronização completa à listagem do usuário; a incremental vê todas as alteradas."""
+    if desde:
+        return queryset
+    queryset = queryset.filter(
+        orde_seto__isnull=False, orde_stat_orde__in=STATUS_LISTAVEIS
+    ).exclude(orde_seto=0)
+    return queryset.filter(orde_seto=setor) if setor else queryset
+
+
+def filtrar(queryset, expr_ulti_alte, desde, cursor, tamanho):
+    chave = f"({expr_ulti_alte})::date"
+    where, params = [], []
+    if desde:
+        where.append(f"{chave} >= %s")
+        params.append(desde)
+    if cursor:
+        c, ordem = decodificar_cursor(cursor)
+        chave_ordem = "(orde_empr, orde_fili, orde_nume) > (%s, %s, %s)"
+        if c is None:
+            where.append(f"({chave} IS NOT NULL OR {chave_ordem})")
+            params += list(ordem)
+        else:
+            where.append(f"({chave} > %s OR ({chave} = %s AND {chave_ordem}))")
+            params += [c, c, *ordem]
+    queryset = queryset.annotate(sync_chave=RawSQL(chave, [], output_field=DateField()))
+    if where:
+        queryset = queryset.extra(where=where, params=params)
+    return queryset.order_by(
+        F('sync_chave').asc(nulls_first=True), 'orde_empr', 'orde_fili', 'orde_nume'
+    )[:tamanho + 1]
+
+
+def watermark(linhas, desde):
+    """`desde` da próxima sincronização: a maior chave entregue (ou o próprio `desde`)."""
+    ultima = linhas[-1].sync_chave if linhas else None
+    chave = ultima or desde
+    return chave.isoformat() if chave else ""
+
+
+def marcar_alterada(ordem):
+    """Atualiza orde_ulti_alte na instância; devolve o campo para o update_fields do save."""
+    ordem.orde_ulti_alte = timezone.localdate()
+    return 'orde_ulti_alte'
+
+
+def motivo_remocao(ordem, setor=None):
+    """None se a ordem aparece na listagem do usuário; senão o motivo da remoção na réplica."""
+    if ordem.orde_stat_orde not in STATUS_LISTAVEIS:
+        return "fechada"
+    if not ordem.orde_seto:
+        return "sem_setor"
+    if setor and str(ordem.orde_seto) != str(setor):
+        return "fora_do_setor"
+    return None
+
+
+def marca_remocao(ordem, motivo):
+    marca = {
+        "orde_empr": ordem.orde_empr,
+        "orde_fili": ordem.orde_fili,
+        "orde_nume": ordem.orde_nume,
+        "orde_ulti_alte": ordem.sync_chave.isoformat() if ordem.sync_chave else None,
+        "motivo": motivo,
+    }
+    if motivo != "fora_do_setor":
+        # Ordem de outro setor: o usuário recebe só a chave
+        marca.update(orde_stat_orde=ordem.orde_stat_orde, orde_seto=ordem.orde_seto)
+    return marca
+
+
+def ddl_sincronizacao(connection):
+    """Índices da chave de sincronização (geral e por setor) sobre a coluna saneada."""
+    tabela = tabela_ordens()
+    q = connection.ops.quote_name
+    ulti = q(COLUNAS_SANEADAS['orde_ulti_alte'])
+    return [
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(tabela + '_safe_ulti_alte_chave_idx')} "
+        f"ON {q(tabela)} ({ulti} NULLS FIRST, orde_empr, orde_fili, orde_nume)",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(tabela + '_seto_safe_ulti_alte_chave_idx')} "
+        f"ON {q(tabela)} (orde_seto, {ulti} NULLS FIRST, orde_empr, orde_fili, orde_nume)",
+        f"DROP INDEX CONCURRENTLY IF EXISTS {q(tabela + '_safe_ulti_alte_idx')}",
+        f"DROP INDEX CONCURRENTLY IF EXISTS {q(tabela + '_seto_safe_ulti_alte_idx')}",
+    ]
@@ -0,0 +1,148 @@
+"""
+Total da OS calculado no banco.
+
+    orde_tota = SUM(peca_tota das peças da ordem) + SUM(serv_tota dos serviços da ordem)
+
+com ordem sem itens valendo 0. É a mesma conta da aba Totais do app
+(totalPecas + totalServicos), que chama `atualizar-total` depois de editar os
+itens; o antigo `total_service.atualizar_total(ordem, ordem.itens_lista)`
+recebia só as peças.
+
+`atualizar_total` grava o total de uma ordem num único UPDATE com subconsultas
+agregadas, sem trazer os itens para o Python. `recalcular_totais` corrige em
+lote, num único UPDATE ... FROM, as ordens cujo total diverge da soma dos
+itens (filtrável por empresa/filial e status). Os dois marcam orde_ulti_alte,
+para a sincronização incremental entregar o novo total.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import connections
+
+from ..models import Ordemservico, Ordemservicopecas, Ordemservicoservicos
+
+Tabelas = namedtuple('Tabelas', 'ordens pecas servicos')
+
+
+def tabelas():
+    return Tabelas(
+        Ordemservico._meta.db_table,
+        Ordemservicopecas._meta.db_table,
+        Ordemservicoservicos._meta.db_table,
+    )
+
+
+def _soma_itens(q, t, empr, fili, nume):
+    """Expressão escalar com a soma dos itens de uma ordem (colunas/valores passados como SQL)."""
+    return (
+        f"COALESCE((SELECT SUM(peca_tota) FROM {q(t.pecas)} "
+        f"WHERE peca_empr = {empr} AND peca_fili = {fili} AND peca_orde = {nume}), 0) + "
+        f"COALESCE((SELECT SUM(serv_tota) FROM {q(t.servicos)} "
+        f"WHERE serv_empr = {empr} AND serv_fili = {fili} AND serv_orde = {nume}), 0)"
+    )
+
+
+def calcular_total(banco, ordem, t=None):
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    t = t or tabelas()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {_soma_itens(q, t, '%s', '%s', '%s')}",
+            [ordem.orde_empr, ordem.orde_fili, ordem.orde_nume] * 2,
+        )
+        return cursor.fetchone()[0] or Decimal('0')
+
+
+def atualizar_total(banco, ordem, t=None):
+    """Recalcula e grava orde_tota da ordem numa única instrução; devolve o total."""
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    t = t or tabelas()
+    o = q(t.ordens)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {o} SET orde_tota = {_soma_itens(q, t, f'{o}.orde_empr', f'{o}.orde_fili', f'{o}.orde_nume')}, "
+            "orde_ulti_alte = CURRENT_DATE "
+            f"WHERE orde_empr = %s AND orde_fili = %s AND orde_nume = %s RETURNING orde_tota, orde_ulti_alte",
+            [ordem.orde_empr, ordem.orde_fili, ordem.orde_nume],
+        )
+        row = cursor.fetchone()
+    if row is not None:
+        ordem.orde_tota, ordem.orde_ulti_alte = row
+    return ordem.orde_tota
+
+
+def _sql_divergentes(q, t, empresa=None, filial=None, status=None):
+    """SELECT (empr, fili, nume, total_calculado) das ordens com total divergente."""
+    filtros, params = [], []
+    filtros_p, filtros_s = [], []
+    if empresa is not None:
+        filtros.append("o.orde_empr = %s")
+        filtros_p.append("peca_empr = %s")
+        filtros_s.append("serv_empr = %s")
+        params.append(empresa)
+    if filial is not None:
+        filtros.append("o.orde_fili = %s")
+        filtros_p.append("peca_fili = %s")
+        filtros_s.append("serv_fili = %s")
+        params.append(filial)
+
+    status_params = []
+    if status is not None:
+        filtros.append(f"o.orde_stat_orde IN ({', '.join(['%s'] * len(status))})")
+        status_params = list(status)
+
+    def where(lista):
+        return f"WHERE {' AND '.join(lista)}" if lista else ""
+
+    sql = (
+        "SELECT o.orde_empr, o.orde_fili, o.orde_nume, "
+        "COALESCE(p.total, 0) + COALESCE(s.total, 0) AS total "
+        f"FROM {q(t.ordens)} o "
+        f"LEFT JOIN (SELECT peca_empr, peca_fili, peca_orde, SUM(peca_tota) AS total "
+        f"FROM {q(t.pecas)} {where(filtros_p)} GROUP BY 1, 2, 3) p "
+        "ON p.peca_empr = o.orde_empr AND p.peca_fili = o.orde_fili AND p.peca_orde = o.orde_nume "
+        f"LEFT JOIN (SELECT serv_empr, serv_fili, serv_orde, SUM(serv_tota) AS total "
+        f"FROM {q(t.servicos)} {where(filtros_s)} GROUP BY 1, 2, 3) s "
+        "ON s.serv_empr = o.orde_empr AND s.serv_fili = o.orde_fili AND s.serv_orde = o.orde_nume "
+        f"WHERE o.orde_tota IS DISTINCT FROM COALESCE(p.total, 0) + COALESCE(s.total, 0)"
+        + (f" AND {' AND '.join(filtros)}" if filtros else "")
+    )
+    # Os parâmetros aparecem na ordem: subconsulta de peças, de serviços, ordens
+    return sql, params * 3 + status_params
+
+
+def recalcular_totais(banco, empresa=None, filial=None, status=None, dry_run=False, t=None):
+    """
+    Corrige em um único UPDATE ... FROM os totais divergentes; devolve quantas
+    ordens mudaram (ou mudariam, com dry_run). `status` limita os status tocados.
+    """
+    connection = connections[banco]
+    q = connection.ops.quote_name
+    t = t or tabelas()
+    sql, params = _sql_divergentes(q, t, empresa, filial, status)
+    with connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) FROM ({sql}) d", params)
+            return cursor.fetchone()[0]
+        cursor.execute(
+            f"UPDATE {q(t.ordens)} AS os SET orde_tota = d.total, orde_ulti_alte = CURRENT_DATE FROM ({sql}) d "
+            "WHERE os.orde_empr = d.orde_empr AND os.orde_fili = d.orde_fili AND os.orde_nume = d.orde_nume",
+            params,
+        )
+        return cursor.rowcount
+
+
+def ddl_totais(connection):
+    """Índices das chaves (empresa, filial, ordem) dos itens, usados pelas somas."""
+    q = connection.ops.quote_name
+    t = tabelas()
+    return [
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(t.pecas + '_ordem_idx')} "
+        f"ON {q(t.pecas)} (peca_empr, peca_fili, peca_orde) INCLUDE (peca_tota)",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(t.servicos + '_ordem_idx')} "
+        f"ON {q(t.servicos)} (serv_empr, serv_fili, serv_orde) INCLUDE (serv_tota)",
+        f"ANALYZE {q(t.pecas)}",
+        f"ANALYZE {q(t.servicos)}",
+    ]
@@ -1,81 +1,104 @@
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework import status, filters
+from rest_framework.renderers import JSONRenderer
+from rest_framework import status, filters, serializers
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.db.models.expressions import RawSQL
 from .base import BaseMultiDBModelViewSet
-from ..models import Ordemservico, Ordemservicopecas, Ordemservicoservicos, OrdemServicoFaseSetor, Osarquivos
+from ..models import Ordemservico, Osarquivos
 from ..serializers import OrdemServicoSerializer, OsArquSerializer
 from ..filters.os import OrdemServicoFilter
 from ..pagination import OrdemServicoPagination
+from .ordem_cursor_pagination import OrdemServicoCursorPagination, HistoricoWorkflowCursorPagination
+from .datas_saneadas import STATUS_LISTAVEIS, select_datas, expressao_data, expressao_safe_data_aber
+from .ordem_loaders import carregar_relacionados
+from .ordem_lista import CAMPOS_RESUMO, campos_resumo_solicitados, queryset_resumo, serializar_resumo
 from ..permissions import OrdemServicoPermission, PodeVerOrdemDoSetor, WorkflowPermission
 from Entidades.models import Entidades
+from core import resolucao_banco
+from core.utils import get_licenca_db_config
+from core.replicas import LeituraReplicaMixin
+from core.instrumentacao import InstrumentacaoMixin
 
-from ..services import workflow_service, ordem_service, total_service
+from ..services import workflow_service, ordem_service
 from ..services.os_arquivo_service import OsArquivoService
+from . import preview_worker
+from .arquivo_download import campo_conteudo, resposta_download
+from . import upload_sessoes
+from .workflow_grafo import grafo_workflow
+from . import ordem_sync
+from . import ordem_etag
+from . import ordem_totais
+from . import ordem_itens
+from .historico_workflow import historico_arquivado
+from .busca_textual import BuscaTextualFilter
+from . import ordem_painel
+from . import ordem_exportacao
+from . import ordem_feed
 from ..handlers.dominio_handler import tratar_erro
-from django.db.models import Q, Case, When, Value, DateField
+from django.db.models import Q, Case, When, Value, DateField, Exists, OuterRef
 from Agricola.service.sequencial_Service import SequencialService
-import base64
 
 import logging
 logger = logging.getLogger(__name__)
 
+MAX_ORDENS_LOTE = 200
+
 class SafeOrderingFilter(filters.OrderingFilter):
     def get_ordering(self, request, queryset, view):
         ordering = super().get_ordering(request, queryset, view)
         if ordering:
-            return [o.replace('orde_data_aber', 'safe_data_aber') for o in ordering]
+            return [
+                o.replace('orde_data_aber', 'safe_data_aber').replace('orde_data_fech', 'safe_data_fech')
+                for o in ordering
+            ]
         return ordering
 
-class OrdemViewSet(BaseMultiDBModelViewSet):
+class OrdemViewSet(InstrumentacaoMixin, LeituraReplicaMixin, BaseMultiDBModelViewSet):
     queryset = Ordemservico.objects.none() 
     modulo_necessario = 'OrdemdeServico'
     serializer_class = OrdemServicoSerializer
     # queryset removed here as it is overridden by get_queryset
-    filter_backends = [DjangoFilterBackend, SafeOrderingFilter, filters.SearchFilter]
+    # BuscaTextualFilter: full-text em orde_busca; sem a coluna, cai no SearchFilter (search_fields)
+    filter_backends = [DjangoFilterBackend, SafeOrderingFilter, BuscaTextualFilter]
     filterset_class = OrdemServicoFilter
-    ordering_fields = ['orde_data_aber', 'safe_data_aber', 'orde_data_fech', 'orde_prio']
+    ordering_fields = ['orde_data_aber', 'safe_data_aber', 'orde_data_fech', 'safe_data_fech', 'orde_prio']
     search_fields = ['orde_prob', 'orde_defe_desc', 'orde_obse', 'orde_nume']
     permission_classes = [IsAuthenticated, OrdemServicoPermission, PodeVerOrdemDoSetor]
     pagination_class = OrdemServicoPagination
     lookup_field = "orde_nume"
+    # Ações de escrita que não alteram ordens nem anexos (não invalidam os ETags)
+    acoes_sem_invalidar = ("upload_sessao_criar", "upload_sessao", "upload_sessao_pedaco")
+    # Ações que só gravam anexos: invalidam apenas o ETag de arquivos da ordem (invalidar_arquivos)
+    acoes_so_arquivos = ("upload_arquivos", "upload_sessao_concluir")
 
-    def get_queryset(self):
-        banco = self.get_banco()
-        user_setor = getattr(self.request.user, 'setor', None)
+    def get_banco(self):
+        # get_licenca_db_config memoizado na requisição e por TTL (resolucao_banco)
+        return resolucao_banco.banco_da_requisicao(self.request, get_licenca_db_config)
 
-        qs = Ordemservico.objects.using(banco).filter(
-            orde_seto__isnull=False,
-            orde_stat_orde__in=[0, 1, 2, 3, 5, 21, 22]
-        ).exclude(orde_seto=0)
-        
+    def _queryset_saneado(self, banco):
         # Deferir todos os campos de data e hora propensos a erro para impedir leitura direta
-        qs = qs.defer(
+        qs = Ordemservico.objects.using(banco).defer(
             'orde_data_aber', 'orde_hora_aber', 
             'orde_data_fech', 'orde_hora_fech',
             'orde_nf_data', 'orde_ulti_alte', 'orde_data_repr'
         )
 
-        # Blindagem total via SQL puro — sem Case/When que avalia campos inválidos
-        qs = qs.extra(
-            select={
-                # CAST para TEXT impede psycopg2 de converter datas inválidas
-                'orde_data_aber': "CASE WHEN EXTRACT(YEAR FROM orde_data_aber) BETWEEN 2020 AND 2100 THEN orde_data_aber::text ELSE NULL END",
-                'orde_hora_aber': "orde_hora_aber::text",
-                'orde_data_fech': "CASE WHEN orde_data_fech IS NULL OR EXTRACT(YEAR FROM orde_data_fech) BETWEEN 2020 AND 2100 THEN orde_data_fech::text ELSE NULL END",
-                'orde_hora_fech': "orde_hora_fech::text",
-                'orde_nf_data':   "CASE WHEN orde_nf_data IS NULL OR EXTRACT(YEAR FROM orde_nf_data) BETWEEN 2020 AND 2100 THEN orde_nf_data::text ELSE NULL END",
-                'orde_ulti_alte': "CASE WHEN orde_ulti_alte IS NULL OR EXTRACT(YEAR FROM orde_ulti_alte) BETWEEN 2020 AND 2100 THEN orde_ulti_alte::text ELSE NULL END",
-                'orde_data_repr': "CASE WHEN orde_data_repr IS NULL OR EXTRACT(YEAR FROM orde_data_repr) BETWEEN 2020 AND 2100 THEN orde_data_repr::text ELSE NULL END",
-                'safe_data_aber': "CASE WHEN EXTRACT(YEAR FROM orde_data_aber) BETWEEN 2020 AND 2100 THEN orde_data_aber::text ELSE NULL END",
-            }
-        )
+        # Colunas *_safe indexadas quando o banco já passou por otimizar_banco_os;
+        # senão, blindagem via CASE/EXTRACT (ver datas_saneadas.SELECT_LEGADO)
+        return qs.extra(select=select_datas(banco))
+
+    def get_queryset(self):
+        # GET vai para a réplica do tenant, se houver (replicas.alias_leitura)
+        banco = self.get_banco_leitura()
 
-        if user_setor and getattr(user_setor, "osfs_codi", None):
-            qs = qs.filter(orde_seto=user_setor.osfs_codi)
+        qs = self._filtrar_setor_usuario(self._queryset_saneado(banco).filter(
+            orde_seto__isnull=False,
+            orde_stat_orde__in=STATUS_LISTAVEIS
+        ).exclude(orde_seto=0))
 
         orde_nume = self.request.query_params.get('orde_nume')
         if orde_nume:
@@ -83,75 +106,194 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
 
         cliente_nome = self.request.query_params.get('cliente_nome')
         if cliente_nome:
-            entidades_ids = list(
-                Entidades.objects.using(banco)
-                .filter(enti_nome__icontains=cliente_nome)
-                .values_list('enti_clie', flat=True)
-            )
-            if entidades_ids:
-                qs = qs.filter(orde_enti__in=entidades_ids)
+            # Semi-join no próprio banco (índice trigram em UPPER(enti_nome)), sem trafegar ids.
+            # Se nenhum cliente corresponder o filtro é ignorado, como sempre foi.
+            entidades = Entidades.objects.using(banco).filter(enti_nome__icontains=cliente_nome)
+            if entidades.exists():
+                qs = qs.filter(Exists(entidades.filter(
+                    enti_empr=OuterRef('orde_empr'),
+                    enti_clie=OuterRef('orde_enti'),
+                )))
+
+        return qs.order_by('-safe_data_aber', '-orde_empr', '-orde_fili', '-orde_nume')
+
+    def _setor_usuario(self):
+        return getattr(getattr(self.request.user, 'setor', None), "osfs_codi", None)
+
+    def _filtrar_setor_usuario(self, qs):
+        setor = self._setor_usuario()
+        if setor:
+            qs = qs.filter(orde_seto=setor)
+        return qs
+
+    def get_safe_data_aber_sql(self):
+        return expressao_safe_data_aber(self.get_banco())
 
-        logger.warning(f"[DEBUG COUNT] {qs.count()} registros")
-        
+    @property
+    def paginator(self):
+        # ?cursor=... ou ?paginacao=cursor ativam a paginação keyset na listagem e no histórico
+        if not hasattr(self, '_paginator') and self._usa_paginacao_cursor():
+            if self.action == 'historico_workflow':
+                self._paginator = HistoricoWorkflowCursorPagination()
+            else:
+                self._paginator = OrdemServicoCursorPagination()
+        return super().paginator
 
-        return qs.order_by('-safe_data_aber', '-orde_nume')
+    def _usa_paginacao_cursor(self):
+        if self.action not in ('list', 'historico_workflow'):
+            return False
+        params = self.request.query_params
+        return 'cursor' in params or params.get('paginacao') == 'cursor'
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Qualquer escrita bem-sucedida invalida os ETags do banco (inclui os update() dos services);
+        # abrir, enviar pedaços e cancelar sessões de upload não mexem em ordens nem anexos
+        if (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and 200 <= getattr(response, 'status_code', 500) < 300
+            and getattr(self, 'action', None) not in self.acoes_sem_invalidar + self.acoes_so_arquivos
+        ):
+            try:
+                ordem_etag.invalidar(self.get_banco())
+            except Exception as e:
+                logger.warning(f"[ETAG] falha ao invalidar versão: {e}")
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def _com_etag(self, impressao, gerar):
+        """
+        Responde 304 se o If-None-Match confere com o ETag calculado a partir de
+        `impressao()` (dados já lidos ou consulta pequena); senão gera a resposta
+        e anexa o ETag.
+        """
+        if not ordem_etag.ativo():
+            return gerar()
+        # Posição da réplica antes das impressões: o corpo nunca fica mais velho que o ETag
+        leitura = self.impressao_leitura()
+        etag = ordem_etag.calcular(*ordem_etag.contexto(self.request, self.get_banco()), leitura, *impressao())
+        if ordem_etag.corresponde(self.request, etag):
+            return ordem_etag.nao_modificado(etag)
+        response = gerar()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+        return response
 
     def list(self, request, *args, **kwargs):
+        campos = campos_resumo_solicitados(request)
         queryset = self.filter_queryset(self.get_queryset())
+        if campos is not None:
+            queryset = queryset_resumo(queryset, campos)
 
+        # A página é lida uma vez: suas chaves formam o ETag e, sem 304, ela é serializada
         page = self.paginate_queryset(queryset)
-        if page is not None:
-            self._prefetch_related_objects(page)
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        linhas = page if page is not None else list(queryset)
+        if campos is not None:
+            gerar = lambda: self._list_resumo(linhas, page is not None, campos)
+        else:
+            gerar = lambda: self._list_completo(linhas, page is not None)
+        return self._com_etag(lambda: ordem_etag.impressao_lista(linhas, self._total_paginador()), gerar)
+
+    def _total_paginador(self):
+        pagina = getattr(self.paginator, 'page', None)
+        return getattr(getattr(pagina, 'paginator', None), 'count', None)
 
-        self._prefetch_related_objects(queryset)
-        serializer = self.get_serializer(queryset, many=True)
+    def _list_completo(self, linhas, paginado):
+        self._prefetch_related_objects(linhas)
+        serializer = self.get_serializer(linhas, many=True)
+        if paginado:
+            return self.get_paginated_response(serializer.data)
         return Response(serializer.data)
 
+    def _list_resumo(self, linhas, paginado, campos):
+        banco = self.get_banco_leitura()
+
+        # Sem peças/serviços: só os nomes de setor/cliente que foram pedidos
+        nomes = [n for n, c in (('setores', 'setor_nome'), ('clientes', 'cliente_nome')) if c in campos]
+        mapas = {}
+        if nomes:
+            mapas, self._tempos_prefetch = carregar_relacionados(banco, linhas, nomes=nomes)
+        with self.medir_serializacao():
+            data = serializar_resumo(linhas, mapas, campos)
+
+        if paginado:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        banco = self.get_banco_leitura()
+
+        def gerar():
+            self._prefetch_related_objects([instance])
+            return Response(self.get_serializer(instance).data)
+
+        return self._com_etag(lambda: ordem_etag.impressao_ordem(banco, instance), gerar)
+
+    @action(detail=False, methods=["get"], url_path="alteracoes")
+    def alteracoes(self, request, *args, **kwargs):
+        """
+        Sincronização incremental: ordens criadas, alteradas ou movidas desde
+        `desde` (inclusive), com peças e serviços, e marcas de remoção das que
+        saíram da listagem do usuário (fechadas, sem setor ou fora do setor dele).
+        Quem tem setor só recebe ordens do próprio setor, como na listagem.
+        Exemplo: ?desde=2025-03-01T10:00:00&limite=200
+        Repita com o `cursor` devolvido até ele vir nulo e guarde o `watermark`
+        como `desde` da próxima sincronização. Sem `desde`, devolve toda a
+        listagem do usuário, sem marcas de remoção.
+        """
+        try:
+            banco = self.get_banco()
+            desde = ordem_sync.normalizar_desde(request.query_params.get("desde"))
+            tamanho = ordem_sync.limite(request.query_params.get("limite"))
+
+            setor = self._setor_usuario()
+            qs = self.filter_queryset(ordem_sync.escopo(self._queryset_saneado(self.get_banco_leitura()), setor, desde))
+            linhas = list(ordem_sync.filtrar(
+                qs, expressao_data(banco, 'orde_ulti_alte'), desde,
+                request.query_params.get("cursor"), tamanho,
+            ))
+            tem_mais = len(linhas) > tamanho
+            linhas = linhas[:tamanho]
+
+            visiveis, removidas = [], []
+            for ordem in linhas:
+                motivo = ordem_sync.motivo_remocao(ordem, setor)
+                if motivo:
+                    removidas.append(ordem_sync.marca_remocao(ordem, motivo))
+                else:
+                    visiveis.append(ordem)
+
+            self._prefetch_related_objects(visiveis)
+            ultima = linhas[-1] if linhas else None
+            return Response({
+                "ordens": self.get_serializer(visiveis, many=True).data,
+                "removidas": removidas,
+                "cursor": ordem_sync.codificar_cursor(
+                    ultima.sync_chave, ultima.orde_empr, ultima.orde_fili, ultima.orde_nume,
+                ) if tem_mais else None,
+                "watermark": ordem_sync.watermark(linhas, desde),
+            })
+        except ordem_sync.SyncErro as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return tratar_erro(e)
+
     def _prefetch_related_objects(self, objects):
         if not objects:
             return
-            
-        banco = self.get_banco()
-        # Collect IDs
-        orde_ids = [obj.orde_nume for obj in objects]
-        
-        # Prefetch Pecas
-        pecas = Ordemservicopecas.objects.using(banco).filter(peca_orde__in=orde_ids)
-        pecas_map = {}
-        for peca in pecas:
-            if peca.peca_orde not in pecas_map:
-                pecas_map[peca.peca_orde] = []
-            pecas_map[peca.peca_orde].append(peca)
-            
-        # Prefetch Servicos
-        servicos = Ordemservicoservicos.objects.using(banco).filter(serv_orde__in=orde_ids)
-        servicos_map = {}
-        for serv in servicos:
-            if serv.serv_orde not in servicos_map:
-                servicos_map[serv.serv_orde] = []
-            servicos_map[serv.serv_orde].append(serv)
-
-        # Prefetch Setores
-        setor_ids = set(obj.orde_seto for obj in objects if obj.orde_seto)
-        setores = OrdemServicoFaseSetor.objects.using(banco).filter(osfs_codi__in=setor_ids)
-        setores_map = {s.osfs_codi: s.osfs_nome for s in setores}
-
-        # Prefetch Clientes
-        clie_ids = set(obj.orde_enti for obj in objects if obj.orde_enti)
-        # Assuming Entidades is accessible via orde_enti/enti_clie + orde_empr/enti_empr
-        clientes = Entidades.objects.using(banco).filter(enti_clie__in=clie_ids)
-        clientes_map = {}
-        for c in clientes:
-            clientes_map[(c.enti_empr, c.enti_clie)] = c.enti_nome
+
+        banco = self.get_banco_leitura()
+        mapas, tempos = carregar_relacionados(banco, objects)
+        self._tempos_prefetch = tempos
+        logger.info("[PREFETCH OS] " + " ".join(f"{nome}={ms:.1f}ms" for nome, ms in tempos.items()))
 
         # Assign to objects
         for obj in objects:
-            obj._prefetched_pecas = pecas_map.get(obj.orde_nume, [])
-            obj._prefetched_servicos = servicos_map.get(obj.orde_nume, [])
-            obj._prefetched_setor_nome = setores_map.get(obj.orde_seto)
-            obj._prefetched_cliente_nome = clientes_map.get((obj.orde_empr, obj.orde_enti))
+            chave = (obj.orde_empr, obj.orde_fili, obj.orde_nume)
+            obj._prefetched_pecas = mapas['pecas'].get(chave, [])
+            obj._prefetched_servicos = mapas['servicos'].get(chave, [])
+            obj._prefetched_setor_nome = mapas['setores'].get(obj.orde_seto)
+            obj._prefetched_cliente_nome = mapas['clientes'].get((obj.orde_empr, obj.orde_enti))
 
     def get_next_ordem_numero(self, empre, fili, data):
         """
@@ -216,58 +358,81 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
                 data['orde_nume'] = self.get_next_ordem_numero(empre, fili, data)
             except ValueError as ve:
                  return Response({"detail": str(ve)}, status=400)
-            
+
             # Injetar chaves estrangeiras nos itens para passar na validação do serializer
             # O Serializer valida a presença de peca_empr, peca_fili, peca_orde, etc.
-            if 'pecas' in data and isinstance(data['pecas'], list):
-                for peca in data['pecas']:
-                    if isinstance(peca, dict):
-                        peca['peca_empr'] = empre
-                        peca['peca_fili'] = fili
-                        peca['peca_orde'] = data['orde_nume']
-            
-            if 'servicos' in data and isinstance(data['servicos'], list):
-                for servico in data['servicos']:
-                    if isinstance(servico, dict):
-                        servico['serv_empr'] = empre
-                        servico['serv_fili'] = fili
-                        servico['serv_orde'] = data['orde_nume']
-
-            # Validação via Serializer para garantir integridade dos dados
-            serializer = self.get_serializer(data=data)
+            self._injetar_chaves_itens(data, empre, fili, data['orde_nume'])
+
+            # Validação via Serializer para garantir integridade dos dados.
+            # A ordem é nova: a checagem de duplicidade item a item no banco não tem o que
+            # encontrar, e as conferências da lista inteira ficam com ordem_itens (uma consulta)
+            context = self.get_serializer_context()
+            context['skip_duplicate_check'] = True
+            serializer = self.get_serializer(data=data, context=context)
             serializer.is_valid(raise_exception=True)
             validated_data = serializer.validated_data
-            
+
             # Extrai peças e serviços validados
             pecas_data = validated_data.pop('pecas', [])
             servicos_data = validated_data.pop('servicos', [])
-            
-            # Como o serializer retorna OrderedDicts, podemos passar adiante.
-            # O service e repo esperam dicionários, OrderedDict é compatível.
-            
+
+            # Um só caminho para qualquer quantidade de itens: bulk_create, ids e total
+            # pelas mesmas regras do update (ordem_itens / ordem_totais)
+            return self._criar_com_itens(request, banco, validated_data, pecas_data, servicos_data)
+        except ordem_itens.ItensErro as e:
+            return Response(e.payload, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return tratar_erro(e)
+
+    def _injetar_chaves_itens(self, data, empre, fili, nume):
+        for espec in (ordem_itens.PECAS, ordem_itens.SERVICOS):
+            itens = data.get(espec.nome)
+            if not isinstance(itens, list):
+                continue
+            for item in itens:
+                if isinstance(item, dict):
+                    item[ordem_itens.campo(espec, 'empr')] = empre
+                    item[ordem_itens.campo(espec, 'fili')] = fili
+                    item[ordem_itens.campo(espec, 'orde')] = nume
+
+    def _criar_com_itens(self, request, banco, validated_data, pecas_data, servicos_data):
+        empre = validated_data.get('orde_empr')
+        fili = validated_data.get('orde_fili')
+        nume = validated_data.get('orde_nume')
+
+        # Conferências da lista inteira antes de abrir a transação: nenhum erro grava nada
+        pecas = ordem_itens.preparar(ordem_itens.PECAS, pecas_data, empre, fili, nume)
+        servicos = ordem_itens.preparar(ordem_itens.SERVICOS, servicos_data, empre, fili, nume)
+        ordem_itens.validar_produtos(banco, empre, ordem_itens.codigos(ordem_itens.PECAS, pecas))
+
+        with transaction.atomic(using=banco):
             ordem = ordem_service.criar_ordem_servico(
                 dados=validated_data,
-                pecas_data=pecas_data,
-                servicos_data=servicos_data,
+                pecas_data=[],
+                servicos_data=[],
                 usuario=request.user,
                 banco=banco
             )
-            
-            serializer = self.get_serializer(ordem)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-        except Exception as e:
-            return tratar_erro(e)
+            ordem_itens.criar_itens(banco, ordem, pecas, servicos)
+            ordem_totais.atualizar_total(banco, ordem)
+            ordem_feed.publicar(banco, "criada", ordem)
+
+        self._prefetch_related_objects([ordem])
+        serializer = self.get_serializer(ordem)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     def update(self, request, *args, **kwargs):
         try:
             banco = self.get_banco()
             instance = self.get_object()
+            setor_anterior = instance.orde_seto
             data = request.data.copy() if hasattr(request.data, 'copy') else dict(request.data)
-            
+            self._injetar_chaves_itens(data, instance.orde_empr, instance.orde_fili, instance.orde_nume)
+
             # Para update, também validamos
             # Adicionamos skip_duplicate_check ao contexto para permitir que a validação de duplicidade
-            # seja ignorada neste nível, delegando a resolução para o sync_pecas/sync_servicos
+            # seja ignorada neste nível: ordem_itens.sincronizar casa as linhas por peca_id/serv_id
             context = self.get_serializer_context()
             context['skip_duplicate_check'] = True
             
@@ -275,23 +440,88 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
             serializer.is_valid(raise_exception=True)
             validated_data = serializer.validated_data
 
-            pecas_data = validated_data.pop('pecas', None)
-            servicos_data = validated_data.pop('servicos', None)
-            
-            ordem = ordem_service.atualizar_ordem_servico(
-                ordem=instance,
-                dados=validated_data,
-                pecas_data=pecas_data,
-                servicos_data=servicos_data,
-                usuario=request.user,
-                banco=banco
-            )
+            # Itens já validados gravados por diferença (ordem_itens.sincronizar): só o que mudou é escrito
+            itens = {
+                espec: ordem_itens.com_ids(espec, data.get(espec.nome), validated_data.pop(espec.nome))
+                for espec in (ordem_itens.PECAS, ordem_itens.SERVICOS)
+                if validated_data.get(espec.nome) is not None
+            }
+
+            with transaction.atomic(using=banco):
+                ordem = ordem_service.atualizar_ordem_servico(
+                    ordem=instance,
+                    dados=validated_data,
+                    pecas_data=None,
+                    servicos_data=None,
+                    usuario=request.user,
+                    banco=banco
+                )
+                if itens:
+                    for espec, lista in itens.items():
+                        ordem_itens.sincronizar(banco, espec, ordem, lista)
+                    ordem_totais.atualizar_total(banco, ordem)
+                ordem_feed.publicar(banco, "alterada", ordem, setor_anterior)
             
             serializer = self.get_serializer(ordem)
             return Response(serializer.data)
+        except ordem_itens.ItensErro as e:
+            return Response(e.payload, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=True, methods=["patch"], url_path="itens")
+    def itens(self, request, *args, **kwargs):
+        """
+        Alteração parcial dos itens: só as linhas enviadas são gravadas.
+        Corpo: {"pecas": {"upsert": [...], "remover": [peca_id, ...]},
+                "servicos": {"upsert": [...], "remover": [serv_id, ...]}}
+        Item do upsert com peca_id/serv_id altera essa linha; sem id, é incluído.
+        """
+        try:
+            banco = self.get_banco()
+            ordem = self.get_object()
+            deltas = {
+                espec: request.data[espec.nome]
+                for espec in (ordem_itens.PECAS, ordem_itens.SERVICOS)
+                if espec.nome in request.data
+            }
+            if not deltas:
+                return Response({"erro": "campo_obrigatorio", "campo": "pecas/servicos"}, status=status.HTTP_400_BAD_REQUEST)
+            for espec, delta in deltas.items():
+                if not isinstance(delta, dict):
+                    raise ordem_itens.ItensErro(espec.nome, [{"erro": "delta_invalido"}])
+
+            # Os itens do upsert passam pela mesma validação do serializer que o update
+            data = {espec.nome: list(delta.get("upsert") or []) for espec, delta in deltas.items()}
+            self._injetar_chaves_itens(data, ordem.orde_empr, ordem.orde_fili, ordem.orde_nume)
+            context = self.get_serializer_context()
+            context['skip_duplicate_check'] = True
+            serializer = self.get_serializer(ordem, data=data, partial=True, context=context)
+            serializer.is_valid(raise_exception=True)
+            for espec, delta in deltas.items():
+                deltas[espec] = dict(delta, upsert=ordem_itens.com_ids(
+                    espec, data[espec.nome], serializer.validated_data.get(espec.nome) or []
+                ))
+
+            resumo = {}
+            with transaction.atomic(using=banco):
+                for espec, delta in deltas.items():
+                    resumo[espec.nome] = ordem_itens.aplicar_delta(banco, espec, ordem, delta)
+                ordem_totais.atualizar_total(banco, ordem)
+                ordem_feed.publicar(banco, "itens", ordem)
+
+            self._prefetch_related_objects([ordem])
+            return Response({"resumo": resumo, "ordem": self.get_serializer(ordem).data})
+        except ordem_itens.ItensErro as e:
+            return Response(e.payload, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return tratar_erro(e)
 
+    def _setor_movido(self, banco, ordem, setor_anterior):
+        # A mudança de setor também conta como alteração para a sincronização incremental
+        ordem.save(using=banco, update_fields=[ordem_sync.marcar_alterada(ordem)])
+        ordem_feed.publicar(banco, "setor", ordem, setor_anterior)
+
     @action(detail=True, methods=["post"], url_path="avancar-setor", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor, WorkflowPermission])
     def avancar_setor(self, request, *args, **kwargs):
         banco = self.get_banco()
@@ -305,6 +535,12 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
             )
 
         try:
+            if not grafo_workflow(banco, ordem.orde_empr, ordem.orde_fili).permite_avancar(ordem.orde_seto, setor_destino):
+                return Response(
+                    {"erro": "transicao_invalida", "setor_atual": ordem.orde_seto, "setor_destino": setor_destino},
+                    status=400
+                )
+            setor_anterior = ordem.orde_seto
             with transaction.atomic(using=banco):
                 ordem = workflow_service.avancar_setor(
                     ordem_model=ordem,
@@ -312,6 +548,7 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
                     usuario=request.user,
                     banco=banco
                 )
+                self._setor_movido(banco, ordem, setor_anterior)
             return Response(self.get_serializer(ordem).data)
         except Exception as e:
             return tratar_erro(e)
@@ -329,6 +566,12 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
             )
 
         try:
+            if not grafo_workflow(banco, ordem.orde_empr, ordem.orde_fili).permite_retornar(ordem.orde_seto, setor_origem):
+                return Response(
+                    {"erro": "transicao_invalida", "setor_atual": ordem.orde_seto, "setor_origem": setor_origem},
+                    status=400
+                )
+            setor_anterior = ordem.orde_seto
             with transaction.atomic(using=banco):
                 ordem = workflow_service.retornar_setor(
                     ordem_model=ordem,
@@ -336,16 +579,225 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
                     usuario=request.user,
                     banco=banco
                 )
+                self._setor_movido(banco, ordem, setor_anterior)
             return Response(self.get_serializer(ordem).data)
         except Exception as e:
             return tratar_erro(e)
 
+    @action(detail=False, methods=["post"], url_path="mover-setor-lote", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor, WorkflowPermission])
+    def mover_setor_lote(self, request, *args, **kwargs):
+        """
+        Avança (ou retorna) várias ordens para o mesmo setor numa única transação.
+        Exemplo JSON:
+        {
+            "orde_empr": 1,
+            "orde_fili": 1,
+            "ordens": [1201, 1202, 1203],
+            "setor_destino": 4,
+            "retornar": false
+        }
+        Cada ordem roda num savepoint: as inválidas ou com erro não impedem as demais.
+        """
+        try:
+            banco = self.get_banco()
+            numeros = request.data.get("ordens")
+            setor_destino = request.data.get("setor_destino")
+            empresa = request.data.get("orde_empr")
+            filial = request.data.get("orde_fili")
+            try:
+                retornar = serializers.BooleanField().to_internal_value(request.data.get("retornar", False))
+            except serializers.ValidationError:
+                return Response({"erro": "valor_invalido", "campo": "retornar"}, status=400)
+
+            for campo, valor in (("orde_empr", empresa), ("orde_fili", filial), ("setor_destino", setor_destino)):
+                if not valor:
+                    return Response({"erro": "campo_obrigatorio", "campo": campo}, status=400)
+            if not isinstance(numeros, list) or not numeros:
+                return Response({"erro": "campo_obrigatorio", "campo": "ordens"}, status=400)
+            numeros = list(dict.fromkeys(numeros))
+            if len(numeros) > MAX_ORDENS_LOTE:
+                return Response({"erro": "limite_excedido", "maximo": MAX_ORDENS_LOTE}, status=400)
+
+            ordens = {
+                str(o.orde_nume): o
+                for o in self.filter_queryset(self.get_queryset()).filter(
+                    orde_empr=empresa, orde_fili=filial, orde_nume__in=numeros
+                )
+            }
+
+            grafo = grafo_workflow(banco, empresa, filial)
+            resultados = {}
+            validas = []
+            for numero in numeros:
+                ordem = ordens.get(str(numero))
+                if ordem is None:
+                    resultados[str(numero)] = {"orde_nume": numero, "ok": False, "erro": "nao_encontrada"}
+                    continue
+                try:
+                    self.check_object_permissions(request, ordem)
+                except Exception:
+                    resultados[str(numero)] = {"orde_nume": numero, "ok": False, "erro": "sem_permissao"}
+                    continue
+                if retornar:
+                    permitida = grafo.permite_retornar(ordem.orde_seto, setor_destino)
+                else:
+                    permitida = grafo.permite_avancar(ordem.orde_seto, setor_destino)
+                if not permitida:
+                    resultados[str(numero)] = {
+                        "orde_nume": numero, "ok": False, "erro": "transicao_invalida",
+                        "setor_atual": ordem.orde_seto,
+                    }
+                    continue
+                validas.append((numero, ordem))
+
+            with transaction.atomic(using=banco):
+                for numero, ordem in validas:
+                    setor_anterior = ordem.orde_seto
+                    try:
+                        with transaction.atomic(using=banco):
+                            if retornar:
+                                ordem = workflow_service.retornar_setor(
+                                    ordem_model=ordem, setor_origem=setor_destino,
+                                    usuario=request.user, banco=banco,
+                                )
+                            else:
+                                ordem = workflow_service.avancar_setor(
+                                    ordem_model=ordem, setor_destino=setor_destino,
+                                    usuario=request.user, banco=banco,
+                                )
+                            self._setor_movido(banco, ordem, setor_anterior)
+                        resultados[str(numero)] = {
+                            "orde_nume": numero, "ok": True,
+                            "setor_anterior": setor_anterior, "setor_atual": ordem.orde_seto,
+                        }
+                    except Exception as e:
+                        # Mesmos códigos de erro das ações individuais (avancar/retornar)
+                        resposta = tratar_erro(e)
+                        resultados[str(numero)] = {
+                            "orde_nume": numero, "ok": False, **resposta.data, "status": resposta.status_code,
+                        }
+
+            lista = [resultados[str(n)] for n in numeros]
+            return Response({
+                "movidas": sum(1 for r in lista if r["ok"]),
+                "falhas": sum(1 for r in lista if not r["ok"]),
+                "resultados": lista,
+            })
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=False, methods=["get"], url_path="exportar")
+    def exportar(self, request, *args, **kwargs):
+        """
+        Exporta a listagem (mesmos filtros, busca e ordenação) em streaming.
+        ?formato=csv|xlsx (padrão csv) e ?fields=a,b,c (padrão: campos do resumo).
+        Sem paginação e sem COUNT: as linhas saem de um cursor do servidor.
+        """
+        try:
+            banco = self.get_banco()
+            formato = request.query_params.get("formato", "csv")
+            if formato not in ordem_exportacao.GERADORES:
+                return Response({"erro": "formato_invalido", "campo": "formato"}, status=status.HTTP_400_BAD_REQUEST)
+
+            campos = campos_resumo_solicitados(request) or list(CAMPOS_RESUMO)
+            queryset = queryset_resumo(self.filter_queryset(self.get_queryset()), campos)
+            linhas = ordem_exportacao.linhas_exportacao(self.get_banco_leitura(), queryset, campos)
+
+            response = StreamingHttpResponse(
+                ordem_exportacao.GERADORES[formato](linhas, campos),
+                content_type=ordem_exportacao.CONTENT_TYPES[formato],
+            )
+            response["Content-Disposition"] = f'attachment; filename="ordens.{formato}"'
+            response["Cache-Control"] = "no-store"
+            return response
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=False, methods=["get"], url_path="painel")
+    def painel(self, request, *args, **kwargs):
+        """
+        Contagens por setor × status, com abertura mais antiga e soma dos totais,
+        no mesmo escopo da listagem (banco, setor do usuário e filtros da query).
+        Calculado num GROUP BY e guardado em cache curto por banco.
+        """
+        try:
+            banco = self.get_banco()
+            user_setor = getattr(request.user, 'setor', None)
+            partes = (
+                getattr(user_setor, "osfs_codi", None) if user_setor else None,
+                sorted(request.query_params.items()),
+            )
+            queryset = self.filter_queryset(self.get_queryset())
+            return Response(ordem_painel.obter(banco, partes, queryset, expressao_safe_data_aber(banco)))
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=False, methods=["get"], url_path="feed",
+            renderer_classes=[JSONRenderer, ordem_feed.EventStreamRenderer])
+    def feed(self, request, *args, **kwargs):
+        """
+        Eventos de alteração das ordens do banco, filtrados pelo setor do usuário.
+        Long-poll: ?desde=<id>&timeout=<s> espera até chegar evento ou esgotar o
+        timeout e devolve {"eventos", "ultimo"}; guarde `ultimo` como o próximo
+        `desde`. Sem `desde`, devolve só o `ultimo` atual, sem esperar.
+        Com "reiniciar": true o cliente ficou para trás e deve recarregar a lista.
+        Com Accept: text/event-stream (ou ?sse=1) responde em SSE; o
+        Last-Event-ID do navegador retoma de onde parou.
+        Esperas simultâneas por processo são limitadas (OS_FEED_MAX_CONEXOES):
+        sem vaga o long-poll responde na hora e o SSE recebe 503.
+        """
+        try:
+            banco = self.get_banco()
+            setores = ordem_feed.setores_do_usuario(request.user)
+            desde = request.query_params.get("desde") or request.META.get("HTTP_LAST_EVENT_ID")
+            try:
+                desde = int(desde) if desde not in (None, "") else None
+                timeout = ordem_feed.ler_timeout(request.query_params.get("timeout"))
+            except ValueError:
+                return Response({"erro": "parametro_invalido", "campo": "desde/timeout"}, status=status.HTTP_400_BAD_REQUEST)
+
+            broker = ordem_feed.broker()
+            if desde is None:
+                desde = broker.ultimo(banco)
+                if not self._quer_sse(request):
+                    return Response({"eventos": [], "ultimo": desde, "reiniciar": False})
+
+            if self._quer_sse(request):
+                if not ordem_feed.ocupar_vaga():
+                    resposta = Response({"erro": "feed_ocupado"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                    resposta["Retry-After"] = str(ordem_feed.timeout_padrao())
+                    return resposta
+                # A vaga volta quando o Django fecha a resposta (FluxoSSE.close)
+                resposta = StreamingHttpResponse(
+                    ordem_feed.FluxoSSE(ordem_feed.gerar_sse(banco, desde, setores)),
+                    content_type="text/event-stream",
+                )
+                resposta["Cache-Control"] = "no-cache"
+                resposta["X-Accel-Buffering"] = "no"
+                return resposta
+
+            esperando = ordem_feed.ocupar_vaga()
+            try:
+                eventos, ultimo = broker.aguardar(banco, desde, setores, timeout=timeout if esperando else 0)
+            finally:
+                if esperando:
+                    ordem_feed.liberar_vaga()
+            return Response({"eventos": eventos or [], "ultimo": ultimo, "reiniciar": eventos is None})
+        except Exception as e:
+            return tratar_erro(e)
+
+    def _quer_sse(self, request):
+        return (
+            request.query_params.get("sse") in ("1", "true")
+            or "text/event-stream" in request.META.get("HTTP_ACCEPT", "")
+        )
+
     @action(detail=True, methods=["get"], url_path="proximos-setores", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor, WorkflowPermission])
     def proximos_setores(self, request, *args, **kwargs):
         try:
             banco = self.get_banco()
             ordem = self.get_object()
-            setores = workflow_service.listar_proximos_setores(ordem, banco)
+            setores = grafo_workflow(banco, ordem.orde_empr, ordem.orde_fili).proximos_setores(ordem.orde_seto)
             return Response({
                 "proximos_setores": [
                     {
@@ -364,7 +816,7 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
         try:
             banco = self.get_banco()
             ordem = self.get_object()
-            setores = workflow_service.listar_setores_anteriores(ordem, banco)
+            setores = grafo_workflow(banco, ordem.orde_empr, ordem.orde_fili).setores_anteriores(ordem.orde_seto)
             return Response({
                 "anteriores_setores": [
                     {
@@ -383,8 +835,8 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
             banco = self.get_banco()
             ordem = self.get_object()
             
-            # Assumindo que itens_lista retorna um queryset ou lista iterável de peças
-            total_service.atualizar_total(ordem, ordem.itens_lista, banco)
+            # orde_tota = soma de peca_tota + soma de serv_tota (a conta da aba Totais), num único UPDATE
+            ordem_totais.atualizar_total(banco, ordem)
             
             serializer = self.get_serializer(ordem)
             return Response(serializer.data)
@@ -418,7 +870,8 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
 
             with transaction.atomic(using=banco):
                 ordem.orde_prio = int(nova_prioridade)
-                ordem.save(using=banco, update_fields=["orde_prio"])
+                ordem.save(using=banco, update_fields=["orde_prio", ordem_sync.marcar_alterada(ordem)])
+                ordem_feed.publicar(banco, "prioridade", ordem)
             serializer = self.get_serializer(ordem)
             return Response(
                 {
@@ -448,7 +901,8 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
 
             with transaction.atomic(using=banco):
                 ordem.orde_stat_orde = 22
-                ordem.save(using=banco, update_fields=["orde_stat_orde"])
+                ordem.save(using=banco, update_fields=["orde_stat_orde", ordem_sync.marcar_alterada(ordem)])
+                ordem_feed.publicar(banco, "status", ordem)
 
             serializer = self.get_serializer(ordem)
             return Response(
@@ -467,28 +921,38 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
     def historico_workflow(self, request, *args, **kwargs):
         """
         Retorna o histórico de workflow da ordem.
+        ?paginacao=cursor (ou ?cursor=...) pagina por (oswh_data, id) sem OFFSET;
+        ?arquivo=1 devolve também as linhas já arquivadas, sem paginação.
         """
         try:
-            banco = self.get_banco()
+            banco = self.get_banco_leitura()
             ordem = self.get_object()
             
             # Importação local para evitar importação circular
             from ..models import Ordemservicoworkflowhistorico
             from ..serializers import HistoricoWorkflowSerializer
+            ordem_etag.conectar_historico(Ordemservicoworkflowhistorico)
             
             queryset = Ordemservicoworkflowhistorico.objects.using(banco).filter(
                 oswh_empr=ordem.orde_empr,
                 oswh_fili=ordem.orde_fili,
                 oswh_orde=ordem.orde_nume
             ).order_by('-oswh_data')
-            
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = HistoricoWorkflowSerializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-                
-            serializer = HistoricoWorkflowSerializer(queryset, many=True)
-            return Response(serializer.data)
+
+            def gerar():
+                if request.query_params.get('arquivo') in ('1', 'true', 'True'):
+                    linhas = list(queryset) + historico_arquivado(banco, ordem)
+                    return Response(HistoricoWorkflowSerializer(linhas, many=True).data)
+
+                page = self.paginate_queryset(queryset)
+                if page is not None:
+                    serializer = HistoricoWorkflowSerializer(page, many=True)
+                    return self.get_paginated_response(serializer.data)
+
+                serializer = HistoricoWorkflowSerializer(queryset, many=True)
+                return Response(serializer.data)
+
+            return self._com_etag(lambda: ordem_etag.impressao_historico(queryset), gerar)
         except Exception as e:
             return tratar_erro(e)
 
@@ -498,27 +962,32 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
             banco = self.get_banco()
             ordem = self.get_object()
 
-            queryset = Osarquivos.objects.using(banco).filter(
+            queryset = Osarquivos.objects.using(self.get_banco_leitura()).filter(
                 arqu_empr=ordem.orde_empr,
                 arqu_fili=ordem.orde_fili,
                 arqu_os=ordem.orde_nume,
             ).order_by("-arqu_codi_arqu")
 
-            page = self.paginate_queryset(queryset)
-            objs = page if page is not None else queryset
+            def gerar():
+                page = self.paginate_queryset(queryset)
+                objs = page if page is not None else queryset
 
-            data = []
-            for obj in objs:
-                item = OsArquSerializer(obj, context={"banco": banco}).data
-                prev = OsArquivoService.preview(obj)
-                if isinstance(prev, bytes):
-                    prev = base64.b64encode(prev).decode("utf-8")
-                item["preview"] = prev
-                data.append(item)
+                data = []
+                for obj in objs:
+                    item = OsArquSerializer(obj, context={"banco": banco}).data
+                    # Miniatura do cache em disco; se ainda não existe é gerada em segundo plano
+                    item["preview"], item["preview_pendente"] = preview_worker.ler_base64(banco, obj, "thumb")
+                    data.append(item)
 
-            if page is not None:
-                return self.get_paginated_response(data)
-            return Response(data)
+                if page is not None:
+                    return self.get_paginated_response(data)
+                return Response(data)
+
+            # Uploads e previews concluídos pelo worker incrementam a versão de arquivos da ordem
+            return self._com_etag(lambda: (
+                ordem_etag.versao_arquivos(banco, ordem.orde_empr, ordem.orde_fili, ordem.orde_nume),
+                ordem_etag.impressao_arquivos(queryset),
+            ), gerar)
         except Exception as e:
             return tratar_erro(e)
 
@@ -539,14 +1008,35 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
                 return Response({"detail": "Arquivo não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
             data = OsArquSerializer(obj, context={"banco": banco, "include_base64": True}).data
-            prev = OsArquivoService.preview(obj)
-            if isinstance(prev, bytes):
-                prev = base64.b64encode(prev).decode("utf-8")
-            data["preview"] = prev
+            data["preview"], data["preview_pendente"] = preview_worker.ler_base64(banco, obj, "preview")
             return Response(data)
         except Exception as e:
             return tratar_erro(e)
 
+    @action(detail=True, methods=["get"], url_path=r"arquivos/(?P<arquivo_id>\d+)/download", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor])
+    def arquivo_download(self, request, arquivo_id=None, *args, **kwargs):
+        """
+        Conteúdo bruto do anexo em streaming, com Content-Type, Content-Length,
+        ETag e Range (206) para retomar downloads interrompidos.
+        """
+        try:
+            banco = self.get_banco()
+            ordem = self.get_object()
+
+            obj = Osarquivos.objects.using(banco).filter(
+                arqu_empr=ordem.orde_empr,
+                arqu_fili=ordem.orde_fili,
+                arqu_os=ordem.orde_nume,
+                arqu_codi_arqu=arquivo_id,
+            ).defer(campo_conteudo().name).first()
+
+            if not obj:
+                return Response({"detail": "Arquivo não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+
+            return resposta_download(request, banco, obj)
+        except Exception as e:
+            return tratar_erro(e)
+
     @action(detail=True, methods=["post", "patch"], url_path="arquivos/upload", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor])
     def upload_arquivos(self, request, *args, **kwargs):
         try:
@@ -554,27 +1044,109 @@ class OrdemViewSet(BaseMultiDBModelViewSet):
             ordem = self.get_object()
             arquivos = request.data.get("arquivos")
 
-            user = (
-                getattr(request.user, "pk", None)
-                or request.data.get("usua")
-                or request.data.get("usuario")
-                or request.data.get("usuario_id")
-                or 0
-            )
+            user = self._usuario_upload(request)
             empresa = ordem.orde_empr
             filial = ordem.orde_fili
             os_nume = ordem.orde_nume
 
             if isinstance(arquivos, str):
                 obj = OsArquivoService.salvar_um(os_nume, arquivos, user, empresa, filial, banco=banco)
+                preview_worker.agendar(banco, [obj])
+                ordem_etag.invalidar_arquivos(banco, empresa, filial, os_nume)
                 data = OsArquSerializer(obj, context={"banco": banco}).data if obj else None
                 return Response({"msg": "1 arquivo enviado", "arquivo": data})
 
             if isinstance(arquivos, list):
                 objs = OsArquivoService.salvar_multiplos(os_nume, arquivos, user, empresa, filial, banco=banco)
+                preview_worker.agendar(banco, objs)
+                ordem_etag.invalidar_arquivos(banco, empresa, filial, os_nume)
                 data = [OsArquSerializer(o, context={"banco": banco}).data for o in objs]
                 return Response({"msg": f"{len(objs)} arquivos enviados", "arquivos": data})
 
             return Response({"erro": "formato inválido"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return tratar_erro(e)
+
+    def _usuario_upload(self, request):
+        return (
+            getattr(request.user, "pk", None)
+            or request.data.get("usua")
+            or request.data.get("usuario")
+            or request.data.get("usuario_id")
+            or 0
+        )
+
+    @action(detail=True, methods=["post"], url_path="arquivos/sessoes", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor])
+    def upload_sessao_criar(self, request, *args, **kwargs):
+        """
+        Abre uma sessão de upload em partes.
+        Exemplo JSON:
+        {
+            "arquivos": [{"nome": "foto1.jpg", "tamanho": 2483011, "sha256": "..."}]
+        }
+        """
+        try:
+            banco = self.get_banco()
+            ordem = self.get_object()
+            sessao = upload_sessoes.criar_sessao(
+                banco, ordem, self._usuario_upload(request), request.data.get("arquivos"),
+                dono=request.user.pk,
+            )
+            return Response(upload_sessoes.status_sessao(sessao), status=status.HTTP_201_CREATED)
+        except upload_sessoes.UploadErro as e:
+            return Response(e.payload, status=e.status)
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=True, methods=["get", "delete"], url_path=r"arquivos/sessoes/(?P<sessao_id>[0-9a-f]{32})", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor])
+    def upload_sessao(self, request, sessao_id=None, *args, **kwargs):
+        """GET: bytes recebidos por arquivo (para retomar). DELETE: cancela a sessão."""
+        try:
+            banco = self.get_banco()
+            ordem = self.get_object()
+            sessao = upload_sessoes.carregar_sessao(sessao_id, banco, ordem, request.user.pk)
+            if request.method == "DELETE":
+                upload_sessoes.descartar_sessao(sessao)
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(upload_sessoes.status_sessao(sessao))
+        except upload_sessoes.UploadErro as e:
+            return Response(e.payload, status=e.status)
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=True, methods=["put"], url_path=r"arquivos/sessoes/(?P<sessao_id>[0-9a-f]{32})/(?P<indice>\d+)", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor])
+    def upload_sessao_pedaco(self, request, sessao_id=None, indice=None, *args, **kwargs):
+        """
+        Recebe um pedaço do arquivo `indice`: corpo bruto (application/octet-stream)
+        ou multipart com o campo `chunk`. A posição vem do Content-Range
+        (bytes ini-fim/total) ou de ?offset=.
+        """
+        try:
+            banco = self.get_banco()
+            ordem = self.get_object()
+            sessao = upload_sessoes.carregar_sessao(sessao_id, banco, ordem, request.user.pk)
+            offset = upload_sessoes.offset_do_request(request)
+            resultado = upload_sessoes.gravar_pedaco(
+                sessao, int(indice), offset, upload_sessoes.pedacos_do_request(request)
+            )
+            return Response(resultado)
+        except upload_sessoes.UploadErro as e:
+            return Response(e.payload, status=e.status)
+        except Exception as e:
+            return tratar_erro(e)
+
+    @action(detail=True, methods=["post"], url_path=r"arquivos/sessoes/(?P<sessao_id>[0-9a-f]{32})/concluir", permission_classes=[IsAuthenticated, PodeVerOrdemDoSetor])
+    def upload_sessao_concluir(self, request, sessao_id=None, *args, **kwargs):
+        try:
+            banco = self.get_banco()
+            ordem = self.get_object()
+            sessao = upload_sessoes.carregar_sessao(sessao_id, banco, ordem, request.user.pk)
+            objs = upload_sessoes.concluir_sessao(sessao)
+            preview_worker.agendar(banco, objs)
+            ordem_etag.invalidar_arquivos(banco, ordem.orde_empr, ordem.orde_fili, ordem.orde_nume)
+            data = [OsArquSerializer(o, context={"banco": banco}).data for o in objs]
+            return Response({"msg": f"{len(objs)} arquivos enviados", "arquivos": data})
+        except upload_sessoes.UploadErro as e:
+            return Response(e.payload, status=e.status)
+        except Exception as e:
+            return tratar_erro(e)
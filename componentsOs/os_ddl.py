@@ -0,0 +1,48 @@
+"""
+Etapas de DDL das tabelas de OS aplicadas por `otimizar_banco_os`.
+
+As tabelas são legadas (não gerenciadas por migrations) e existem em cada banco
+licenciado, por isso colunas e índices são criados por comando, banco a banco.
+Cada etapa recebe a conexão e devolve a lista de comandos SQL idempotentes.
+"""
+from collections import OrderedDict
+
+from Entidades.models import Entidades
+
+from . import datas_saneadas
+from .ordem_totais import ddl_totais
+from .historico_workflow import ddl_historico
+from . import busca_textual
+from .ordem_sync import ddl_sincronizacao
+
+
+def ddl_busca_clientes(connection):
+    """Índice trigram para `enti_nome__icontains` e índice do semi-join com as ordens."""
+    q = connection.ops.quote_name
+    entidades = Entidades._meta.db_table
+    ordens = datas_saneadas.tabela_ordens()
+    status = ', '.join(str(s) for s in datas_saneadas.STATUS_LISTAVEIS)
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # Mesma expressão gerada pelo Django para icontains: UPPER(col::text) LIKE UPPER(%s)
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(entidades + '_nome_trgm_idx')} "
+        f"ON {q(entidades)} USING gin ((UPPER(enti_nome::text)) gin_trgm_ops)",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {q(ordens + '_empr_enti_idx')} "
+        f"ON {q(ordens)} (orde_empr, orde_enti) WHERE orde_stat_orde IN ({status})",
+        f"ANALYZE {q(entidades)}",
+    ]
+
+
+ETAPAS = OrderedDict([
+    ('datas_saneadas', datas_saneadas.ddl_datas_saneadas),
+    ('sincronizacao', ddl_sincronizacao),
+    ('busca_clientes', ddl_busca_clientes),
+    ('totais', ddl_totais),
+    ('historico_workflow', ddl_historico),
+    ('busca_textual', busca_textual.ddl_busca_textual),
+])
+
+
+def invalidar_caches(banco):
+    datas_saneadas.invalidar_cache(banco)
+    busca_textual.invalidar_cache(banco)
@@ -0,0 +1,275 @@
+"""
+Cache persistente de previews dos arquivos da OS.
+
+Os previews são gerados uma vez e gravados em disco, endereçados pelo sha256 do
+arquivo de origem: arquivos iguais compartilham a mesma entrada e nem chegam a
+ser processados de novo, e um arquivo substituído ganha outro hash. Um índice
+pequeno liga cada arquivo (banco, empresa, filial, OS, código) ao hash da
+origem; novos uploads descartam o índice antes de agendar a geração. Cada
+entrada tem duas variantes: `preview` (o que o OsArquivoService devolve) e
+`thumb` (reduzida para a listagem).
+
+O diretório é limitado por tamanho (blobs) e por quantidade de índices; as
+entradas menos usadas recentemente (mtime, atualizado a cada leitura) são
+removidas, e índices que apontam para blobs já removidos também.
+A geração em si roda em segundo plano (ver preview_worker).
+
+Configuração (settings):
+    OS_PREVIEW_CACHE_DIR          diretório do cache (padrão: <tmp>/os_previews)
+    OS_PREVIEW_CACHE_MAX_BYTES    tamanho máximo dos blobs (padrão: 256 MB)
+    OS_PREVIEW_CACHE_MAX_INDICES  quantidade máxima de índices (padrão: 50000)
+    OS_PREVIEW_THUMB_SIZE         lado máximo da miniatura em px (padrão: 256)
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional; sem ele a miniatura é o próprio preview
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+VARIANTES = ('thumb', 'preview')
+SEM_PREVIEW = '-'
+# Peso de uma escrita de índice na contagem que dispara a limpeza (um bloco de disco)
+TAMANHO_INDICE = 4096
+
+_lock = threading.Lock()
+_bytes_desde_limpeza = 0
+
+
+def _diretorio():
+    return getattr(settings, 'OS_PREVIEW_CACHE_DIR', None) or os.path.join(tempfile.gettempdir(), 'os_previews')
+
+
+def _max_bytes():
+    return int(getattr(settings, 'OS_PREVIEW_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+
+def _max_indices():
+    return int(getattr(settings, 'OS_PREVIEW_CACHE_MAX_INDICES', 50000))
+
+
+def _thumb_size():
+    return int(getattr(settings, 'OS_PREVIEW_THUMB_SIZE', 256))
+
+
+def chave_arquivo(banco, obj):
+    return f"{banco}:{obj.arqu_empr}:{obj.arqu_fili}:{obj.arqu_os}:{obj.arqu_codi_arqu}"
+
+
+def _caminho_indice(chave):
+    nome = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+    return os.path.join(_diretorio(), 'idx', nome[:2], nome)
+
+
+def hash_origem(conteudo):
+    """sha256 do arquivo de origem (bytes/memoryview do campo binário), ou None se vazio."""
+    if not conteudo:
+        return None
+    return hashlib.sha256(bytes(conteudo)).hexdigest()
+
+
+def _caminho_blob(hash_, variante):
+    return os.path.join(_diretorio(), 'blobs', hash_[:2], f"{hash_}.{variante}")
+
+
+def _gravar_atomico(caminho, dados):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(caminho))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dados)
+        os.replace(tmp, caminho)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _ler(caminho):
+    try:
+        with open(caminho, 'rb') as f:
+            dados = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(caminho)  # marca uso para o LRU
+    except OSError:
+        pass
+    return dados
+
+
+def _ler_sem_marcar(caminho):
+    try:
+        with open(caminho, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _normalizar(preview):
+    """OsArquivoService.preview pode devolver bytes, base64 (com ou sem data URI) ou None."""
+    if preview is None or isinstance(preview, bytes):
+        return preview or None
+    if isinstance(preview, str):
+        texto = preview.split(',', 1)[1] if preview.startswith('data:') else preview
+        try:
+            return base64.b64decode(texto, validate=True) or None
+        except (binascii.Error, ValueError):
+            # Texto que não é base64 não é preview: não vai para o cache como se fosse imagem
+            logger.warning("[PREVIEW CACHE] preview em texto não é base64 válido; ignorado")
+            return None
+    return None
+
+
+def gerar_thumbnail(dados):
+    if Image is None:
+        return dados
+    try:
+        with Image.open(io.BytesIO(dados)) as img:
+            img.thumbnail((_thumb_size(), _thumb_size()))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            saida = io.BytesIO()
+            img.save(saida, format='JPEG', quality=70, optimize=True)
+            return saida.getvalue()
+    except Exception:
+        # Não é imagem (PDF, etc.) ou está corrompida: usa o preview original
+        return dados
+
+
+def consultar(banco, obj, variante='thumb'):
+    """
+    Lê do cache sem gerar nada. Devolve (encontrado, dados): (True, None) quando
+    o arquivo já foi processado e não tem preview.
+    """
+    indice = _ler(_caminho_indice(chave_arquivo(banco, obj)))
+    if indice is None:
+        return False, None
+    hash_ = indice.decode('ascii')
+    if hash_ == SEM_PREVIEW:
+        return True, None
+    dados = _ler(_caminho_blob(hash_, variante))
+    return (dados is not None), dados
+
+
+def descartar(banco, obj):
+    """Remove o índice do arquivo (upload/substituição): a próxima leitura é miss."""
+    try:
+        os.unlink(_caminho_indice(chave_arquivo(banco, obj)))
+    except FileNotFoundError:
+        pass
+
+
+def apontar_existente(banco, obj, origem):
+    """
+    Se a origem já tem preview no cache (outro arquivo com o mesmo conteúdo),
+    só aponta o índice para ele e devolve True; senão devolve False.
+    """
+    if origem is None or not all(os.path.exists(_caminho_blob(origem, v)) for v in VARIANTES):
+        return False
+    _gravar_atomico(_caminho_indice(chave_arquivo(banco, obj)), origem.encode('ascii'))
+    _registrar_escrita(TAMANHO_INDICE)
+    return True
+
+
+def guardar(banco, obj, origem, preview):
+    """
+    Grava preview e miniatura sob o hash da origem; devolve
+    {'preview': bytes|None, 'thumb': bytes|None}.
+    """
+    dados = _normalizar(preview)
+    chave = _caminho_indice(chave_arquivo(banco, obj))
+    if not dados or origem is None:
+        _gravar_atomico(chave, SEM_PREVIEW.encode('ascii'))
+        _registrar_escrita(TAMANHO_INDICE)
+        return {'preview': None, 'thumb': None}
+
+    variantes = {'preview': dados, 'thumb': gerar_thumbnail(dados)}
+    for variante, conteudo in variantes.items():
+        caminho = _caminho_blob(origem, variante)
+        if not os.path.exists(caminho):
+            _gravar_atomico(caminho, conteudo)
+    _gravar_atomico(chave, origem.encode('ascii'))
+    _registrar_escrita(sum(len(v) for v in variantes.values()) + TAMANHO_INDICE)
+    return variantes
+
+
+def _registrar_escrita(n):
+    global _bytes_desde_limpeza
+    with _lock:
+        _bytes_desde_limpeza += n
+        # Varre o diretório só depois de ~10% do limite em escritas novas
+        if _bytes_desde_limpeza < _max_bytes() // 10:
+            return
+        _bytes_desde_limpeza = 0
+    try:
+        limpar()
+    except Exception as e:
+        logger.warning(f"[PREVIEW CACHE] falha na limpeza: {e}")
+
+
+def _listar(raiz):
+    entradas = []
+    for pasta, _, arquivos in os.walk(raiz):
+        for nome in arquivos:
+            caminho = os.path.join(pasta, nome)
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, caminho))
+    return entradas
+
+
+def _remover(caminho):
+    try:
+        os.unlink(caminho)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _limpar_blobs():
+    """Remove os blobs menos usados até ficarem em 90% do limite de bytes."""
+    entradas = _listar(os.path.join(_diretorio(), 'blobs'))
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    alvo = int(_max_bytes() * 0.9)
+    removidos = 0
+    for _, tamanho, caminho in sorted(entradas):
+        if total <= alvo:
+            break
+        if _remover(caminho):
+            total -= tamanho
+            removidos += 1
+    return removidos
+
+
+def _limpar_indices():
+    """Remove índices órfãos (blob já removido) e os menos usados além do limite."""
+    vivos, removidos = [], 0
+    for entrada in _listar(os.path.join(_diretorio(), 'idx')):
+        hash_ = (_ler_sem_marcar(entrada[2]) or b'').decode('ascii', 'ignore')
+        if hash_ != SEM_PREVIEW and not all(os.path.exists(_caminho_blob(hash_, v)) for v in VARIANTES):
+            removidos += _remover(entrada[2])
+        else:
+            vivos.append(entrada)
+    excesso = len(vivos) - int(_max_indices() * 0.9)
+    for _, _, caminho in sorted(vivos)[:max(excesso, 0)]:
+        removidos += _remover(caminho)
+    return removidos
+
+
+def limpar():
+    """Limita blobs (bytes) e índices (quantidade); devolve quantos arquivos removeu."""
+    return _limpar_blobs() + _limpar_indices()
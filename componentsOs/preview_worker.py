@@ -0,0 +1,105 @@
+"""
+Geração de previews em segundo plano.
+
+Uploads agendam a geração de preview/miniatura num pool de threads local (a
+decodificação de imagem no Pillow libera o GIL); o resultado vai para o
+preview_cache, sob o hash do arquivo de origem. Se outro arquivo com o mesmo
+conteúdo já tem preview, ele é reaproveitado sem gerar nada. As leituras só
+consultam o cache: num miss agendam a geração e respondem `preview_pendente`,
+sem decodificar nada no request.
+
+Configuração (settings):
+    OS_PREVIEW_WORKERS  threads do pool (padrão: 2)
+"""
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from ..models import Osarquivos
+from ..services.os_arquivo_service import OsArquivoService
+from . import ordem_etag, preview_cache
+from .arquivo_download import campo_conteudo
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+_em_andamento = set()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(getattr(settings, 'OS_PREVIEW_WORKERS', 2)),
+                thread_name_prefix="os-preview",
+            )
+    return _executor
+
+
+def _gerar(banco, chave, ids):
+    empr, fili, os_nume, codi = ids
+    try:
+        obj = Osarquivos.objects.using(banco).filter(
+            arqu_empr=empr, arqu_fili=fili, arqu_os=os_nume, arqu_codi_arqu=codi,
+        ).first()
+        if obj is None:
+            return
+        origem = preview_cache.hash_origem(getattr(obj, campo_conteudo().attname))
+        if not preview_cache.apontar_existente(banco, obj, origem):
+            try:
+                preview = OsArquivoService.preview(obj)
+            except Exception as e:
+                # Arquivo sem preview possível: registra para não tentar de novo a cada leitura
+                logger.warning(f"[PREVIEW] falha ao gerar {chave}: {e}")
+                preview = None
+            preview_cache.guardar(banco, obj, origem, preview)
+        # Listagem de arquivos desta ordem deixa de ter preview_pendente: troca só o ETag dela
+        ordem_etag.invalidar_arquivos(banco, empr, fili, os_nume)
+    except Exception as e:
+        logger.exception(f"[PREVIEW] erro no worker para {chave}: {e}")
+    finally:
+        with _lock:
+            _em_andamento.discard(chave)
+        connections[banco].close()
+
+
+def _submeter(banco, itens):
+    executor = _get_executor()
+    for chave, ids in itens:
+        with _lock:
+            if chave in _em_andamento:
+                continue
+            _em_andamento.add(chave)
+        executor.submit(_gerar, banco, chave, ids)
+
+
+def agendar(banco, objs):
+    """
+    Agenda a geração para depois do commit da transação corrente (ou já, em
+    autocommit). O índice atual é descartado antes: um arquivo substituído
+    nunca devolve o preview do conteúdo anterior.
+    """
+    objs = [o for o in objs if o is not None]
+    for o in objs:
+        preview_cache.descartar(banco, o)
+    itens = [
+        (preview_cache.chave_arquivo(banco, o), (o.arqu_empr, o.arqu_fili, o.arqu_os, o.arqu_codi_arqu))
+        for o in objs
+    ]
+    if itens:
+        transaction.on_commit(lambda: _submeter(banco, itens), using=banco)
+
+
+def ler_base64(banco, obj, variante='thumb'):
+    """(base64 | None, pendente). Nunca gera no request: num miss só agenda."""
+    encontrado, dados = preview_cache.consultar(banco, obj, variante)
+    if not encontrado:
+        agendar(banco, [obj])
+        return None, True
+    return (base64.b64encode(dados).decode('utf-8') if dados else None), False
@@ -0,0 +1,6 @@
+"""
+Testes das views de OS. Rodam no projeto backend, onde este diretório é
+`<app de OS>/views/` (importam `...models`):
+
+    python manage.py test <app de OS>.views.tests core.tests
+"""
@@ -0,0 +1,75 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from Entidades.models import Entidades
+
+from ...models import (
+    Ordemservico, Ordemservicopecas, Ordemservicoservicos, OrdemServicoFaseSetor, Osarquivos,
+)
+from .. import benchmark_seed
+from ..management.commands import benchmark_os
+from ..management.commands.benchmark_os import Command as BenchmarkOs
+
+MODELOS_MASSA = (OrdemServicoFaseSetor, Entidades, Ordemservico, Ordemservicopecas, Ordemservicoservicos, Osarquivos)
+
+
+class BenchmarkOsTests(TestCase):
+    def _rodar(self, *args):
+        with mock.patch.object(benchmark_os, "popular") as popular:
+            with self.assertRaises(CommandError) as erro:
+                call_command(BenchmarkOs(), "--slug", "cliente", "--usuario", "inexistente", *args)
+        popular.assert_not_called()
+        return str(erro.exception)
+
+    def test_recusa_banco_fora_da_lista_sem_confirmar(self):
+        self.assertIn("--confirmar", self._rodar("--banco", "default"))
+
+    @override_settings(OS_BENCHMARK_BANCOS=("default",))
+    def test_aceita_banco_dedicado(self):
+        # Passa da trava e para na busca do usuário, antes de popular
+        self.assertIn("Usuário 'inexistente'", self._rodar("--banco", "default"))
+
+    def test_confirmar_libera_qualquer_banco(self):
+        self.assertIn("Usuário 'inexistente'", self._rodar("--banco", "default", "--confirmar"))
+
+
+class MassaTests(TransactionTestCase):
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            for model in MODELOS_MASSA:
+                editor.create_model(model)
+        self.addCleanup(self._remover_tabelas)
+
+    def _remover_tabelas(self):
+        with connection.schema_editor() as editor:
+            for model in MODELOS_MASSA:
+                editor.delete_model(model)
+
+    def test_limpar_preserva_setores_que_ja_existiam(self):
+        existente = benchmark_seed.setores(3)[0]
+        OrdemServicoFaseSetor.objects.create(osfs_codi=existente, osfs_nome="Setor real")
+
+        massa = benchmark_seed.popular("default", 9999, 1, ordens=1, itens=1, clientes=2, n_setores=3, invalidas=0)
+        self.assertEqual(massa["setores"], benchmark_seed.setores(3))
+        self.assertEqual(massa["setores_criados"], benchmark_seed.setores(3)[1:])
+
+        benchmark_seed.limpar("default", 9999)
+        self.assertFalse(Ordemservico.objects.filter(orde_empr=9999).exists())
+        self.assertTrue(OrdemServicoFaseSetor.objects.filter(osfs_codi=existente).exists())
+
+    def test_benchmark_nao_grava_a_flag_compartilhada(self):
+        with mock.patch.object(benchmark_os, "popular", return_value={
+            "ordens": [1], "clientes": [], "setores": [], "setores_criados": [9901],
+        }), mock.patch.object(benchmark_os, "limpar") as limpar, \
+                mock.patch.object(BenchmarkOs, "_rodar", return_value={}) as rodar, \
+                mock.patch.object(BenchmarkOs, "_reportar"), mock.patch.object(BenchmarkOs, "_comparar_baseline"), \
+                mock.patch.object(benchmark_os.instrumentacao, "definir") as definir, \
+                mock.patch.object(benchmark_os.get_user_model().objects, "get_by_natural_key"):
+            rodar.side_effect = lambda *a: self.assertTrue(benchmark_os.instrumentacao.ativa()) or {}
+            call_command(BenchmarkOs(), "--slug", "cliente", "--usuario", "bench", "--confirmar", stdout=StringIO())
+        definir.assert_not_called()
+        limpar.assert_called_once_with("default", 9999, [9901])
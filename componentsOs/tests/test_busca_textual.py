@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ...models import Ordemservico
+from .. import busca_textual
+
+VIEW = SimpleNamespace(get_banco=lambda: "default", search_fields=["orde_prob"])
+
+
+def _request(busca):
+    return Request(APIRequestFactory().get("/api/cliente/ordemdeservico/ordens/", {"search": busca}))
+
+
+class BuscaTextualFilterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(busca_textual, "busca_disponivel", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sql(self, busca):
+        queryset = Ordemservico.objects.extra(select={"safe_data_aber": "orde_data_aber"})
+        qs = busca_textual.BuscaTextualFilter().filter_queryset(_request(busca), queryset, VIEW)
+        return str(qs.query)
+
+    def test_consulta_so_com_stop_words_volta_ao_icontains(self):
+        with mock.patch.object(busca_textual, "consulta_vazia", return_value=True) as vazia:
+            sql = self._sql("de a")
+        vazia.assert_called_once_with("default", "'de':* & 'a':*")
+        self.assertNotIn(busca_textual.COLUNA, sql)
+        self.assertIn("LIKE", sql)
+
+    def test_consulta_com_termos_usa_o_full_text(self):
+        with mock.patch.object(busca_textual, "consulta_vazia", return_value=False):
+            sql = self._sql("bomba")
+        self.assertIn(f"{busca_textual.COLUNA} @@ to_tsquery", sql)
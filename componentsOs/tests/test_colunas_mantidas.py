@@ -0,0 +1,38 @@
+from django.db import connection
+from django.test import SimpleTestCase
+
+from ..colunas_mantidas import PAGINAS_POR_LOTE, ddl_colunas_mantidas
+
+COLUNAS = {'orde_busca': ('tsvector', lambda ref: f"to_tsvector({ref}orde_prob)")}
+
+
+class DdlColunasMantidasTests(SimpleTestCase):
+    def setUp(self):
+        self.comandos = ddl_colunas_mantidas(connection, 'ordens', 'busca', COLUNAS, ['orde_prob'])
+
+    def _comando(self, inicio):
+        (comando,) = [c for c in self.comandos if c.startswith(inicio)]
+        return comando
+
+    def test_coluna_comum_sem_reescrever_a_tabela(self):
+        alter = self._comando("ALTER TABLE")
+        self.assertTrue(alter.endswith("tsvector"))
+        self.assertNotIn("GENERATED", alter)
+        # O ALTER roda com lock_timeout curto
+        indice = self.comandos.index(alter)
+        self.assertTrue(self.comandos[0].startswith("SET lock_timeout"))
+        self.assertIn("RESET lock_timeout", self.comandos[indice:])
+
+    def test_trigger_mantem_a_coluna(self):
+        self.assertIn("NEW.\"orde_busca\" := to_tsvector(NEW.orde_prob);", self._comando("CREATE OR REPLACE FUNCTION"))
+        trigger = self._comando("DO $$ BEGIN DROP TRIGGER")
+        self.assertIn("BEFORE INSERT OR UPDATE OF \"orde_prob\"", trigger)
+
+    def test_preenche_em_lotes_com_commit(self):
+        preenchimento = self.comandos[-1]
+        self.assertIn("SET (\"orde_busca\") = ROW(to_tsvector(orde_prob))", preenchimento)
+        self.assertIn(f"inicio + {PAGINAS_POR_LOTE}", preenchimento)
+        self.assertIn("COMMIT;", preenchimento)
+
+    def test_sem_colunas_nao_ha_comandos(self):
+        self.assertEqual(ddl_colunas_mantidas(connection, 'ordens', 'busca', {}, ['orde_prob']), [])
@@ -0,0 +1,108 @@
+import base64
+from datetime import date, timedelta
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from django.db import connection
+from django.db.models import DateField
+from django.db.models.expressions import RawSQL
+from django.test import TransactionTestCase
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ...models import Ordemservico
+from ..ordem_cursor_pagination import OrdemServicoCursorPagination
+
+URL = "/api/cliente/ordemdeservico/ordens/"
+VIEW = SimpleNamespace(get_safe_data_aber_sql=lambda: "orde_data_aber")
+
+
+def _request(url=URL, **params):
+    return Request(APIRequestFactory().get(url, params))
+
+
+def _cursor(link):
+    return parse_qs(urlparse(link).query)["cursor"][0] if link else None
+
+
+class OrdemServicoCursorPaginationTests(TransactionTestCase):
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            editor.create_model(Ordemservico)
+        self.addCleanup(self._remover_tabela)
+        inicio = date(2024, 1, 1)
+        # Várias ordens por dia, de duas filiais: o desempate pela chave
+        # completa da ordem (empresa, filial, número) precisa ser estável
+        Ordemservico.objects.bulk_create([
+            Ordemservico(
+                orde_empr=1, orde_fili=2 if n % 4 == 0 else 1, orde_nume=n,
+                orde_data_aber=inicio + timedelta(days=n // 3),
+            )
+            for n in range(1, 26)
+        ])
+
+    def _remover_tabela(self):
+        with connection.schema_editor() as editor:
+            editor.delete_model(Ordemservico)
+
+    def _queryset(self):
+        return Ordemservico.objects.annotate(
+            safe_data_aber=RawSQL("orde_data_aber", [], output_field=DateField())
+        )
+
+    def _pagina(self, **params):
+        paginador = OrdemServicoCursorPagination()
+        linhas = paginador.paginate_queryset(self._queryset(), _request(**params), VIEW)
+        return paginador, [(o.orde_fili, o.orde_nume) for o in linhas]
+
+    def _esperado(self):
+        ordenado = self._queryset().order_by("-safe_data_aber", "-orde_empr", "-orde_fili", "-orde_nume")
+        return list(ordenado.values_list("orde_fili", "orde_nume"))
+
+    def test_percorre_todas_as_paginas_sem_repetir(self):
+        vistos, params = [], {"page_size": 7}
+        while True:
+            paginador, numeros = self._pagina(**params)
+            vistos += numeros
+            proximo = _cursor(paginador.get_next_link())
+            if not proximo:
+                break
+            params = {"page_size": 7, "cursor": proximo}
+        self.assertEqual(vistos, self._esperado())
+
+    def test_desempate_pela_filial_no_limite_da_pagina(self):
+        # (2, 24) e (1, 25) têm a mesma data e a filial vem antes do número:
+        # com o corte entre as duas, a 25 não pode ser pulada
+        corte = self._esperado().index((2, 24)) + 1
+        primeira, numeros = self._pagina(page_size=corte)
+        self.assertEqual(numeros[-1], (2, 24))
+        _, seguinte = self._pagina(page_size=corte, cursor=_cursor(primeira.get_next_link()))
+        self.assertEqual(seguinte[0], (1, 25))
+
+    def test_cursor_sem_empresa_e_filial_responde_404(self):
+        antigo = base64.urlsafe_b64encode(b'{"d":"2024-01-05","n":12}').decode("ascii")
+        with self.assertRaises(NotFound):
+            self._pagina(cursor=antigo)
+
+    def test_previous_volta_para_a_pagina_anterior(self):
+        primeira, numeros_primeira = self._pagina(page_size=5)
+        segunda, _ = self._pagina(page_size=5, cursor=_cursor(primeira.get_next_link()))
+        _, anteriores = self._pagina(page_size=5, cursor=_cursor(segunda.get_previous_link()))
+        self.assertEqual(anteriores, numeros_primeira)
+        self.assertIsNone(primeira.get_previous_link())
+
+    def test_total_so_quando_pedido(self):
+        paginador, _ = self._pagina()
+        self.assertNotIn("count", paginador.get_paginated_response([]).data)
+        paginador, _ = self._pagina(total="exato")
+        self.assertEqual(paginador.get_paginated_response([]).data["count"], 25)
+
+    def test_page_size_limitado(self):
+        paginador = OrdemServicoCursorPagination()
+        self.assertEqual(paginador.get_page_size(_request(page_size=1000)), paginador.max_page_size)
+        self.assertEqual(paginador.get_page_size(_request(page_size="x")), paginador.page_size)
+
+    def test_cursor_invalido_responde_404(self):
+        with self.assertRaises(NotFound):
+            self._pagina(cursor="nao-e-cursor")
@@ -0,0 +1,88 @@
+from collections import namedtuple
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from ...models import Ordemservico, Osarquivos
+from .. import ordem_etag
+
+
+Linha = namedtuple("Linha", "orde_empr orde_fili orde_nume orde_stat_orde orde_seto")
+
+
+def _linha(nume, status=0, setor=1):
+    return Linha(1, 1, nume, status, setor)
+
+
+def _request(if_none_match=None):
+    cabecalhos = {"HTTP_IF_NONE_MATCH": if_none_match} if if_none_match else {}
+    request = APIRequestFactory().get("/api/x/ordemdeservico/?page=1", **cabecalhos)
+    request.user = SimpleNamespace(setor=None)
+    return request
+
+
+class OrdemEtagTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _etag_lista(self, linhas, total=None):
+        return ordem_etag.calcular(*ordem_etag.contexto(_request(), "default"), *ordem_etag.impressao_lista(linhas, total))
+
+    def test_lista_muda_com_as_chaves_da_pagina(self):
+        etag = self._etag_lista([_linha(1), _linha(2)], 2)
+        self.assertEqual(etag, self._etag_lista([_linha(1), _linha(2)], 2))
+        self.assertNotEqual(etag, self._etag_lista([_linha(1), _linha(3)], 2))
+        self.assertNotEqual(etag, self._etag_lista([_linha(1), _linha(2)], 3))
+
+    def test_conteudo_da_pagina_muda_o_etag_sem_mudar_a_versao(self):
+        # Escrita do ERP legado: a versão não muda, as chaves da página também não
+        etag = self._etag_lista([_linha(1), _linha(2)])
+        self.assertNotEqual(etag, self._etag_lista([_linha(1), _linha(2, status=2)]))
+        self.assertNotEqual(etag, self._etag_lista([_linha(1), _linha(2, setor=3)]))
+
+    def test_lista_de_instancias_usa_os_campos_carregados(self):
+        ordem = Ordemservico(orde_empr=1, orde_fili=1, orde_nume=10, orde_prio=1)
+        antes = ordem_etag.impressao_lista([ordem])
+        ordem.orde_prio = 2
+        self.assertNotEqual(antes, ordem_etag.impressao_lista([ordem]))
+
+    def test_arquivos_tem_versao_propria_por_ordem(self):
+        lista = self._etag_lista([_linha(1)])
+        versao = ordem_etag.versao_arquivos("default", 1, 1, 10)
+        outra = ordem_etag.versao_arquivos("default", 1, 1, 11)
+        post_save.send(Osarquivos, instance=SimpleNamespace(arqu_empr=1, arqu_fili=1, arqu_os=10), using="default")
+        self.assertNotEqual(versao, ordem_etag.versao_arquivos("default", 1, 1, 10))
+        self.assertEqual(outra, ordem_etag.versao_arquivos("default", 1, 1, 11))
+        self.assertEqual(lista, self._etag_lista([_linha(1)]))
+
+    def test_escrita_muda_a_versao(self):
+        antes = self._etag_lista([_linha(1)])
+        ordem_etag.invalidar("default")
+        self.assertNotEqual(antes, self._etag_lista([_linha(1)]))
+
+    def test_if_none_match(self):
+        etag = self._etag_lista([_linha(1)])
+        self.assertTrue(ordem_etag.corresponde(_request(etag), etag))
+        self.assertTrue(ordem_etag.corresponde(_request(f'"outro", W/{etag}'), etag))
+        self.assertTrue(ordem_etag.corresponde(_request("*"), etag))
+        self.assertFalse(ordem_etag.corresponde(_request('"outro"'), etag))
+        self.assertFalse(ordem_etag.corresponde(_request(), etag))
+
+    def test_nao_modificado_e_304_com_etag(self):
+        resposta = ordem_etag.nao_modificado('"abc"')
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta["ETag"], '"abc"')
+
+    def test_impressao_ordem_usa_campos_do_modelo_e_itens(self):
+        ordem = Ordemservico(orde_empr=1, orde_fili=1, orde_nume=10, orde_prio=1)
+        with mock.patch.object(ordem_etag, "_impressao_itens", return_value=(2, 7)) as itens:
+            antes = ordem_etag.impressao_ordem("default", ordem)
+            ordem.orde_prio = 2
+            depois = ordem_etag.impressao_ordem("default", ordem)
+        self.assertNotEqual(antes, depois)
+        self.assertEqual(itens.call_count, 4)
+        self.assertEqual(itens.call_args_list[0].kwargs, {"peca_empr": 1, "peca_fili": 1, "peca_orde": 10})
@@ -0,0 +1,56 @@
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import ordem_feed
+
+
+class TimeoutTests(SimpleTestCase):
+    @override_settings(OS_FEED_TIMEOUT=25)
+    def test_limita_ao_intervalo_permitido(self):
+        self.assertEqual(ordem_feed.ler_timeout(None), 25)
+        self.assertEqual(ordem_feed.ler_timeout("5"), 5)
+        self.assertEqual(ordem_feed.ler_timeout("-3"), 0)
+        self.assertEqual(ordem_feed.ler_timeout("1e9"), 25)
+
+    def test_recusa_valores_nao_finitos(self):
+        for valor in ("nan", "inf", "-inf", "abc"):
+            with self.assertRaises(ValueError):
+                ordem_feed.ler_timeout(valor)
+
+    def test_broker_nao_espera_para_sempre_com_nan(self):
+        broker = ordem_feed.BrokerMemoria(retencao=10)
+        inicio = time.monotonic()
+        self.assertEqual(broker.aguardar("default", 0, timeout=float("nan")), ([], 0))
+        self.assertLess(time.monotonic() - inicio, 1)
+
+
+class BrokerMemoriaTests(SimpleTestCase):
+    def test_filtra_por_setor_e_pede_recarga_de_cursor_desconhecido(self):
+        broker = ordem_feed.BrokerMemoria(retencao=10)
+        broker.publicar("default", {"tipo": "setor", "orde_seto": 1, "setor_anterior": 2})
+        broker.publicar("default", {"tipo": "setor", "orde_seto": 3, "setor_anterior": None})
+        eventos, ultimo = broker.aguardar("default", 0, {"2"})
+        self.assertEqual(([e["id"] for e in eventos], ultimo), ([1], 2))
+        self.assertEqual(broker.aguardar("default", 5), (None, 2))
+
+
+@override_settings(OS_FEED_MAX_CONEXOES=1)
+class VagasTests(SimpleTestCase):
+    def setUp(self):
+        ordem_feed._vagas = None
+        self.addCleanup(setattr, ordem_feed, "_vagas", None)
+
+    def test_limita_esperas_simultaneas(self):
+        self.assertTrue(ordem_feed.ocupar_vaga())
+        self.assertFalse(ordem_feed.ocupar_vaga())
+        ordem_feed.liberar_vaga()
+        self.assertTrue(ordem_feed.ocupar_vaga())
+
+    def test_fluxo_sse_devolve_a_vaga_uma_vez_ao_fechar(self):
+        self.assertTrue(ordem_feed.ocupar_vaga())
+        fluxo = ordem_feed.FluxoSSE(linha for linha in ["retry: 3000\n\n"])
+        fluxo.close()
+        fluxo.close()
+        self.assertTrue(ordem_feed.ocupar_vaga())
+        self.assertFalse(ordem_feed.ocupar_vaga())
@@ -0,0 +1,143 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import ordem_itens
+from ..ordem_itens import PECAS, SERVICOS
+
+
+class NormalizarTests(SimpleTestCase):
+    def test_total_sempre_derivado_de_quan_e_unit(self):
+        dados = ordem_itens.normalizar(PECAS, {
+            "peca_codi": "A", "peca_quan": Decimal("3"), "peca_unit": Decimal("1.335"),
+            "peca_tota": Decimal("999"), "produto_nome": "só exibição",
+        })
+        self.assertEqual(dados["peca_tota"], Decimal("4.00"))
+        self.assertNotIn("produto_nome", dados)
+
+    def test_sem_quan_ou_unit_mantem_total_informado(self):
+        dados = ordem_itens.normalizar(SERVICOS, {"serv_codi": "S", "serv_tota": Decimal("50")})
+        self.assertEqual(dados["serv_tota"], Decimal("50"))
+
+
+class ValidarTests(SimpleTestCase):
+    def test_codigo_obrigatorio_e_id_unico(self):
+        with self.assertRaises(ordem_itens.ItensErro) as ctx:
+            ordem_itens.validar(PECAS, [
+                {"peca_id": 1, "peca_codi": "A"}, {"peca_id": "1", "peca_codi": "B"}, {"peca_quan": 1},
+            ])
+        detalhes = ctx.exception.payload["detalhes"]
+        self.assertEqual([d["indice"] for d in detalhes], [1, 2])
+        self.assertEqual(ctx.exception.payload["campo"], "pecas")
+
+    def test_codigos_repetidos_sao_aceitos(self):
+        validos = ordem_itens.validar(PECAS, [{"peca_codi": "A"}, {"peca_codi": "A"}])
+        self.assertEqual([i for i, _ in validos], [0, 1])
+
+    def test_mantem_o_id_convertido(self):
+        validos = ordem_itens.validar(PECAS, [{"peca_id": "7", "peca_codi": "A"}, {"peca_id": "", "peca_codi": "B"}])
+        self.assertEqual(validos, [(0, {"peca_id": 7, "peca_codi": "A"}), (1, {"peca_codi": "B"})])
+
+    def test_com_ids_recoloca_o_id_enviado(self):
+        itens = ordem_itens.com_ids(PECAS, [{"peca_id": 5, "peca_codi": "A"}, {"peca_codi": "B"}], [
+            {"peca_codi": "A"}, {"peca_codi": "B"},
+        ])
+        self.assertEqual(itens, [{"peca_codi": "A", "peca_id": 5}, {"peca_codi": "B"}])
+
+
+class LoteTests(SimpleTestCase):
+    def test_preparar_descarta_ids_e_grava_as_chaves_da_ordem(self):
+        (obj,) = ordem_itens.preparar(PECAS, [{"peca_id": 3, "peca_codi": "A"}], 1, 2, 10)
+        self.assertEqual((obj.peca_id, obj.peca_empr, obj.peca_fili, obj.peca_orde), (None, 1, 2, 10))
+
+    def test_validar_produtos_consulta_o_modelo_de_produtos_uma_vez(self):
+        objs = ordem_itens.preparar(PECAS, [{"peca_codi": "A"}, {"peca_codi": "B"}], 1, 1, 10)
+        with mock.patch.object(ordem_itens.Produtos.objects, "using") as using:
+            using.return_value.filter.return_value.values_list.return_value = ["A"]
+            with self.assertRaises(ordem_itens.ItensErro) as ctx:
+                ordem_itens.validar_produtos("default", 1, ordem_itens.codigos(PECAS, objs))
+        using.assert_called_once_with("default")
+        self.assertEqual(ctx.exception.payload["detalhes"], [{"indice": 1, "campos": {"peca_codi": ["produto inexistente"]}}])
+
+
+class DiferencaTests(SimpleTestCase):
+    def _gravada(self, ident, codigo, quan="1", unit="1.00"):
+        return ordem_itens.PECAS.model(
+            peca_id=ident, peca_empr=1, peca_fili=1, peca_orde=10, peca_codi=codigo,
+            peca_quan=Decimal(quan), peca_unit=Decimal(unit), peca_tota=Decimal(quan) * Decimal(unit),
+        )
+
+    def _atuais(self, *objs):
+        return {o.peca_id: o for o in objs}
+
+    def test_so_quan_alterada_recalcula_total_com_unit_gravado(self):
+        atuais = self._atuais(self._gravada(1, "A", "2", "10.00"))
+        recebidos = ordem_itens.validar(PECAS, [{"peca_id": 1, "peca_codi": "A", "peca_quan": Decimal("3")}])
+        inserir, atualizar, remover, conferir = ordem_itens.diferenca(PECAS, atuais, recebidos, remover_ausentes=False)
+        self.assertEqual((inserir, remover, conferir), ([], [], []))
+        self.assertEqual(atualizar[0][1], {"peca_quan": Decimal("3"), "peca_tota": Decimal("30.00")})
+
+    def test_so_unit_alterado_recalcula_total_com_quan_gravada(self):
+        atuais = self._atuais(self._gravada(1, "A", "2", "10.00"))
+        recebidos = ordem_itens.validar(PECAS, [{"peca_id": 1, "peca_codi": "A", "peca_unit": Decimal("7.50")}])
+        _, atualizar, _, _ = ordem_itens.diferenca(PECAS, atuais, recebidos)
+        self.assertEqual(atualizar[0][1], {"peca_unit": Decimal("7.50"), "peca_tota": Decimal("15.00")})
+
+    def test_item_igual_nao_gera_update_e_ausente_e_removido(self):
+        atuais = self._atuais(self._gravada(1, "A", "2", "10.00"), self._gravada(2, "B"))
+        recebidos = ordem_itens.validar(PECAS, [
+            {"peca_id": 1, "peca_codi": "A", "peca_quan": Decimal("2"), "peca_unit": Decimal("10.00")},
+            {"peca_codi": "C", "peca_quan": Decimal("1"), "peca_unit": Decimal("5")},
+        ])
+        inserir, atualizar, remover, conferir = ordem_itens.diferenca(PECAS, atuais, recebidos)
+        self.assertEqual(atualizar, [])
+        self.assertEqual(remover, [2])
+        self.assertEqual([(o.peca_codi, o.peca_tota) for o in inserir], [("C", Decimal("5.00"))])
+        self.assertEqual(conferir, [(1, "C")])
+
+    def test_linhas_com_o_mesmo_codigo_sao_distinguidas_pelo_id(self):
+        atuais = self._atuais(self._gravada(1, "A"), self._gravada(2, "A"))
+        recebidos = ordem_itens.validar(PECAS, [{"peca_id": 2, "peca_codi": "A", "peca_quan": Decimal("4")}])
+        _, atualizar, remover, _ = ordem_itens.diferenca(PECAS, atuais, recebidos)
+        self.assertEqual([obj.peca_id for obj, _ in atualizar], [2])
+        self.assertEqual(remover, [1])
+
+    def test_itens_sem_id_ocupam_as_linhas_livres_do_mesmo_codigo(self):
+        atuais = self._atuais(self._gravada(1, "A"), self._gravada(2, "A"), self._gravada(3, "B"))
+        recebidos = ordem_itens.validar(PECAS, [
+            {"peca_codi": "A"}, {"peca_codi": "A"}, {"peca_codi": "A"}, {"peca_id": 3, "peca_codi": "B"},
+        ])
+        inserir, atualizar, remover, conferir = ordem_itens.diferenca(PECAS, atuais, recebidos)
+        self.assertEqual((atualizar, remover), ([], []))
+        self.assertEqual([o.peca_codi for o in inserir], ["A"])
+        self.assertEqual(conferir, [(2, "A")])
+
+    def test_codigo_trocado_e_conferido(self):
+        atuais = self._atuais(self._gravada(1, "A"))
+        recebidos = ordem_itens.validar(PECAS, [{"peca_id": 1, "peca_codi": "Z"}])
+        _, atualizar, _, conferir = ordem_itens.diferenca(PECAS, atuais, recebidos)
+        self.assertEqual(atualizar[0][1]["peca_codi"], "Z")
+        self.assertEqual(conferir, [(0, "Z")])
+
+    def test_delta_sem_id_e_sempre_inclusao(self):
+        atuais = self._atuais(self._gravada(1, "A"))
+        recebidos = ordem_itens.validar(PECAS, [{"peca_codi": "A"}])
+        inserir, atualizar, _, _ = ordem_itens.diferenca(
+            PECAS, atuais, recebidos, remover_ausentes=False, casar_por_codigo=False,
+        )
+        self.assertEqual((len(inserir), atualizar), (1, []))
+
+
+class SincronizarTests(SimpleTestCase):
+    def test_produto_descontinuado_ja_gravado_nao_bloqueia(self):
+        gravada = DiferencaTests._gravada(None, 1, "DESCONTINUADO")
+        ordem = mock.Mock(orde_empr=1, orde_fili=1, orde_nume=10)
+        with mock.patch.object(ordem_itens, "_atuais", return_value={1: gravada}), \
+                mock.patch.object(ordem_itens, "_aplicar") as aplicar, \
+                mock.patch.object(ordem_itens, "validar_produtos") as validar_produtos:
+            ordem_itens.sincronizar("default", PECAS, ordem, [
+                {"peca_id": 1, "peca_codi": "DESCONTINUADO", "peca_quan": Decimal("2")},
+            ])
+        validar_produtos.assert_called_once_with("default", 1, [])
+        self.assertEqual(aplicar.call_args[0][5], [])
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import ordem_loaders
+
+
+class CarregarRelacionadosTests(SimpleTestCase):
+    def setUp(self):
+        self.ordens = [SimpleNamespace(orde_empr=1, orde_fili=1, orde_nume=10, orde_seto=2, orde_enti=5)]
+        self.chamadas = []
+
+        def loader(nome):
+            def carregar(banco, ordens):
+                self.chamadas.append((nome, banco, len(ordens)))
+                return {nome: True}
+            return carregar
+
+        self.loaders = {nome: loader(nome) for nome in ordem_loaders.LOADERS}
+
+    def test_roda_em_sequencia_no_banco_da_requisicao(self):
+        with mock.patch.dict(ordem_loaders.LOADERS, self.loaders):
+            mapas, tempos = ordem_loaders.carregar_relacionados("cliente_x", self.ordens)
+        self.assertEqual([c[0] for c in self.chamadas], list(ordem_loaders.LOADERS))
+        self.assertTrue(all(c[1] == "cliente_x" for c in self.chamadas))
+        self.assertEqual(set(mapas), set(ordem_loaders.LOADERS))
+        self.assertEqual(set(tempos), set(ordem_loaders.LOADERS))
+
+    def test_so_os_loaders_pedidos(self):
+        with mock.patch.dict(ordem_loaders.LOADERS, self.loaders):
+            mapas, _ = ordem_loaders.carregar_relacionados("default", self.ordens, nomes=["setores"])
+        self.assertEqual(list(mapas), ["setores"])
+        self.assertEqual(self.chamadas, [("setores", "default", 1)])
+
+    def test_sem_ordens_nao_consulta(self):
+        with mock.patch.dict(ordem_loaders.LOADERS, self.loaders):
+            mapas, tempos = ordem_loaders.carregar_relacionados("default", [], nomes=["pecas", "clientes"])
+        self.assertEqual(mapas, {"pecas": {}, "clientes": {}})
+        self.assertEqual(tempos, {})
+        self.assertEqual(self.chamadas, [])
@@ -0,0 +1,99 @@
+import base64
+from datetime import date
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from ...models import Ordemservico
+from .. import ordem_sync
+
+
+def _ordem(**kw):
+    dados = dict(orde_empr=1, orde_fili=1, orde_nume=10, orde_stat_orde=0, orde_seto=3, sync_chave=None)
+    dados.update(kw)
+    return SimpleNamespace(**dados)
+
+
+class NormalizarDesdeTests(SimpleTestCase):
+    def test_data_e_data_hora_viram_date(self):
+        self.assertEqual(ordem_sync.normalizar_desde("2025-03-01"), date(2025, 3, 1))
+        self.assertEqual(ordem_sync.normalizar_desde("2025-03-01T10:00:00"), date(2025, 3, 1))
+        self.assertIsNone(ordem_sync.normalizar_desde(""))
+
+    def test_valor_invalido(self):
+        with self.assertRaises(ordem_sync.SyncErro):
+            ordem_sync.normalizar_desde("ontem")
+
+
+class CursorTests(SimpleTestCase):
+    def test_ida_e_volta_com_data_e_com_nulo(self):
+        cursor = ordem_sync.codificar_cursor(date(2025, 3, 1), 1, 2, 42)
+        self.assertEqual(ordem_sync.decodificar_cursor(cursor), (date(2025, 3, 1), (1, 2, 42)))
+        cursor = ordem_sync.codificar_cursor(None, 1, 1, 7)
+        self.assertEqual(ordem_sync.decodificar_cursor(cursor), (None, (1, 1, 7)))
+
+    def test_cursor_invalido(self):
+        data_ruim = base64.urlsafe_b64encode(b'{"c":"2025-13-40","e":1,"f":1,"n":1}').decode("ascii")
+        sem_filial = base64.urlsafe_b64encode(b'{"c":"2025-03-01","n":1}').decode("ascii")
+        for texto in ("xx", data_ruim, sem_filial):
+            with self.assertRaises(ordem_sync.SyncErro):
+                ordem_sync.decodificar_cursor(texto)
+
+
+class FiltrarTests(SimpleTestCase):
+    def test_compara_data_tipada_e_ordena_nulos_primeiro(self):
+        qs = ordem_sync.filtrar(
+            Ordemservico.objects.all(), "orde_ulti_alte_safe", date(2025, 3, 1),
+            ordem_sync.codificar_cursor(date(2025, 3, 2), 1, 2, 42), 200,
+        )
+        sql, params = qs.query.sql_with_params()
+        self.assertIn("(orde_ulti_alte_safe)::date >= %s", sql)
+        self.assertIn("(orde_empr, orde_fili, orde_nume) > (%s, %s, %s)", sql)
+        self.assertNotIn("::text", sql)
+        self.assertEqual(params[:6], (date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 2), 1, 2, 42))
+        self.assertTrue(qs.query.order_by[0].nulls_first)
+        self.assertEqual(qs.query.high_mark, 201)
+
+
+class EscopoTests(SimpleTestCase):
+    def _where(self, setor, desde):
+        sql, _ = ordem_sync.escopo(Ordemservico.objects.all(), setor, desde).query.sql_with_params()
+        return sql.partition("WHERE")[2]
+
+    def test_completa_so_a_listagem_do_usuario(self):
+        where = self._where(3, None)
+        self.assertIn("orde_stat_orde", where)
+        self.assertIn("orde_seto", where)
+
+    def test_incremental_ve_todas_as_alteradas(self):
+        self.assertEqual(self._where(3, date(2025, 3, 1)), "")
+
+
+class MarcasDeRemocaoTests(SimpleTestCase):
+    def test_motivos(self):
+        self.assertIsNone(ordem_sync.motivo_remocao(_ordem()))
+        self.assertEqual(ordem_sync.motivo_remocao(_ordem(orde_stat_orde=4)), "fechada")
+        self.assertEqual(ordem_sync.motivo_remocao(_ordem(orde_seto=0)), "sem_setor")
+        self.assertIsNone(ordem_sync.motivo_remocao(_ordem(), setor=3))
+        self.assertEqual(ordem_sync.motivo_remocao(_ordem(), setor=5), "fora_do_setor")
+
+    def test_marca_fora_do_setor_so_leva_a_chave(self):
+        marca = ordem_sync.marca_remocao(_ordem(), "fora_do_setor")
+        self.assertNotIn("orde_seto", marca)
+        self.assertNotIn("orde_stat_orde", marca)
+        self.assertEqual((marca["orde_nume"], marca["motivo"]), (10, "fora_do_setor"))
+
+    def test_marca_leva_chave_iso(self):
+        marca = ordem_sync.marca_remocao(_ordem(orde_stat_orde=4, sync_chave=date(2025, 3, 1)), "fechada")
+        self.assertEqual(marca["orde_ulti_alte"], "2025-03-01")
+        self.assertEqual(marca["motivo"], "fechada")
+
+    def test_watermark(self):
+        self.assertEqual(ordem_sync.watermark([_ordem(sync_chave=date(2025, 3, 5))], None), "2025-03-05")
+        self.assertEqual(ordem_sync.watermark([], date(2025, 3, 1)), "2025-03-01")
+        self.assertEqual(ordem_sync.watermark([_ordem()], None), "")
+
+    def test_marcar_alterada(self):
+        ordem = _ordem()
+        self.assertEqual(ordem_sync.marcar_alterada(ordem), "orde_ulti_alte")
+        self.assertIsInstance(ordem.orde_ulti_alte, date)
@@ -0,0 +1,66 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+
+from ...models import Ordemservico, Ordemservicopecas, Ordemservicoservicos
+from .. import ordem_totais
+from ..management.commands.recalcular_totais_os import Command as RecalcularTotais
+
+MODELOS = (Ordemservico, Ordemservicopecas, Ordemservicoservicos)
+
+
+class OrdemTotaisTests(TransactionTestCase):
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            for model in MODELOS:
+                editor.create_model(model)
+        self.addCleanup(self._remover_tabelas)
+
+    def _remover_tabelas(self):
+        with connection.schema_editor() as editor:
+            for model in MODELOS:
+                editor.delete_model(model)
+
+    def _ordem(self, nume, status=0, tota=None, pecas=(), servicos=()):
+        ordem = Ordemservico.objects.create(
+            orde_empr=1, orde_fili=1, orde_nume=nume, orde_stat_orde=status, orde_tota=tota,
+        )
+        for valor in pecas:
+            Ordemservicopecas.objects.create(
+                peca_empr=1, peca_fili=1, peca_orde=nume, peca_codi="P", peca_tota=Decimal(valor),
+            )
+        for valor in servicos:
+            Ordemservicoservicos.objects.create(
+                serv_empr=1, serv_fili=1, serv_orde=nume, serv_codi="S", serv_tota=Decimal(valor),
+            )
+        return ordem
+
+    def _total(self, nume):
+        return Ordemservico.objects.get(orde_nume=nume).orde_tota
+
+    def test_total_e_soma_das_pecas_mais_soma_dos_servicos(self):
+        ordem = self._ordem(1, pecas=("10.50", "4.50"), servicos=("100.00",))
+        self.assertEqual(ordem_totais.atualizar_total("default", ordem), Decimal("115.00"))
+        self.assertEqual(self._total(1), Decimal("115.00"))
+        self.assertIsNotNone(Ordemservico.objects.get(orde_nume=1).orde_ulti_alte)
+
+    def test_ordem_sem_itens_vale_zero(self):
+        ordem = self._ordem(2, tota=Decimal("50"))
+        self.assertEqual(ordem_totais.atualizar_total("default", ordem), Decimal("0"))
+
+    def test_comando_so_conta_sem_aplicar(self):
+        self._ordem(3, tota=Decimal("1"), pecas=("20",))
+        saida = StringIO()
+        call_command(RecalcularTotais(), stdout=saida)
+        self.assertIn("1 ordens abertas com total divergente", saida.getvalue())
+        self.assertEqual(self._total(3), Decimal("1"))
+
+    def test_comando_nao_toca_ordens_fechadas(self):
+        self._ordem(4, status=0, tota=Decimal("1"), pecas=("20",))
+        self._ordem(5, status=4, tota=Decimal("1"), pecas=("20",))
+        call_command(RecalcularTotais(), "--aplicar", stdout=StringIO())
+        self.assertEqual(self._total(4), Decimal("20"))
+        self.assertEqual(self._total(5), Decimal("1"))
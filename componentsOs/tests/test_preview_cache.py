@@ -0,0 +1,63 @@
+import base64
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import preview_cache
+
+
+def _arquivo(codigo):
+    return SimpleNamespace(arqu_empr=1, arqu_fili=1, arqu_os=100, arqu_codi_arqu=codigo)
+
+
+class PreviewCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.override = override_settings(OS_PREVIEW_CACHE_DIR=self.dir)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def test_hash_e_da_origem_e_arquivos_iguais_compartilham_entrada(self):
+        origem = preview_cache.hash_origem(memoryview(b"conteudo do pdf"))
+        preview_cache.guardar("default", _arquivo(1), origem, b"preview-1")
+
+        self.assertTrue(preview_cache.apontar_existente("default", _arquivo(2), origem))
+        self.assertEqual(preview_cache.consultar("default", _arquivo(2), "preview"), (True, b"preview-1"))
+
+    def test_arquivo_substituido_nao_reaproveita_preview_antigo(self):
+        antigo = preview_cache.hash_origem(b"versao 1")
+        preview_cache.guardar("default", _arquivo(1), antigo, b"preview-v1")
+        preview_cache.descartar("default", _arquivo(1))
+
+        self.assertEqual(preview_cache.consultar("default", _arquivo(1)), (False, None))
+        novo = preview_cache.hash_origem(b"versao 2")
+        self.assertNotEqual(antigo, novo)
+        self.assertFalse(preview_cache.apontar_existente("default", _arquivo(1), novo))
+
+    def test_texto_que_nao_e_base64_e_rejeitado(self):
+        self.assertIsNone(preview_cache._normalizar("isto não é base64!"))
+        self.assertEqual(preview_cache._normalizar("data:image/png;base64," + base64.b64encode(b"png").decode()), b"png")
+        self.assertEqual(preview_cache._normalizar(base64.b64encode(b"jpg").decode()), b"jpg")
+
+    def test_sem_preview_fica_registrado(self):
+        origem = preview_cache.hash_origem(b"zip")
+        preview_cache.guardar("default", _arquivo(3), origem, None)
+        self.assertEqual(preview_cache.consultar("default", _arquivo(3)), (True, None))
+
+    @override_settings(OS_PREVIEW_CACHE_MAX_INDICES=10)
+    def test_limpeza_remove_indices_orfaos_e_excedentes(self):
+        origem = preview_cache.hash_origem(b"a")
+        preview_cache.guardar("default", _arquivo(1), origem, b"p")
+        for codigo in range(2, 20):
+            preview_cache.guardar("default", _arquivo(codigo), None, None)
+        os.unlink(preview_cache._caminho_blob(origem, "thumb"))
+
+        preview_cache.limpar()
+
+        indices = [n for _, _, arquivos in os.walk(os.path.join(self.dir, "idx")) for n in arquivos]
+        self.assertLessEqual(len(indices), 9)
+        self.assertEqual(preview_cache.consultar("default", _arquivo(1)), (False, None))
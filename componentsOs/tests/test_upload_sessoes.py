@@ -0,0 +1,41 @@
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import upload_sessoes
+
+
+def _ordem(numero=100):
+    return SimpleNamespace(orde_empr=1, orde_fili=1, orde_nume=numero)
+
+
+class UploadSessoesTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.override = override_settings(OS_UPLOAD_DIR=self.dir)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.sessao = upload_sessoes.criar_sessao(
+            "default", _ordem(), 7, [{"nome": "foto.jpg", "tamanho": 10}], dono=7
+        )
+
+    def test_dono_carrega_a_sessao(self):
+        sessao = upload_sessoes.carregar_sessao(self.sessao["id"], "default", _ordem(), 7)
+        self.assertEqual(sessao["id"], self.sessao["id"])
+
+    def test_outro_usuario_nao_ve_a_sessao(self):
+        with self.assertRaises(upload_sessoes.UploadErro) as ctx:
+            upload_sessoes.carregar_sessao(self.sessao["id"], "default", _ordem(), 8)
+        self.assertEqual(ctx.exception.status, 404)
+
+    def test_sessao_sem_dono_e_recusada(self):
+        sessao = upload_sessoes.criar_sessao("default", _ordem(), 7, [{"nome": "a", "tamanho": 1}])
+        with self.assertRaises(upload_sessoes.UploadErro):
+            upload_sessoes.carregar_sessao(sessao["id"], "default", _ordem(), None)
+
+    def test_outra_ordem_nao_ve_a_sessao(self):
+        with self.assertRaises(upload_sessoes.UploadErro):
+            upload_sessoes.carregar_sessao(self.sessao["id"], "default", _ordem(101), 7)
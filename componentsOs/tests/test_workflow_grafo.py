@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase
+
+from ...models import WorkflowSetor
+from .. import workflow_grafo
+
+
+def _transicao(origem, destino, ordem=1):
+    return SimpleNamespace(wkfl_seto_orig=origem, wkfl_seto_dest=destino, wkfl_orde=ordem)
+
+
+class WorkflowGrafoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        workflow_grafo._grafos.clear()
+        self.addCleanup(workflow_grafo._grafos.clear)
+
+    def test_grafo_permite_so_transicoes_cadastradas(self):
+        grafo = workflow_grafo.GrafoWorkflow([_transicao(1, 2), _transicao(2, 3)])
+        self.assertTrue(grafo.permite_avancar(1, "2"))
+        self.assertFalse(grafo.permite_avancar(1, 3))
+        self.assertTrue(grafo.permite_retornar(3, 2))
+
+    def test_chave_separa_empresa_e_filial(self):
+        grafos = {
+            ("default", 1, 1): workflow_grafo.GrafoWorkflow([_transicao(1, 2)]),
+            ("default", 2, 1): workflow_grafo.GrafoWorkflow([_transicao(1, 5)]),
+        }
+        with mock.patch.object(workflow_grafo, "_carregar", side_effect=lambda *c: grafos[c]) as carregar:
+            self.assertTrue(workflow_grafo.grafo_workflow("default", 1, 1).permite_avancar(1, 2))
+            self.assertFalse(workflow_grafo.grafo_workflow("default", 2, 1).permite_avancar(1, 2))
+            workflow_grafo.grafo_workflow("default", 1, 1)
+        self.assertEqual(carregar.call_count, 2)
+
+    def test_save_do_modelo_invalida_todas_as_empresas_do_banco(self):
+        with mock.patch.object(workflow_grafo, "_carregar", return_value=workflow_grafo.GrafoWorkflow([])) as carregar:
+            workflow_grafo.grafo_workflow("default", 1, 1)
+            workflow_grafo.grafo_workflow("default", 2, 1)
+            # Signal conectado na importação, sem passar por nenhuma função do módulo antes
+            post_save.send(sender=WorkflowSetor, instance=None, created=False, using="default")
+            workflow_grafo.grafo_workflow("default", 1, 1)
+            workflow_grafo.grafo_workflow("default", 2, 1)
+        self.assertEqual(carregar.call_count, 4)
+
+    def test_carregar_filtra_empresa_filial_e_ativos(self):
+        with mock.patch.object(WorkflowSetor.objects, "using") as using:
+            workflow_grafo._carregar("default", 1, 2)
+        using.assert_called_once_with("default")
+        using.return_value.filter.assert_called_once_with(wkfl_empr=1, wkfl_fili=2, wkfl_ativo=True)
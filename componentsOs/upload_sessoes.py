@@ -0,0 +1,269 @@
+"""
+Sessões de upload em partes (retomáveis) dos anexos da OS.
+
+O cliente abre uma sessão declarando os arquivos e envia cada arquivo em
+pedaços, que vão direto para disco (nada fica inteiro na memória). A qualquer
+momento o status informa quantos bytes de cada arquivo já chegaram, para
+retomar após queda de conexão. A sessão pertence ao usuário autenticado que a
+abriu; para qualquer outro ela não existe (404). Ao concluir, os arquivos são gravados pelo
+OsArquivoService em lotes limitados por tamanho, numa única transação.
+
+Configuração (settings):
+    OS_UPLOAD_DIR              diretório temporário das sessões (padrão: <tmp>/os_uploads)
+    OS_UPLOAD_MAX_BYTES        tamanho máximo por arquivo (padrão: 50 MB)
+    OS_UPLOAD_LOTE_MAX_BYTES   bytes por chamada a salvar_multiplos (padrão: 16 MB)
+    OS_UPLOAD_SESSAO_TTL       validade da sessão em segundos (padrão: 24 h)
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from ..services.os_arquivo_service import OsArquivoService
+from .arquivo_download import tipo_conteudo
+
+TAMANHO_LEITURA = 64 * 1024
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadErro(Exception):
+    def __init__(self, erro, status=400, **extra):
+        super().__init__(erro)
+        self.payload = {"erro": erro, **extra}
+        self.status = status
+
+
+def _diretorio():
+    return getattr(settings, 'OS_UPLOAD_DIR', None) or os.path.join(tempfile.gettempdir(), 'os_uploads')
+
+
+def _max_bytes():
+    return int(getattr(settings, 'OS_UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+
+
+def _lote_max_bytes():
+    return int(getattr(settings, 'OS_UPLOAD_LOTE_MAX_BYTES', 16 * 1024 * 1024))
+
+
+def _ttl():
+    return int(getattr(settings, 'OS_UPLOAD_SESSAO_TTL', 24 * 3600))
+
+
+def _pasta(sessao_id):
+    return os.path.join(_diretorio(), sessao_id)
+
+
+def _parte(sessao, indice):
+    return os.path.join(_pasta(sessao['id']), f"{indice}.part")
+
+
+def _salvar_meta(sessao):
+    caminho = os.path.join(_pasta(sessao['id']), 'sessao.json')
+    tmp = caminho + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(sessao, f)
+    os.replace(tmp, caminho)
+
+
+def _recebido(sessao, indice):
+    try:
+        return os.path.getsize(_parte(sessao, indice))
+    except FileNotFoundError:
+        return 0
+
+
+def limpar_expiradas():
+    raiz = _diretorio()
+    if not os.path.isdir(raiz):
+        return
+    limite = time.time() - _ttl()
+    for nome in os.listdir(raiz):
+        pasta = os.path.join(raiz, nome)
+        if _ID_RE.match(nome) and os.path.getmtime(pasta) < limite:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+def criar_sessao(banco, ordem, usuario, arquivos, dono=None):
+    if not isinstance(arquivos, list) or not arquivos:
+        raise UploadErro("campo_obrigatorio", campo="arquivos")
+
+    declarados = []
+    for i, arq in enumerate(arquivos):
+        try:
+            tamanho = int(arq.get("tamanho"))
+        except (AttributeError, TypeError, ValueError):
+            raise UploadErro("tamanho_invalido", indice=i)
+        if tamanho <= 0 or tamanho > _max_bytes():
+            raise UploadErro("tamanho_invalido", indice=i, maximo=_max_bytes())
+        declarados.append({
+            "nome": str(arq.get("nome") or f"arquivo_{i + 1}"),
+            "tamanho": tamanho,
+            "sha256": (arq.get("sha256") or "").lower() or None,
+        })
+
+    limpar_expiradas()
+    sessao = {
+        "id": uuid.uuid4().hex,
+        "banco": banco,
+        "empresa": ordem.orde_empr,
+        "filial": ordem.orde_fili,
+        "ordem": ordem.orde_nume,
+        "usuario": usuario,
+        "dono": dono,
+        "arquivos": declarados,
+        "criada_em": time.time(),
+    }
+    os.makedirs(_pasta(sessao['id']))
+    _salvar_meta(sessao)
+    return sessao
+
+
+def carregar_sessao(sessao_id, banco, ordem, dono=None):
+    if not _ID_RE.match(sessao_id or ''):
+        raise UploadErro("sessao_nao_encontrada", status=404)
+    try:
+        with open(os.path.join(_pasta(sessao_id), 'sessao.json'), encoding='utf-8') as f:
+            sessao = json.load(f)
+    except FileNotFoundError:
+        raise UploadErro("sessao_nao_encontrada", status=404)
+    if (sessao["banco"], sessao["empresa"], sessao["filial"], str(sessao["ordem"])) != (
+        banco, ordem.orde_empr, ordem.orde_fili, str(ordem.orde_nume)
+    ):
+        raise UploadErro("sessao_nao_encontrada", status=404)
+    # Só quem abriu a sessão pode consultar, enviar, concluir ou cancelar
+    if sessao.get("dono") is None or str(sessao["dono"]) != str(dono):
+        raise UploadErro("sessao_nao_encontrada", status=404)
+    return sessao
+
+
+def status_sessao(sessao):
+    arquivos = []
+    for i, arq in enumerate(sessao["arquivos"]):
+        recebido = _recebido(sessao, i)
+        arquivos.append({
+            "indice": i,
+            "nome": arq["nome"],
+            "tamanho": arq["tamanho"],
+            "recebido": recebido,
+            "completo": recebido == arq["tamanho"],
+        })
+    return {"sessao": sessao["id"], "arquivos": arquivos}
+
+
+def offset_do_request(request):
+    content_range = request.headers.get("Content-Range")
+    if content_range:
+        m = _CONTENT_RANGE_RE.match(content_range.strip())
+        if not m:
+            raise UploadErro("content_range_invalido")
+        return int(m.group(1))
+    try:
+        return int(request.query_params.get("offset", 0))
+    except (TypeError, ValueError):
+        raise UploadErro("offset_invalido")
+
+
+def pedacos_do_request(request):
+    """Itera o corpo do pedaço sem carregá-lo inteiro: arquivo multipart `chunk` ou corpo bruto."""
+    if request.content_type.startswith("multipart/"):
+        arquivo = request.FILES.get("chunk")
+        if arquivo is None:
+            raise UploadErro("campo_obrigatorio", campo="chunk")
+        yield from arquivo.chunks(TAMANHO_LEITURA)
+        return
+    stream = request.stream
+    if stream is None:
+        return
+    while True:
+        dados = stream.read(TAMANHO_LEITURA)
+        if not dados:
+            return
+        yield dados
+
+
+def gravar_pedaco(sessao, indice, offset, pedacos):
+    try:
+        arq = sessao["arquivos"][indice]
+    except (IndexError, TypeError):
+        raise UploadErro("indice_invalido", status=404)
+
+    recebido = _recebido(sessao, indice)
+    # offset > recebido deixaria um buraco; o cliente deve consultar o status e retomar
+    if offset > recebido:
+        raise UploadErro("offset_fora_de_ordem", status=409, recebido=recebido)
+
+    caminho = _parte(sessao, indice)
+    with open(caminho, 'r+b' if os.path.exists(caminho) else 'wb') as f:
+        # Reenvio de um pedaço já recebido sobrescreve a partir do offset
+        f.truncate(offset)
+        f.seek(offset)
+        total = offset
+        for dados in pedacos:
+            total += len(dados)
+            if total > arq["tamanho"]:
+                f.truncate(offset)
+                raise UploadErro("excede_tamanho_declarado", tamanho=arq["tamanho"])
+            f.write(dados)
+
+    os.utime(_pasta(sessao['id']))
+    return {"indice": indice, "recebido": total, "completo": total == arq["tamanho"]}
+
+
+def _data_uri(sessao, indice, arq):
+    caminho = _parte(sessao, indice)
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+    if arq["sha256"] and hashlib.sha256(conteudo).hexdigest() != arq["sha256"]:
+        raise UploadErro("sha256_divergente", indice=indice)
+    mime, _ = tipo_conteudo(conteudo[:16])
+    return f"data:{mime};base64,{base64.b64encode(conteudo).decode('ascii')}"
+
+
+def _lotes(sessao):
+    """Agrupa os arquivos em lotes de até OS_UPLOAD_LOTE_MAX_BYTES (ao menos um por lote)."""
+    lote, bytes_lote = [], 0
+    for i, arq in enumerate(sessao["arquivos"]):
+        if lote and bytes_lote + arq["tamanho"] > _lote_max_bytes():
+            yield lote
+            lote, bytes_lote = [], 0
+        lote.append(i)
+        bytes_lote += arq["tamanho"]
+    if lote:
+        yield lote
+
+
+def concluir_sessao(sessao):
+    pendentes = [a for a in status_sessao(sessao)["arquivos"] if not a["completo"]]
+    if pendentes:
+        raise UploadErro("upload_incompleto", status=409, pendentes=pendentes)
+
+    banco = sessao["banco"]
+    salvos = []
+    with transaction.atomic(using=banco):
+        for lote in _lotes(sessao):
+            # Só o lote atual é montado em base64; o restante continua em disco
+            arquivos = [
+                {"nome": sessao["arquivos"][i]["nome"], "base64": _data_uri(sessao, i, sessao["arquivos"][i])}
+                for i in lote
+            ]
+            salvos.extend(OsArquivoService.salvar_multiplos(
+                sessao["ordem"], arquivos, sessao["usuario"], sessao["empresa"], sessao["filial"], banco=banco
+            ))
+            del arquivos
+
+    descartar_sessao(sessao)
+    return salvos
+
+
+def descartar_sessao(sessao):
+    shutil.rmtree(_pasta(sessao['id']), ignore_errors=True)
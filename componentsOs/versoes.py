@@ -0,0 +1,35 @@
+"""
+Contadores de versão por banco (tenant) guardados no cache do Django.
+
+Caches em memória de processo comparam a versão a cada uso e se descartam
+quando ela muda; quem altera os dados incrementa. Com um cache compartilhado
+(Redis/Memcached) a invalidação vale para todos os workers; com LocMemCache
+vale só no processo, e os TTLs de cada cache cobrem o restante.
+"""
+from django.core.cache import cache
+
+PREFIXO = "os:versao"
+
+
+def _chave(escopo, banco):
+    return f"{PREFIXO}:{escopo}:{banco}"
+
+
+def obter_versao(escopo, banco):
+    chave = _chave(escopo, banco)
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, 1, None)
+        versao = cache.get(chave) or 1
+    return versao
+
+
+def incrementar_versao(escopo, banco):
+    chave = _chave(escopo, banco)
+    cache.add(chave, 1, None)
+    try:
+        return cache.incr(chave)
+    except ValueError:
+        # Chave expulsa do cache entre o add e o incr
+        cache.set(chave, 2, None)
+        return 2
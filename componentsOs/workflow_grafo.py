@@ -0,0 +1,86 @@
+"""
+Grafo de workflow de setores compilado em memória, por banco, empresa e filial.
+
+As transições ativas (wkfl_seto_orig -> wkfl_seto_dest) da empresa/filial da
+ordem mudam raramente, mas eram lidas do banco a cada abertura da OS. O grafo é
+carregado numa consulta, guardado por processo com mapas de adjacência nos dois
+sentidos e descartado quando a versão 'workflow' do banco muda (signals de
+save/delete de WorkflowSetor, conectados na importação do módulo) ou após
+OS_WORKFLOW_GRAFO_TTL segundos, para alterações feitas fora do Django.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from ..models import WorkflowSetor
+from .versoes import incrementar_versao, obter_versao
+
+ESCOPO = "workflow"
+
+_lock = threading.Lock()
+_grafos = {}
+
+
+def _ttl():
+    return int(getattr(settings, 'OS_WORKFLOW_GRAFO_TTL', 600))
+
+
+def _invalidar(sender, using=None, **kwargs):
+    if using:
+        incrementar_versao(ESCOPO, using)
+        with _lock:
+            for chave in [c for c in _grafos if c[0] == using]:
+                del _grafos[chave]
+
+
+post_save.connect(_invalidar, sender=WorkflowSetor, dispatch_uid="os_workflow_grafo_save")
+post_delete.connect(_invalidar, sender=WorkflowSetor, dispatch_uid="os_workflow_grafo_delete")
+
+
+class GrafoWorkflow:
+    def __init__(self, transicoes):
+        self.proximos = defaultdict(list)
+        self.anteriores = defaultdict(list)
+        for t in sorted(transicoes, key=lambda t: (t.wkfl_orde is None, t.wkfl_orde)):
+            self.proximos[str(t.wkfl_seto_orig)].append(t)
+            self.anteriores[str(t.wkfl_seto_dest)].append(t)
+
+    def proximos_setores(self, setor):
+        return list(self.proximos.get(str(setor), ()))
+
+    def setores_anteriores(self, setor):
+        return list(self.anteriores.get(str(setor), ()))
+
+    def permite_avancar(self, setor_atual, setor_destino):
+        return any(str(t.wkfl_seto_dest) == str(setor_destino) for t in self.proximos.get(str(setor_atual), ()))
+
+    def permite_retornar(self, setor_atual, setor_origem):
+        return any(str(t.wkfl_seto_orig) == str(setor_origem) for t in self.anteriores.get(str(setor_atual), ()))
+
+
+def _carregar(banco, empresa, filial):
+    return GrafoWorkflow(list(
+        WorkflowSetor.objects.using(banco).filter(wkfl_empr=empresa, wkfl_fili=filial, wkfl_ativo=True)
+    ))
+
+
+def grafo_workflow(banco, empresa, filial):
+    chave = (banco, str(empresa), str(filial))
+    versao = obter_versao(ESCOPO, banco)
+    agora = time.monotonic()
+    with _lock:
+        atual = _grafos.get(chave)
+    if atual and atual[0] == versao and atual[1] > agora:
+        return atual[2]
+
+    grafo = _carregar(banco, empresa, filial)
+    with _lock:
+        _grafos[chave] = (versao, agora + _ttl(), grafo)
+    return grafo
+
+
+def invalidar(banco):
+    _invalidar(None, using=banco)
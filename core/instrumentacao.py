@@ -0,0 +1,232 @@
+"""
+Instrumentação por requisição dos viewsets (OS e NCM).
+
+Com a instrumentação ligada, cada requisição mede número de consultas, tempo
+de banco, tempo de serialização e tempo total. O execute_wrapper só é
+instalado em `initial()`, depois da autenticação e da resolução do alias do
+tenant (`get_banco()` registra o alias em settings.DATABASES na primeira
+requisição), para que a conexão da licença também seja medida; as consultas
+da autenticação ficam de fora. O resultado vai no cabeçalho `Server-Timing`, numa linha de log
+estruturada ("[TIMING] {json}") e num agregado em memória por
+(viewset, action, banco), exposto em `GET .../metricas/`.
+
+Desligada, o custo é uma comparação de flag por requisição. O estado é lido
+de settings.OS_INSTRUMENTACAO e pode ser trocado em tempo de execução com
+`POST .../metricas/ {"ativo": true|false}`; a troca vai para o cache do
+Django e cada processo relê a flag a cada INTERVALO_FLAG segundos.
+
+O tempo de serialização inclui as consultas feitas pelos campos aninhados
+durante o `.data`, então ele se sobrepõe ao tempo de banco.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from core import resolucao_banco
+
+logger = logging.getLogger(__name__)
+
+CHAVE_FLAG = "os:instrumentacao:ativo"
+INTERVALO_FLAG = 5
+
+_lock = threading.Lock()
+_flag = {"valor": None, "expira": 0.0}
+_agregado = {}
+
+
+def ativa():
+    agora = time.monotonic()
+    if agora < _flag["expira"]:
+        return _flag["valor"]
+    valor = cache.get(CHAVE_FLAG)
+    if valor is None:
+        valor = bool(getattr(settings, 'OS_INSTRUMENTACAO', False))
+    _flag.update(valor=bool(valor), expira=agora + INTERVALO_FLAG)
+    return _flag["valor"]
+
+
+def definir(valor):
+    cache.set(CHAVE_FLAG, bool(valor), None)
+    _flag.update(valor=bool(valor), expira=time.monotonic() + INTERVALO_FLAG)
+
+
+class Medicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.extras = {}
+
+    def wrapper(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - inicio) * 1000
+            self.consultas += 1
+
+    def total_ms(self):
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def server_timing(self, total_ms):
+        partes = [
+            f'db;dur={self.db_ms:.1f};desc="{self.consultas} consultas"',
+            f'ser;dur={self.serializer_ms:.1f}',
+        ]
+        partes += [f'{nome};dur={ms:.1f}' for nome, ms in self.extras.items()]
+        partes.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(partes)
+
+
+def registrar(chave, medicao, total_ms):
+    with _lock:
+        item = _agregado.setdefault(chave, {
+            "requisicoes": 0, "consultas": 0, "db_ms": 0.0, "serializer_ms": 0.0,
+            "total_ms": 0.0, "total_ms_max": 0.0,
+        })
+        item["requisicoes"] += 1
+        item["consultas"] += medicao.consultas
+        item["db_ms"] += medicao.db_ms
+        item["serializer_ms"] += medicao.serializer_ms
+        item["total_ms"] += total_ms
+        item["total_ms_max"] = max(item["total_ms_max"], total_ms)
+
+
+def resumo():
+    with _lock:
+        itens = [(chave, dict(v)) for chave, v in _agregado.items()]
+    saida = []
+    for (viewset, acao, banco), v in sorted(itens):
+        n = v["requisicoes"] or 1
+        saida.append({
+            "viewset": viewset,
+            "action": acao,
+            "banco": banco,
+            "requisicoes": v["requisicoes"],
+            "consultas_media": round(v["consultas"] / n, 1),
+            "db_ms_media": round(v["db_ms"] / n, 1),
+            "serializer_ms_media": round(v["serializer_ms"] / n, 1),
+            "total_ms_media": round(v["total_ms"] / n, 1),
+            "total_ms_max": round(v["total_ms_max"], 1),
+        })
+    return saida
+
+
+def limpar():
+    with _lock:
+        _agregado.clear()
+
+
+class InstrumentacaoMixin:
+    """Mixin de viewset: mede cada requisição quando a instrumentação está ligada."""
+
+    _medicao = None
+    _pilha = None
+    _banco_medido = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not ativa():
+            return super().dispatch(request, *args, **kwargs)
+
+        medicao = self._medicao = Medicao()
+        with ExitStack() as self._pilha:
+            response = super().dispatch(request, *args, **kwargs)
+
+        total_ms = medicao.total_ms()
+        for nome, ms in (getattr(self, '_tempos_prefetch', None) or {}).items():
+            medicao.extras[f"prefetch_{nome}"] = ms
+        for nome, ms in resolucao_banco.tempos_da_requisicao(request).items():
+            medicao.extras[f"resolucao_{nome}"] = ms
+        response['Server-Timing'] = medicao.server_timing(total_ms)
+
+        chave = (type(self).__name__, getattr(self, 'action', None) or request.method.lower(), self._banco_medido)
+        registrar(chave, medicao, total_ms)
+        logger.info("[TIMING] " + json.dumps({
+            "viewset": chave[0], "action": chave[1], "banco": chave[2],
+            "status": response.status_code, "consultas": medicao.consultas,
+            "db_ms": round(medicao.db_ms, 1), "serializer_ms": round(medicao.serializer_ms, 1),
+            "total_ms": round(total_ms, 1),
+        }))
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self._medicao is None or self._pilha is None:
+            return
+        # Resolve os aliases antes de instalar os wrappers: connections.all()
+        # só enxerga os bancos já registrados
+        self._banco_medido = self._banco_instrumentacao()
+        obter_ncm = getattr(self, '_get_ncm_db', None)
+        if obter_ncm is not None:
+            try:
+                obter_ncm()
+            except Exception:
+                pass
+        for conn in connections.all():
+            self._pilha.enter_context(conn.execute_wrapper(self._medicao.wrapper))
+
+    def _banco_instrumentacao(self):
+        for nome in ('get_banco', '_get_banco'):
+            metodo = getattr(self, nome, None)
+            if metodo is None:
+                continue
+            try:
+                return metodo()
+            except Exception:
+                return None
+        return None
+
+    @contextmanager
+    def medir_serializacao(self):
+        medicao = self._medicao
+        if medicao is None:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            medicao.serializer_ms += (time.perf_counter() - inicio) * 1000
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self._medicao is not None:
+            to_representation = serializer.to_representation
+
+            def medido(instance):
+                with self.medir_serializacao():
+                    return to_representation(instance)
+
+            serializer.to_representation = medido
+        return serializer
+
+    @action(detail=False, methods=["get", "post"], url_path="metricas", permission_classes=[IsAdminUser])
+    def metricas(self, request, *args, **kwargs):
+        """
+        GET: agregados do processo por viewset/action/banco, resolução de banco e conexões.
+        POST {"ativo": bool, "limpar": bool, "invalidar_resolucao": bool}: liga/desliga a
+        instrumentação, zera os agregados e descarta o cache de resolução de bancos.
+        """
+        if request.method == "POST":
+            if "ativo" in request.data:
+                valor = request.data.get("ativo")
+                if not isinstance(valor, bool):
+                    return Response({"erro": "valor_invalido", "campo": "ativo"}, status=status.HTTP_400_BAD_REQUEST)
+                definir(valor)
+            if request.data.get("limpar"):
+                limpar()
+                resolucao_banco.limpar_metricas()
+            if request.data.get("invalidar_resolucao"):
+                resolucao_banco.invalidar()
+        return Response({"ativo": ativa(), "metricas": resumo(), **resolucao_banco.metricas()})
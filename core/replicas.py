@@ -0,0 +1,166 @@
+"""
+Leitura em réplica para os viewsets (OS e NCM).
+
+Cada banco de licença pode ter um alias de réplica em settings.DATABASES:
+    OS_REPLICAS       {'<alias primário>': '<alias réplica>'} (explícito), e/ou
+    OS_REPLICA_SUFIXO sufixo de convenção, ex.: '_replica' -> 'cliente_x_replica'
+Sem réplica configurada tudo continua no primário.
+
+Política (alias_leitura):
+- só GET/HEAD/OPTIONS vão para a réplica; escritas e as ações listadas em
+  `acoes_primario` do viewset ficam no primário;
+- depois de uma escrita bem-sucedida o usuário fica preso ao primário por
+  OS_REPLICA_JANELA segundos (padrão: 10), para ler o que acabou de gravar;
+- a réplica é verificada no máximo a cada VERIFICACAO_TTL s por processo: se
+  não responder, ou se o atraso de replicação passar de OS_REPLICA_ATRASO_MAX
+  segundos (padrão: 30), as leituras voltam ao primário.
+
+Só os querysets de leitura mudam de alias. Chaves de cache, versões de ETag,
+feed e previews continuam no alias primário (`get_banco()`), que é a
+identidade do tenant. Como a versão do ETag já reflete a escrita e o corpo
+vem da réplica, `impressao_leitura()` acrescenta ao ETag a posição de replay
+da réplica, lida antes do corpo: quem ler durante o atraso recebe o corpo
+antigo com um ETag que muda assim que a réplica avança.
+
+Para testar localmente basta um segundo alias apontando para o mesmo banco:
+    DATABASES['default_replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    OS_REPLICA_SUFIXO = '_replica'
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+VERIFICACAO_TTL = 10
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+
+_saude_por_alias = {}
+
+
+def replica_de(banco):
+    """Alias da réplica do banco, ou None."""
+    explicita = (getattr(settings, 'OS_REPLICAS', None) or {}).get(banco)
+    if explicita:
+        return explicita if explicita in connections.databases else None
+    sufixo = getattr(settings, 'OS_REPLICA_SUFIXO', None)
+    if sufixo and f"{banco}{sufixo}" in connections.databases:
+        return f"{banco}{sufixo}"
+    return None
+
+
+def _janela():
+    return float(getattr(settings, 'OS_REPLICA_JANELA', 10))
+
+
+def _atraso_replicacao(alias):
+    with connections[alias].cursor() as cursor:
+        # Fora de recuperação (alias local apontando para o primário) o atraso é zero
+        cursor.execute(
+            "SELECT CASE WHEN pg_is_in_recovery() "
+            "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+            "ELSE 0 END"
+        )
+        return float(cursor.fetchone()[0] or 0)
+
+
+def _atraso_maximo():
+    return float(getattr(settings, 'OS_REPLICA_ATRASO_MAX', 30))
+
+
+def posicao_replica(alias):
+    """LSN de replay da réplica (None fora de recuperação, ex.: alias local apontando para o primário)."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT pg_last_wal_replay_lsn()::text")
+        return cursor.fetchone()[0]
+
+
+def replica_saudavel(alias):
+    agora = time.monotonic()
+    cache_local = _saude_por_alias.get(alias)
+    if cache_local is not None and cache_local[1] > agora:
+        return cache_local[0]
+    try:
+        atraso = _atraso_replicacao(alias)
+        saudavel = atraso <= _atraso_maximo()
+        if not saudavel:
+            logger.warning(f"[REPLICA] {alias} atrasada {atraso:.1f}s; leituras no primário")
+    except Exception as e:
+        logger.warning(f"[REPLICA] {alias} indisponível: {e}")
+        saudavel = False
+    _saude_por_alias[alias] = (saudavel, agora + VERIFICACAO_TTL)
+    return saudavel
+
+
+def invalidar_cache(alias=None):
+    if alias is None:
+        _saude_por_alias.clear()
+    else:
+        _saude_por_alias.pop(alias, None)
+
+
+def _chave_janela(request, banco):
+    usuario = getattr(getattr(request, 'user', None), 'pk', None)
+    return f"os:replica:escrita:{banco}:{usuario}" if usuario is not None else None
+
+
+def marcar_escrita(request, banco):
+    """Prende o usuário ao primário pela janela de leitura-após-escrita."""
+    chave = _chave_janela(request, banco)
+    if chave and replica_de(banco):
+        cache.set(chave, True, _janela())
+
+
+def em_janela(request, banco):
+    chave = _chave_janela(request, banco)
+    return bool(chave and cache.get(chave))
+
+
+def alias_leitura(request, banco, acao=None, acoes_primario=()):
+    if request.method not in METODOS_LEITURA or acao in acoes_primario:
+        return banco
+    replica = replica_de(banco)
+    if not replica or em_janela(request, banco) or not replica_saudavel(replica):
+        return banco
+    return replica
+
+
+class LeituraReplicaMixin:
+    """
+    `get_banco_leitura()` devolve o alias para os querysets de leitura da
+    requisição; escritas bem-sucedidas abrem a janela de leitura no primário.
+    """
+    acoes_primario = ()
+
+    def _banco_primario(self):
+        return self.get_banco()
+
+    def get_banco_leitura(self):
+        if not hasattr(self, '_banco_leitura'):
+            self._banco_leitura = alias_leitura(
+                self.request, self._banco_primario(), getattr(self, 'action', None), self.acoes_primario
+            )
+        return self._banco_leitura
+
+    def impressao_leitura(self):
+        """Parte do ETag que depende do alias lido: a posição de replay quando é a réplica."""
+        leitura = self.get_banco_leitura()
+        if leitura == self._banco_primario():
+            return None
+        return leitura, posicao_replica(leitura)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        status_code = getattr(response, 'status_code', 500)
+        try:
+            if request.method not in METODOS_LEITURA and 200 <= status_code < 300:
+                marcar_escrita(request, self._banco_primario())
+            elif hasattr(self, '_banco_leitura'):
+                response['X-Banco-Leitura'] = (
+                    'replica' if self._banco_leitura != self._banco_primario() else 'primario'
+                )
+        except Exception as e:
+            logger.warning(f"[REPLICA] falha ao registrar escrita: {e}")
+        return super().finalize_response(request, response, *args, **kwargs)
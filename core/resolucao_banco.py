@@ -0,0 +1,217 @@
+"""
+Resolução do banco do tenant com cache, compartilhada pelos viewsets.
+
+`get_licenca_db_config(request)` e `get_ncm_master_db(banco)` rodavam várias
+vezes por requisição (o viewset de NCM chama `_get_ncm_db` no contexto do
+serializer, no mapa de NCMs e na busca). Quem chama passa a função de
+core.utils a memoizar:
+
+    banco = banco_da_requisicao(request, get_licenca_db_config)
+    ncm = banco_ncm(banco, get_ncm_master_db)
+
+- a licença é resolvida uma vez por requisição e o resultado fica no próprio
+  request. Não há cache entre requisições: `get_licenca_db_config` também
+  confere se a licença está bloqueada ou vencida, e isso vale a cada requisição;
+- banco -> alias do NCM mestre fica em memória do processo por
+  OS_RESOLUCAO_TTL segundos (padrão: 300). Só resultados bem-sucedidos entram
+  no cache;
+- `invalidar()` incrementa uma versão no cache do Django; cada processo relê a
+  versão no máximo a cada INTERVALO_VERSAO s e descarta tudo. Use depois de
+  alterar a configuração de banco de uma licença.
+
+Na primeira vez que um alias é resolvido no processo, `opcoes_conexao` liga
+conexões persistentes nele (CONN_MAX_AGE = OS_CONN_MAX_AGE, padrão 300, com
+health check), para cada requisição não abrir uma conexão nova. Pool de
+conexões fica de fora: trocar o alias para o pool do Django depois que ele já
+tem conexões abertas não é seguro.
+
+`metricas()` devolve tempos de resolução (acertos/faltas) e a configuração de
+conexão de cada alias resolvido. Sai junto de `GET .../metricas/`.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+CHAVE_VERSAO = "core:resolucao:versao"
+INTERVALO_VERSAO = 5
+
+_lock = threading.Lock()
+_ncm = {}
+_resolvidos = set()
+_versao = {"valor": None, "expira": 0.0}
+_estatisticas = {}
+
+
+def _ttl():
+    return float(getattr(settings, 'OS_RESOLUCAO_TTL', 300))
+
+
+def _registrar(tipo, acerto, ms):
+    with _lock:
+        item = _estatisticas.setdefault(tipo, {"acertos": 0, "faltas": 0, "faltas_ms": 0.0, "faltas_ms_max": 0.0})
+        if acerto:
+            item["acertos"] += 1
+        else:
+            item["faltas"] += 1
+            item["faltas_ms"] += ms
+            item["faltas_ms_max"] = max(item["faltas_ms_max"], ms)
+
+
+def _versao_cache():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, 1, None)
+        versao = cache.get(CHAVE_VERSAO) or 1
+    return versao
+
+
+def _versao_atual():
+    agora = time.monotonic()
+    if agora >= _versao["expira"]:
+        _versao.update(valor=_versao_cache(), expira=agora + INTERVALO_VERSAO)
+    return _versao["valor"]
+
+
+def _ler(memoria, chave):
+    versao = _versao_atual()
+    with _lock:
+        entrada = memoria.get(chave)
+    if entrada and entrada[1] > time.monotonic() and entrada[2] == versao:
+        return entrada[0]
+    return None
+
+
+def _gravar(memoria, chave, valor):
+    with _lock:
+        memoria[chave] = (valor, time.monotonic() + _ttl(), _versao_atual())
+
+
+def invalidar():
+    """Descarta as resoluções em todos os processos (via versão no cache)."""
+    cache.add(CHAVE_VERSAO, 1, None)
+    try:
+        versao = cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        # Chave expulsa do cache entre o add e o incr
+        versao = 2
+        cache.set(CHAVE_VERSAO, versao, None)
+    logger.info(f"[RESOLUCAO] cache de bancos invalidado (versão {versao})")
+    with _lock:
+        _ncm.clear()
+    _versao["expira"] = 0.0
+
+
+def opcoes_conexao(config):
+    """
+    Cópia da configuração do alias com conexões persistentes: CONN_MAX_AGE =
+    OS_CONN_MAX_AGE (padrão: 300) e health check. Um CONN_MAX_AGE não nulo já
+    definido no alias prevalece.
+    """
+    config = dict(config)
+    if not config.get('CONN_MAX_AGE'):
+        config['CONN_MAX_AGE'] = int(getattr(settings, 'OS_CONN_MAX_AGE', 300))
+        config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def _marcar_resolvido(alias):
+    """
+    Na primeira resolução do alias no processo, aplica `opcoes_conexao` a ele.
+    O 'default' segue a configuração do projeto.
+    """
+    if not alias or alias in _resolvidos or alias not in connections.databases:
+        return
+    with _lock:
+        if alias in _resolvidos:
+            return
+        if alias != DEFAULT_DB_ALIAS:
+            # Mesmo dicionário usado pelas conexões do alias (em todas as threads):
+            # CONN_MAX_AGE e o health check valem a partir da próxima conexão aberta
+            config = connections.databases[alias]
+            config.update(opcoes_conexao(config))
+        _resolvidos.add(alias)
+
+
+def _anotar_tempo(alvo, nome, ms):
+    if not hasattr(alvo, '_os_tempos_resolucao'):
+        alvo._os_tempos_resolucao = {}
+    alvo._os_tempos_resolucao[nome] = ms
+
+
+def banco_da_requisicao(request, resolver):
+    """`resolver(request)` (get_licenca_db_config) memoizado na requisição."""
+    alvo = getattr(request, '_request', request)
+    banco = getattr(alvo, '_os_banco', None)
+    if banco:
+        _registrar("licenca", True, 0.0)
+        return banco
+
+    inicio = time.perf_counter()
+    banco = resolver(request)
+    ms = (time.perf_counter() - inicio) * 1000
+    _registrar("licenca", False, ms)
+    _anotar_tempo(alvo, "licenca", ms)
+    _marcar_resolvido(banco)
+    alvo._os_banco = banco
+    return banco
+
+
+def banco_ncm(banco, resolver):
+    """`resolver(banco)` (get_ncm_master_db) memoizado por processo."""
+    ncm = _ler(_ncm, banco)
+    if ncm and ncm in connections.databases:
+        _registrar("ncm", True, 0.0)
+        return ncm
+    inicio = time.perf_counter()
+    ncm = resolver(banco)
+    _registrar("ncm", False, (time.perf_counter() - inicio) * 1000)
+    if ncm:
+        _gravar(_ncm, banco, ncm)
+        _marcar_resolvido(ncm)
+    return ncm
+
+
+def tempos_da_requisicao(request):
+    """Tempos das resoluções que foram ao banco de licenças nesta requisição (para o Server-Timing)."""
+    alvo = getattr(request, '_request', request)
+    return getattr(alvo, '_os_tempos_resolucao', None) or {}
+
+
+def _estado_conexao(alias):
+    config = connections.databases[alias]
+    return {
+        "alias": alias,
+        "conn_max_age": config.get('CONN_MAX_AGE'),
+        "health_checks": bool(config.get('CONN_HEALTH_CHECKS')),
+    }
+
+
+def metricas():
+    with _lock:
+        estatisticas = {tipo: dict(v) for tipo, v in _estatisticas.items()}
+        aliases = sorted(_resolvidos)
+        em_cache = {"ncm": len(_ncm)}
+    resolucao = {}
+    for tipo, v in estatisticas.items():
+        total = v["acertos"] + v["faltas"]
+        resolucao[tipo] = {
+            "acertos": v["acertos"],
+            "faltas": v["faltas"],
+            "taxa_acerto": round(v["acertos"] / total, 3) if total else None,
+            "faltas_ms_media": round(v["faltas_ms"] / v["faltas"], 1) if v["faltas"] else None,
+            "faltas_ms_max": round(v["faltas_ms_max"], 1),
+            "em_cache": em_cache.get(tipo, 0),
+        }
+    conexoes = [_estado_conexao(alias) for alias in aliases if alias in connections.databases]
+    return {"resolucao": resolucao, "conexoes": conexoes}
+
+
+def limpar_metricas():
+    with _lock:
+        _estatisticas.clear()
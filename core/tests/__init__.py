@@ -0,0 +1 @@
+"""Testes dos módulos de core/. Rodam no projeto backend: `python manage.py test core.tests`."""
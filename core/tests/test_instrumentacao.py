@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.db import connections
+from django.test import SimpleTestCase
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from core import instrumentacao
+
+ALIAS = "licenca_instrumentacao"
+
+
+class _View(instrumentacao.InstrumentacaoMixin, APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get_banco(self):
+        # Como o core.utils: o alias da licença só passa a existir na resolução
+        if ALIAS not in connections.databases:
+            connections.databases[ALIAS] = dict(connections.databases["default"], NAME=":memory:")
+        return ALIAS
+
+    def get(self, request):
+        with connections[self.get_banco()].cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return Response({"ok": True})
+
+
+class InstrumentacaoMixinTests(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        instrumentacao.limpar()
+        self.addCleanup(instrumentacao.limpar)
+        self.addCleanup(self._remover_alias)
+
+    def _remover_alias(self):
+        if ALIAS in connections.databases:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.databases[ALIAS]
+
+    def _get(self):
+        return _View.as_view()(APIRequestFactory().get("/api/cliente/teste/"))
+
+    def test_mede_consultas_no_alias_resolvido_durante_a_requisicao(self):
+        self.assertNotIn(ALIAS, connections.databases)
+        with mock.patch.object(instrumentacao, "ativa", return_value=True):
+            response = self._get()
+        self.assertIn('desc="1 consultas"', response["Server-Timing"])
+        (item,) = instrumentacao.resumo()
+        self.assertEqual((item["viewset"], item["banco"], item["consultas_media"]), ("_View", ALIAS, 1.0))
+
+    def test_wrappers_saem_das_conexoes_ao_fim_da_requisicao(self):
+        with mock.patch.object(instrumentacao, "ativa", return_value=True):
+            self._get()
+        self.assertEqual(connections[ALIAS].execute_wrappers, [])
+        self.assertEqual(connections["default"].execute_wrappers, [])
+
+    def test_desligada_nao_mede(self):
+        with mock.patch.object(instrumentacao, "ativa", return_value=False):
+            response = self._get()
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(instrumentacao.resumo(), [])
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+
+from core import replicas
+
+# Só o alias 'default' existe nos testes: ele faz papel de réplica de 'primario'
+REPLICAS = {"primario": "default"}
+
+
+def _request(metodo="GET", usuario=1):
+    return SimpleNamespace(method=metodo, user=SimpleNamespace(pk=usuario))
+
+
+@override_settings(OS_REPLICAS=REPLICAS, OS_REPLICA_ATRASO_MAX=5)
+class AliasLeituraTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        replicas.invalidar_cache()
+        self.addCleanup(replicas.invalidar_cache)
+        patcher = mock.patch.object(replicas, "_atraso_replicacao", return_value=0.0)
+        self.atraso = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_leitura_vai_para_a_replica(self):
+        self.assertEqual(replicas.alias_leitura(_request(), "primario"), "default")
+
+    def test_escrita_fica_no_primario(self):
+        self.assertEqual(replicas.alias_leitura(_request("POST"), "primario"), "primario")
+
+    def test_acoes_primario_ficam_no_primario(self):
+        alias = replicas.alias_leitura(_request(), "primario", "alteracoes", ("alteracoes",))
+        self.assertEqual(alias, "primario")
+
+    def test_sem_replica_configurada_usa_o_primario(self):
+        self.assertEqual(replicas.alias_leitura(_request(), "outro"), "outro")
+
+    def test_janela_apos_escrita_e_por_usuario(self):
+        replicas.marcar_escrita(_request("POST", usuario=1), "primario")
+        self.assertEqual(replicas.alias_leitura(_request(usuario=1), "primario"), "primario")
+        self.assertEqual(replicas.alias_leitura(_request(usuario=2), "primario"), "default")
+
+    def test_replica_atrasada_volta_ao_primario(self):
+        self.atraso.return_value = 30.0
+        self.assertEqual(replicas.alias_leitura(_request(), "primario"), "primario")
+
+    @override_settings(OS_REPLICAS=REPLICAS)
+    def test_atraso_maximo_tem_padrao_finito(self):
+        del settings.OS_REPLICA_ATRASO_MAX
+        self.atraso.return_value = 20.0
+        self.assertEqual(replicas.alias_leitura(_request(), "primario"), "default")
+        replicas.invalidar_cache()
+        self.atraso.return_value = 31.0
+        self.assertEqual(replicas.alias_leitura(_request(), "primario"), "primario")
+
+    def test_replica_indisponivel_volta_ao_primario_e_verificacao_e_cacheada(self):
+        self.atraso.side_effect = RuntimeError("conexão recusada")
+        self.assertEqual(replicas.alias_leitura(_request(), "primario"), "primario")
+        self.assertEqual(replicas.alias_leitura(_request(), "primario"), "primario")
+        self.assertEqual(self.atraso.call_count, 1)
+
+
+class _Base:
+    def finalize_response(self, request, response, *args, **kwargs):
+        return response
+
+
+class _ViewSet(replicas.LeituraReplicaMixin, _Base):
+    acoes_primario = ("exportar",)
+
+    def __init__(self, request, action=None):
+        self.request = request
+        self.action = action
+
+    def get_banco(self):
+        return "primario"
+
+
+@override_settings(OS_REPLICAS=REPLICAS)
+class LeituraReplicaMixinTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        replicas.invalidar_cache()
+        self.addCleanup(replicas.invalidar_cache)
+        patcher = mock.patch.object(replicas, "_atraso_replicacao", return_value=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_marca_o_banco_de_leitura_na_resposta(self):
+        request = _request()
+        view = _ViewSet(request, "list")
+        self.assertEqual(view.get_banco_leitura(), "default")
+        response = view.finalize_response(request, HttpResponse())
+        self.assertEqual(response["X-Banco-Leitura"], "replica")
+
+    def test_impressao_leitura_so_na_replica_e_com_a_posicao(self):
+        with mock.patch.object(replicas, "posicao_replica", return_value="0/16B3748") as posicao:
+            self.assertEqual(_ViewSet(_request(), "list").impressao_leitura(), ("default", "0/16B3748"))
+            self.assertIsNone(_ViewSet(_request(), "exportar").impressao_leitura())
+        posicao.assert_called_once_with("default")
+
+    def test_acao_listada_le_do_primario(self):
+        self.assertEqual(_ViewSet(_request(), "exportar").get_banco_leitura(), "primario")
+
+    def test_escrita_bem_sucedida_abre_a_janela(self):
+        escrita = _request("PATCH")
+        _ViewSet(escrita, "partial_update").finalize_response(escrita, HttpResponse(status=200))
+        self.assertEqual(_ViewSet(_request(), "list").get_banco_leitura(), "primario")
+
+    def test_escrita_com_erro_nao_abre_a_janela(self):
+        escrita = _request("PATCH")
+        _ViewSet(escrita, "partial_update").finalize_response(escrita, HttpResponse(status=400))
+        self.assertEqual(_ViewSet(_request(), "list").get_banco_leitura(), "default")
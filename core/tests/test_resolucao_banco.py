@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from core import resolucao_banco
+
+ALIAS = "licenca_resolucao"
+
+
+def _request(slug="cliente", usuario=1):
+    return SimpleNamespace(
+        path=f"/api/{slug}/os/ordens/",
+        resolver_match=None,
+        user=SimpleNamespace(pk=usuario),
+    )
+
+
+class ResolucaoBancoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        resolucao_banco.invalidar()
+        resolucao_banco.limpar_metricas()
+
+    def test_memoiza_na_requisicao(self):
+        resolver = mock.Mock(return_value="default")
+        request = _request()
+        self.assertEqual(resolucao_banco.banco_da_requisicao(request, resolver), "default")
+        self.assertEqual(resolucao_banco.banco_da_requisicao(request, resolver), "default")
+        resolver.assert_called_once_with(request)
+
+    def test_resolve_de_novo_a_cada_requisicao(self):
+        # A licença bloqueada ou vencida precisa ser conferida em toda requisição
+        resolver = mock.Mock(side_effect=["default", RuntimeError("licença bloqueada")])
+        resolucao_banco.banco_da_requisicao(_request(), resolver)
+        with self.assertRaises(RuntimeError):
+            resolucao_banco.banco_da_requisicao(_request(), resolver)
+        self.assertEqual(resolver.call_count, 2)
+
+    def test_banco_ncm_memoizado_por_banco(self):
+        resolver = mock.Mock(return_value="default")
+        self.assertEqual(resolucao_banco.banco_ncm("default", resolver), "default")
+        resolucao_banco.banco_ncm("default", resolver)
+        resolver.assert_called_once_with("default")
+
+    def test_invalidar_descarta_as_resolucoes(self):
+        resolver = mock.Mock(return_value="default")
+        resolucao_banco.banco_ncm("default", resolver)
+        resolucao_banco.invalidar()
+        resolucao_banco.banco_ncm("default", resolver)
+        self.assertEqual(resolver.call_count, 2)
+
+    def test_alias_fora_de_databases_resolve_de_novo(self):
+        resolver = mock.Mock(return_value="sumiu")
+        resolucao_banco.banco_ncm("default", resolver)
+        resolucao_banco.banco_ncm("default", resolver)
+        self.assertEqual(resolver.call_count, 2)
+
+    @override_settings(OS_CONN_MAX_AGE=120)
+    def test_opcoes_conexao_nao_altera_o_alias_original(self):
+        original = {"ENGINE": "django.db.backends.postgresql", "CONN_MAX_AGE": 0}
+        config = resolucao_banco.opcoes_conexao(original)
+        self.assertEqual(config["CONN_MAX_AGE"], 120)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+        self.assertEqual(original["CONN_MAX_AGE"], 0)
+
+    def test_conn_max_age_do_alias_prevalece(self):
+        config = resolucao_banco.opcoes_conexao({"CONN_MAX_AGE": 60})
+        self.assertEqual(config["CONN_MAX_AGE"], 60)
+
+
+@override_settings(OS_CONN_MAX_AGE=120)
+class OpcoesNoAliasResolvidoTests(SimpleTestCase):
+    """As opções de conexão entram no alias quando ele é visto pela primeira vez."""
+    databases = {"default"}
+
+    def setUp(self):
+        connections.databases[ALIAS] = dict(connections.databases["default"], NAME=":memory:", CONN_MAX_AGE=0)
+        self.addCleanup(self._remover_alias)
+        resolucao_banco.limpar_metricas()
+
+    def _remover_alias(self):
+        connections[ALIAS].close()
+        del connections[ALIAS]
+        del connections.databases[ALIAS]
+        resolucao_banco._resolvidos.discard(ALIAS)
+
+    def test_aplica_no_alias_da_licenca(self):
+        resolucao_banco.banco_da_requisicao(_request(), mock.Mock(return_value=ALIAS))
+        self.assertEqual(connections.databases[ALIAS]["CONN_MAX_AGE"], 120)
+        # A conexão do alias usa o mesmo dicionário
+        self.assertEqual(connections[ALIAS].settings_dict["CONN_MAX_AGE"], 120)
+        (conexao,) = resolucao_banco.metricas()["conexoes"]
+        self.assertEqual(conexao, {"alias": ALIAS, "conn_max_age": 120, "health_checks": True})
+
+    def test_default_segue_o_projeto(self):
+        antes = dict(connections.databases["default"])
+        resolucao_banco.banco_da_requisicao(_request(), mock.Mock(return_value="default"))
+        self.assertEqual(connections.databases["default"], antes)